@@ -0,0 +1,80 @@
+"""Local stand-ins for the upstream APIs the assistant calls during a benchmark.
+
+One FastAPI app serves:
+  - an OpenAI/Mistral-compatible /v1/chat/completions (plain and SSE streaming)
+    with configurable latency, token rate and error injection
+  - Twilio's Messages endpoint (WhatsApp replies)
+  - Discord's interaction follow-up webhook (PATCH @original)
+and records when each reply arrives so the harness can measure end-to-end
+delivery.
+"""
+import json
+import time
+import random
+import asyncio
+from urllib.parse import parse_qs
+from typing import Dict, List
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+class MockRecorder:
+    """Arrival times of outbound messages seen by the mock endpoints"""
+
+    def __init__(self):
+        self.twilio: Dict[str, List[float]] = {}
+        self.discord: Dict[str, List[float]] = {}  # token -> [first edit, last edit]
+        self.llm_requests = 0
+        self.llm_errors = 0
+
+def create_mock_app(recorder: MockRecorder, latency: float = 0.2, tokens_per_second: float = 50.0,
+                    reply_tokens: int = 40, error_rate: float = 0.0) -> FastAPI:
+    app = FastAPI()
+
+    def reply_words() -> List[str]:
+        return [f"word{i}" for i in range(reply_tokens)]
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        recorder.llm_requests += 1
+        if error_rate and random.random() < error_rate:
+            recorder.llm_errors += 1
+            return JSONResponse({"error": {"message": "injected failure"}}, status_code=500)
+        # One token per word, stopping at max_tokens like a real model
+        words = reply_words()[:body.get("max_tokens") or None]
+        prompt_tokens = sum(len(m.get("content", "")) // 4 for m in body.get("messages", []))
+
+        if body.get("stream"):
+            async def events():
+                await asyncio.sleep(latency)
+                for word in words:
+                    chunk = {"choices": [{"delta": {"content": word + " "}}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    if tokens_per_second:
+                        await asyncio.sleep(1 / tokens_per_second)
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(latency + (len(words) / tokens_per_second if tokens_per_second else 0))
+        return {
+            "choices": [{"message": {"role": "assistant", "content": " ".join(words)}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                      "total_tokens": prompt_tokens + len(words)}
+        }
+
+    @app.post("/2010-04-01/Accounts/{account_sid}/Messages.json")
+    async def twilio_messages(account_sid: str, request: Request):
+        # Parsed by hand so the mock doesn't need python-multipart
+        form = parse_qs((await request.body()).decode())
+        recorder.twilio.setdefault(form.get("To", [""])[0], []).append(time.perf_counter())
+        return JSONResponse({"sid": "SMbench", "status": "queued"}, status_code=201)
+
+    @app.patch("/api/v10/webhooks/{application_id}/{token}/messages/@original")
+    @app.post("/api/v10/webhooks/{application_id}/{token}")
+    async def discord_edit(application_id: str, token: str):
+        now = time.perf_counter()
+        times = recorder.discord.setdefault(token, [now, now])
+        times[1] = now
+        return {"id": "1"}
+
+    return app
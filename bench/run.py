@@ -0,0 +1,298 @@
+"""Benchmark the assistant end to end against local mock upstreams.
+
+    python -m bench.run --concurrency 50 --requests 500
+    python -m bench.run --scenarios chat_stream --latency 0.5 --compare bench/results/<old>.json
+
+The FastAPI app from main.py and the mock servers run in this process on
+real sockets. Results (RPS, latency percentiles, TTFT, event-loop lag) are
+printed and saved as JSON so runs can be compared across commits.
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import base64
+import hashlib
+import asyncio
+import logging
+import argparse
+import importlib
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+import httpx
+import uvicorn
+from bench.mock_servers import MockRecorder, create_mock_app
+
+SCENARIOS = ("chat", "chat_stream", "discord", "whatsapp")
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def summarize(values: List[float], prefix: str) -> dict:
+    """p50/p95/p99/max in milliseconds"""
+    summary = {}
+    for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0)):
+        value = percentile(values, fraction)
+        summary[f"{prefix}_{name}_ms"] = round(value * 1000, 2) if value is not None else None
+    return summary
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a sleeper (the lag every request also sees)"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def reset(self) -> List[float]:
+        samples, self.samples = self.samples, []
+        return samples
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+async def serve(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
+
+async def drive(concurrency: int, total: int, request: Callable[[int], Awaitable[dict]]) -> List[dict]:
+    """Run `total` requests with at most `concurrency` in flight"""
+    counter = iter(range(total))
+    results: List[dict] = []
+
+    async def worker():
+        for index in counter:
+            started = time.perf_counter()
+            try:
+                result = await request(index)
+            except Exception as e:
+                result = {"ok": False, "error": repr(e)}
+            result.setdefault("latency", time.perf_counter() - started)
+            result["started"] = started
+            results.append(result)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+def twilio_signature(auth_token: str, url: str, params: dict) -> str:
+    signed = url + "".join(key + params[key] for key in sorted(params))
+    return base64.b64encode(hmac.new(auth_token.encode(), signed.encode(), hashlib.sha1).digest()).decode()
+
+def configure_environment(args, mock_url: str, channel_url: str):
+    """Point every upstream at the mocks; must happen before main is imported"""
+    os.environ.update({
+        "AI_PROVIDERS": "mistral",
+        "MISTRAL_API_URL": f"{mock_url}/v1/chat/completions",
+        "MISTRAL_API_KEY": "bench",
+        "MISTRAL_REQUESTS_PER_SECOND": str(args.upstream_rps),
+        "MISTRAL_CONCURRENCY": str(args.upstream_concurrency),
+        "MISTRAL_MAX_CONCURRENCY": str(args.upstream_concurrency),
+        "LLM_CONCURRENCY": str(args.upstream_concurrency),
+        # Every benchmark request would otherwise count against a handful of identities
+        "QUOTA_TOKENS_PER_HOUR": "0",
+        "QUOTA_TOKENS_PER_DAY": "0",
+        "TWILIO_ACCOUNT_SID": "ACbench",
+        "TWILIO_AUTH_TOKEN": "bench",
+        "TWILIO_WHATSAPP_NUMBER": "whatsapp:+10000000000",
+        "TWILIO_API_URL": channel_url,
+        "DISCORD_API_URL": f"{channel_url}/api/v10",
+        "DISCORD_PUBLIC_KEY": "",
+        "DISCORD_SKIP_SIGNATURE": "true",
+        "REMINDER_DB_PATH": "",
+        "INBOUND_DB_PATH": os.path.join(tempfile.mkdtemp(prefix="bench-"), "inbound.db"),
+    })
+
+async def run(args) -> dict:
+    recorder = MockRecorder()
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    # Channels get their own port, as they are their own hosts in production. On one
+    # host:port, streams holding every per-host slot would block the Discord edits they feed
+    channel_url = f"http://127.0.0.1:{args.mock_port + 1}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    configure_environment(args, mock_url, channel_url)
+    main = importlib.import_module("main")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    mock_app = create_mock_app(recorder, args.latency, args.tokens_per_second, args.reply_tokens, args.error_rate)
+    mock_server = await serve(mock_app, args.mock_port)
+    channel_server = await serve(mock_app, args.mock_port + 1)
+    app_server = await serve(main.app, args.app_port)
+    whatsapp = main.registry.get("whatsapp")
+    monitor = LoopLagMonitor()
+    monitor.start()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    client = httpx.AsyncClient(base_url=app_url, timeout=120.0, limits=limits)
+    run_id = datetime.now().strftime("%H%M%S")
+
+    async def chat(index: int) -> dict:
+        response = await client.post("/chat", json={"message": f"benchmark question {run_id} {index}"})
+        return {"ok": response.status_code == 200 and "response" in response.json()}
+
+    async def chat_stream(index: int) -> dict:
+        started = time.perf_counter()
+        ttft, ok = None, False
+        async with client.stream("POST", "/chat/stream",
+                                 json={"message": f"benchmark stream {run_id} {index}"}) as response:
+            async for line in response.aiter_lines():
+                if ttft is None and line.startswith("data:") and '"token"' in line:
+                    ttft = time.perf_counter() - started
+                if line.startswith("event: done"):
+                    ok = True
+        return {"ok": ok, "ttft": ttft}
+
+    async def discord(index: int) -> dict:
+        token = f"bench-{run_id}-{index}"
+        response = await client.post("/discord/interactions", json={
+            "type": 2, "application_id": "1", "token": token, "channel_id": "1",
+            "member": {"user": {"id": str(index)}},
+            "data": {"name": "ask", "options": [{"name": "question", "value": f"benchmark discord {run_id} {index}"}]}
+        })
+        return {"ok": response.status_code == 200 and response.json().get("type") == 5, "token": token}
+
+    async def whatsapp_message(index: int) -> dict:
+        number = f"whatsapp:+1555{index:07d}"
+        params = {"From": number, "Body": f"benchmark whatsapp {run_id} {index}", "MessageSid": f"SM{run_id}{index}"}
+        # Signed like Twilio does, so the webhook's signature check is part of the measurement
+        signature = twilio_signature("bench", f"{app_url}/whatsapp/webhook", params)
+        response = await client.post("/whatsapp/webhook", data=params, headers={"X-Twilio-Signature": signature})
+        return {"ok": response.status_code == 200, "recipient": number}
+
+    drivers = {"chat": chat, "chat_stream": chat_stream, "discord": discord, "whatsapp": whatsapp_message}
+    report = {}
+    try:
+        for name in args.scenarios:
+            await asyncio.sleep(0.2)
+            monitor.reset()
+            llm_errors = recorder.llm_errors
+            started = time.perf_counter()
+            results = await drive(args.concurrency, args.requests, drivers[name])
+            elapsed = time.perf_counter() - started
+            summary = {
+                "requests": len(results),
+                "errors": sum(1 for r in results if not r["ok"]),
+                "upstream_errors_injected": recorder.llm_errors - llm_errors,
+                "rps": round(len(results) / elapsed, 2),
+                **summarize([r["latency"] for r in results], "latency"),
+            }
+            ttfts = [r["ttft"] for r in results if r.get("ttft") is not None]
+            # Discord and WhatsApp replies arrive after the webhook is ACKed; wait for them
+            if name == "discord":
+                ttfts, complete = await _wait_for(results, lambda r: recorder.discord.get(r["token"]), args.drain_timeout)
+                summary.update(summarize(complete, "reply"))
+            elif name == "whatsapp":
+                _, complete = await _wait_for(results, lambda r: recorder.twilio.get(r["recipient"]), args.drain_timeout)
+                summary.update(summarize(complete, "delivery"))
+            if ttfts:
+                summary.update(summarize(ttfts, "ttft"))
+            summary.update(summarize(monitor.reset(), "loop_lag"))
+            report[name] = summary
+            print(f"{name:12s} " + " ".join(f"{k}={v}" for k, v in summary.items()), flush=True)
+    finally:
+        await monitor.stop()
+        await client.aclose()
+        await whatsapp.outbox.stop()
+        app_server.should_exit = True
+        mock_server.should_exit = True
+        channel_server.should_exit = True
+        await asyncio.sleep(0.2)
+    return report
+
+async def _wait_for(results: List[dict], lookup, timeout: float):
+    """(time to first arrival, time to last arrival) per request, once all have arrived or timeout passes"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline and not all(lookup(r) for r in results):
+        await asyncio.sleep(0.05)
+    first, last = [], []
+    for result in results:
+        times = lookup(result)
+        if times:
+            first.append(times[0] - result["started"])
+            last.append(times[-1] - result["started"])
+    return first, last
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def compare(current: dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline_path} ({baseline.get('commit')})")
+    for scenario, summary in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(scenario)
+        if not old:
+            continue
+        for key in ("rps", "latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "ttft_p50_ms", "loop_lag_p99_ms"):
+            if summary.get(key) is None or old.get(key) in (None, 0):
+                continue
+            change = (summary[key] - old[key]) / old[key] * 100
+            print(f"  {scenario:12s} {key:18s} {old[key]:>10} -> {summary[key]:>10} ({change:+.1f}%)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=list(SCENARIOS),
+                        help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock LLM time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="mock LLM token rate")
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock LLM calls that fail")
+    parser.add_argument("--upstream-rps", type=float, default=10000, help="client-side limiter for the mock LLM")
+    parser.add_argument("--upstream-concurrency", type=int, default=256)
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="wait for async replies (s)")
+    parser.add_argument("--app-port", type=int, default=8765)
+    parser.add_argument("--mock-port", type=int, default=8766, help="LLM mock; channel mocks use the next port")
+    parser.add_argument("--output", help="results file (default bench/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    commit = git_commit()
+    scenarios = asyncio.run(run(args))
+    result = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "scenarios": scenarios
+    }
+    output = args.output or os.path.join(
+        "bench", "results", f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nSaved {output}")
+    if args.compare:
+        compare(result, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,92 @@
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from urllib.parse import parse_qsl
+import asyncio
+import hashlib
+import json
 import logging
 import os
-import httpx
+from services.http_client import http_clients
+from services.cache_service import response_cache
+from services.singleflight import single_flight
+from services.conversation_service import conversation_store
+from services.metrics import metrics
+from services.rate_limiter import RateLimitExceeded
+from services.service_registry import ServiceRegistry
 
-app = FastAPI()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Services are built on first use; a /chat cold start never imports the email,
+# calendar or channel stacks unless a request needs them
+registry = ServiceRegistry()
+registry.register("state", "services.shared_state:create_shared_state")
+registry.register("quota", "services.llm_scheduler:TokenQuota", "state")
+registry.register("scheduler", "services.llm_scheduler:FairScheduler")
+registry.register("ai", "services.ai_service:AIService", "quota", "scheduler")
+registry.register("reminders", "services.reminder_service:ReminderService")
+registry.register("email", "services.email_service:EmailService", lazy=True)
+registry.register("calendar", "services.calendar_service:CalendarService", lazy=True)
+registry.register("briefing", "services.briefing_service:BriefingService",
+                  "ai", "email", "calendar", "reminders", lazy=True)
+registry.register("router", "services.intent_router:IntentRouter", "email", "calendar", "reminders", "briefing")
+registry.register("discord_verifier", "services.discord_interactions:InteractionVerifier")
+registry.register("discord_interactions", "services.discord_interactions:InteractionHandler", "ai", "router")
+registry.register("whatsapp", "services.whatsapp_service:WhatsAppService",
+                  "ai", "email", "calendar", "reminders", "router")
+registry.register("imessage", "services.imessage_service:iMessageService",
+                  "ai", "email", "calendar", "reminders", "router")
+registry.register("discord", "services.discord_service:DiscordService",
+                  "ai", "email", "calendar", "reminders", "router")
+registry.register("leader", "services.shared_state:LeaderElection", "state")
+registry.register("inbound", "services.inbound_queue:InboundQueue")
+registry.register("static", "services.static_assets:StaticAssets")
+
+CHANNELS = ("whatsapp", "imessage", "discord")
+
+def _load_channel(platform: str):
+    """Build a channel on first reminder for it, which registers its delivery"""
+    if platform in CHANNELS:
+        registry.get(platform)
+
+async def _process_inbound(channel: str, payload: dict):
+    await registry.get(channel).process_message(payload)
+
+async def _lead():
+    """Singleton duties; with several workers only the elected one runs them"""
+    await registry.get("reminders").start_dispatch()
+    if os.getenv("DISCORD_GATEWAY", "false").lower() == "true":
+        registry.get("discord").start_gateway()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_clients.startup()
+    reminders = registry.get("reminders")
+    reminders.on_missing_delivery = _load_channel
+    await reminders.start(dispatch=False, shared=registry.get("state").shared)
+    leader = registry.get("leader")
+    leader.on_elected(_lead)
+    await leader.start()
+    # Webhooks only persist messages; these workers answer them
+    await registry.get("inbound").start(_process_inbound)
+    # Channels that must be up before their first webhook, e.g. to deliver reminders
+    for name in filter(None, (n.strip() for n in os.getenv("EAGER_SERVICES", "").split(","))):
+        registry.get(name)
+    registry.check_budget()
+    yield
+    await registry.shutdown()
+    await asyncio.to_thread(conversation_store.flush)
+    await http_clients.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -18,296 +96,178 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mistral AI configuration
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY", "")
-MISTRAL_API_URL = "https://api.mistral.ai/v1/chat/completions"
+def _static(request: Request, path: str) -> Response:
+    status, headers, body = registry.get("static").lookup(
+        path, request.headers.get("accept-encoding", ""), request.headers.get("if-none-match", "")
+    )
+    return Response(body, status_code=status, headers=headers)
 
-HTML_CONTENT = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>AI Assistant</title>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            height: 100vh;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            padding: 20px;
-        }
-        .container {
-            background: white;
-            border-radius: 20px;
-            box-shadow: 0 20px 60px rgba(0,0,0,0.3);
-            width: 100%;
-            max-width: 800px;
-            height: 90vh;
-            max-height: 700px;
-            display: flex;
-            flex-direction: column;
-            overflow: hidden;
-        }
-        .header {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 25px;
-            text-align: center;
-            font-size: 24px;
-            font-weight: 600;
-            border-bottom: 3px solid rgba(255,255,255,0.2);
-        }
-        .chat-container {
-            flex: 1;
-            overflow-y: auto;
-            padding: 20px;
-            background: #f8f9fa;
-        }
-        .message {
-            margin-bottom: 15px;
-            display: flex;
-            animation: slideIn 0.3s ease;
-        }
-        @keyframes slideIn {
-            from { opacity: 0; transform: translateY(10px); }
-            to { opacity: 1; transform: translateY(0); }
-        }
-        .message.user {
-            justify-content: flex-end;
-        }
-        .message-content {
-            max-width: 70%;
-            padding: 12px 18px;
-            border-radius: 18px;
-            word-wrap: break-word;
-        }
-        .message.user .message-content {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border-bottom-right-radius: 4px;
-        }
-        .message.assistant .message-content {
-            background: white;
-            color: #333;
-            border: 1px solid #e0e0e0;
-            border-bottom-left-radius: 4px;
-        }
-        .input-container {
-            padding: 20px;
-            background: white;
-            border-top: 1px solid #e0e0e0;
-            display: flex;
-            gap: 10px;
-        }
-        #messageInput {
-            flex: 1;
-            padding: 12px 18px;
-            border: 2px solid #e0e0e0;
-            border-radius: 25px;
-            font-size: 16px;
-            outline: none;
-            transition: border-color 0.3s;
-        }
-        #messageInput:focus {
-            border-color: #667eea;
-        }
-        #sendButton {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border: none;
-            padding: 12px 30px;
-            border-radius: 25px;
-            font-size: 16px;
-            font-weight: 600;
-            cursor: pointer;
-            transition: transform 0.2s, box-shadow 0.2s;
-        }
-        #sendButton:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 5px 15px rgba(102, 126, 234, 0.4);
-        }
-        #sendButton:active {
-            transform: translateY(0);
-        }
-        #sendButton:disabled {
-            opacity: 0.5;
-            cursor: not-allowed;
-            transform: none;
-        }
-        .typing-indicator {
-            display: none;
-            padding: 12px 18px;
-            background: white;
-            border: 1px solid #e0e0e0;
-            border-radius: 18px;
-            border-bottom-left-radius: 4px;
-            max-width: 70px;
-        }
-        .typing-indicator.active {
-            display: inline-block;
-        }
-        .typing-indicator span {
-            height: 8px;
-            width: 8px;
-            background: #999;
-            border-radius: 50%;
-            display: inline-block;
-            margin-right: 5px;
-            animation: typing 1.4s infinite;
-        }
-        .typing-indicator span:nth-child(2) { animation-delay: 0.2s; }
-        .typing-indicator span:nth-child(3) { animation-delay: 0.4s; }
-        @keyframes typing {
-            0%, 60%, 100% { transform: translateY(0); opacity: 0.5; }
-            30% { transform: translateY(-10px); opacity: 1; }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">💬 AI Assistant (Powered by Mistral AI)</div>
-        <div class="chat-container" id="chatContainer">
-            <div class="message assistant">
-                <div class="message-content">Hello! I'm your AI assistant powered by Mistral AI. How can I help you today?</div>
-            </div>
-        </div>
-        <div class="input-container">
-            <input type="text" id="messageInput" placeholder="Type your message..." />
-            <button id="sendButton">Send</button>
-        </div>
-    </div>
-    <script>
-        const chatContainer = document.getElementById('chatContainer');
-        const messageInput = document.getElementById('messageInput');
-        const sendButton = document.getElementById('sendButton');
-        
-        function addMessage(content, isUser) {
-            const messageDiv = document.createElement('div');
-            messageDiv.className = `message ${isUser ? 'user' : 'assistant'}`;
-            messageDiv.innerHTML = `<div class="message-content">${content}</div>`;
-            chatContainer.appendChild(messageDiv);
-            chatContainer.scrollTop = chatContainer.scrollHeight;
-        }
-        
-        function showTyping() {
-            const typingDiv = document.createElement('div');
-            typingDiv.className = 'message assistant';
-            typingDiv.innerHTML = '<div class="typing-indicator active"><span></span><span></span><span></span></div>';
-            typingDiv.id = 'typingIndicator';
-            chatContainer.appendChild(typingDiv);
-            chatContainer.scrollTop = chatContainer.scrollHeight;
-        }
-        
-        function hideTyping() {
-            const typingDiv = document.getElementById('typingIndicator');
-            if (typingDiv) typingDiv.remove();
-        }
-        
-        async function sendMessage() {
-            const message = messageInput.value.trim();
-            if (!message) return;
-            
-            addMessage(message, true);
-            messageInput.value = '';
-            sendButton.disabled = true;
-            showTyping();
-            
-            try {
-                const response = await fetch('/chat', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ message: message })
-                });
-                
-                const data = await response.json();
-                hideTyping();
-                
-                if (data.response) {
-                    addMessage(data.response, false);
-                } else if (data.error) {
-                    addMessage('Sorry, I encountered an error: ' + data.error, false);
-                }
-            } catch (error) {
-                hideTyping();
-                addMessage('Sorry, I could not connect to the server.', false);
-            } finally {
-                sendButton.disabled = false;
-                messageInput.focus();
-            }
-        }
+@app.get("/", response_class=HTMLResponse)
+async def home(request: Request):
+    return _static(request, "/")
+
+@app.get("/static/{name}")
+async def static_file(request: Request, name: str):
+    return _static(request, f"/static/{name}")
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def _stream_reply(message: str, conversation_id: Optional[str], user_id: str,
+                        traceparent: Optional[str] = None) -> AsyncIterator[str]:
+    """Relay response tokens as Server-Sent Events"""
+    with metrics.request("web_stream", traceparent):
+        routed = await registry.get("router").handle(message, "web")
+        if routed is not None:
+            yield _sse({"token": routed})
+            yield _sse({"done": True}, event="done")
+            return
         
-        sendButton.addEventListener('click', sendMessage);
-        messageInput.addEventListener('keypress', (e) => {
-            if (e.key === 'Enter') sendMessage();
-        });
-        messageInput.focus();
-    </script>
-</body>
-</html>
-"""
+        try:
+            async for chunk in registry.get("ai").stream(message, conversation_id=conversation_id, user_id=user_id,
+                                                         channel="web"):
+                yield _sse({"token": chunk})
+            yield _sse({"done": True}, event="done")
+        except Exception as e:
+            metrics.error("web_stream")
+            logger.error(f"Chat stream error: {e}")
+            yield _sse({"error": str(e)}, event="error")
 
-@app.get("/", response_class=HTMLResponse)
-async def home():
-    return HTML_CONTENT
+def _web_conversation_id(data: dict) -> Optional[str]:
+    session_id = str(data.get("session_id") or "")[:64]
+    return f"web:{session_id}" if session_id else None
+
+def _web_user_id(request: Request, conversation_id: Optional[str]) -> str:
+    return conversation_id or f"web-ip:{request.client.host if request.client else 'unknown'}"
 
 @app.post("/chat")
 async def chat(request: Request):
+    with metrics.request("web", request.headers.get("traceparent")):
+        try:
+            with metrics.stage("parse", "web"):
+                data = await request.json()
+                message = data.get("message", "")
+            
+            if not message:
+                return JSONResponse({"error": "No message provided"})
+            
+            if not registry.get("ai").is_available():
+                return JSONResponse({"error": "No AI provider configured"})
+            
+            # Reminders, emails and calendar are answered without the LLM
+            routed = await registry.get("router").handle(message, "web")
+            if routed is not None:
+                return JSONResponse({"response": routed})
+            
+            conversation_id = _web_conversation_id(data)
+            response = await registry.get("ai").generate(
+                message, conversation_id=conversation_id, user_id=_web_user_id(request, conversation_id),
+                channel="web"
+            )
+            return JSONResponse({"response": response})
+            
+        except RateLimitExceeded as e:
+            retry_after = getattr(e, "retry_after", None) or 5
+            return JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": str(int(retry_after))})
+        except Exception as e:
+            metrics.error("web")
+            logger.error(f"Chat error: {e}")
+            return JSONResponse({"error": str(e)})
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
     try:
         data = await request.json()
         message = data.get("message", "")
-        
-        if not message:
-            return JSONResponse({"error": "No message provided"})
-        
-        if not MISTRAL_API_KEY:
-            return JSONResponse({"error": "Mistral API key not configured"})
-        
-        # Call Mistral AI API
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                MISTRAL_API_URL,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {MISTRAL_API_KEY}"
-                },
-                json={
-                    "model": "mistral-tiny",
-                    "messages": [
-                        {"role": "system", "content": "You are a helpful AI assistant."},
-                        {"role": "user", "content": message}
-                    ],
-                    "max_tokens": 500,
-                    "temperature": 0.7
-                },
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                assistant_message = result["choices"][0]["message"]["content"]
-                return JSONResponse({"response": assistant_message})
-            else:
-                error_msg = f"Mistral API error: {response.status_code}"
-                logger.error(f"{error_msg} - {response.text}")
-                return JSONResponse({"error": error_msg})
-        
+        conversation_id = _web_conversation_id(data)
     except Exception as e:
-        logger.error(f"Chat error: {e}")
+        logger.error(f"Chat stream error: {e}")
         return JSONResponse({"error": str(e)})
+    
+    if not message:
+        return JSONResponse({"error": "No message provided"})
+    
+    if not registry.get("ai").is_available():
+        return JSONResponse({"error": "No AI provider configured"})
+    
+    return StreamingResponse(
+        _stream_reply(message, conversation_id, _web_user_id(request, conversation_id),
+                      request.headers.get("traceparent")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/briefing")
+async def briefing(session_id: Optional[str] = None):
+    """Daily digest with per-source status and timings"""
+    return await registry.get("briefing").build("web", f"web:{session_id}" if session_id else None)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+async def traces():
+    """Most recent sampled request traces (see TRACE_SAMPLE_RATE)"""
+    return list(metrics.traces)
+
+@app.get("/stats")
+async def stats():
+    return {
+        "http": http_clients.stats(),
+        "cache": response_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "conversations": conversation_store.stats(),
+        "startup": registry.stats(),
+        # Only services that have been built; asking an unbuilt one would build it
+        **{name: service.stats() for name, service in registry.instances().items() if hasattr(service, "stats")}
+    }
 
 @app.post("/discord/interactions")
 async def discord_interactions(request: Request):
+    body = await request.body()
+    if not registry.get("discord_verifier").verify(
+        request.headers.get("X-Signature-Ed25519"), request.headers.get("X-Signature-Timestamp"), body
+    ):
+        return JSONResponse({"error": "invalid request signature"}, status_code=401)
     try:
-        data = await request.json()
-        # Handle Discord PING verification
-        if data.get("type") == 1:
-            return {"type": 1}  # PONG response
-        # Handle other interactions
-        return {"type": 4, "data": {"content": "Hello from AI Assistant! I'm now live on Vercel."}}
+        data = json.loads(body)
+        # Slash commands are deferred; the reply is edited in after the ACK is sent
+        response, follow_up = registry.get("discord_interactions").handle(data)
+        return JSONResponse(response, background=BackgroundTask(follow_up) if follow_up else None)
     except Exception as e:
         logger.error(f"Discord error: {e}")
-        return {"error": str(e)}
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+@app.post("/whatsapp/webhook")
+async def whatsapp_webhook(request: Request):
+    """Twilio webhook: verify, persist and ACK; the reply is sent once the inbound queue processes it"""
+    params = dict(parse_qsl((await request.body()).decode(), keep_blank_values=True))
+    whatsapp = registry.get("whatsapp")
+    # Twilio signs the URL it was configured with, which a proxy may rewrite
+    url = os.getenv("TWILIO_WEBHOOK_URL") or str(request.url)
+    if not whatsapp.verify_signature(url, params, request.headers.get("X-Twilio-Signature")):
+        return PlainTextResponse("invalid signature", status_code=403)
+    message_id = params.get("MessageSid") or hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    await registry.get("inbound").put("whatsapp", message_id, params.get("From", ""), params)
+    # Empty TwiML: nothing to send synchronously
+    return Response("<Response/>", media_type="application/xml")
+
+@app.post("/imessage/webhook")
+async def imessage_webhook(request: Request):
+    """Messages forwarded by the Mac bridge: verify, persist and ACK"""
+    body = await request.body()
+    if not registry.get("imessage").verify_signature(body, request.headers.get("X-Bridge-Signature")):
+        return JSONResponse({"error": "invalid signature"}, status_code=403)
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return JSONResponse({"error": "invalid JSON"}, status_code=400)
+    message_id = str(data.get("id") or hashlib.sha256(
+        f"{data.get('from')}|{data.get('date')}|{data.get('body')}".encode()
+    ).hexdigest())
+    accepted = await registry.get("inbound").put("imessage", message_id, data.get("from", ""), data)
+    return JSONResponse({"status": "queued" if accepted else "duplicate"})
+
+registry.record("import", time.perf_counter() - _import_started)
@@ -1,58 +1,139 @@
 import os
-import httpx
-import json
-from typing import Optional
+from typing import AsyncIterator, List, Optional
+from services.cache_service import response_cache
+from services.singleflight import single_flight
+from services.conversation_service import conversation_store
+from services.llm_providers import ProviderRouter, build_providers
+from services.metrics import metrics
+from services.rate_limiter import RateLimitExceeded
+from services.token_budget import count_message_tokens, count_tokens, token_budget
+from services.llm_scheduler import FairScheduler, TokenQuota
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant."
 
 class AIService:
-    """Handles AI responses using ChatGPT web (via Mac bridge) or API"""
-    
-    def __init__(self):
-        self.mode = os.getenv("AI_MODE", "bridge")  # 'bridge' or 'api'
-        self.mac_bridge_url = os.getenv("MAC_BRIDGE_URL")
-        self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        
-    async def ask(self, question: str, context: Optional[str] = None) -> str:
-        """Get AI response to a question"""
+    """Handles AI responses through the configured LLM providers (Mistral, OpenAI, Mac bridge)"""
+
+    def __init__(self, quota: Optional[TokenQuota] = None, scheduler: Optional[FairScheduler] = None,
+                 router: Optional[ProviderRouter] = None):
+        self.mode = os.getenv("AI_MODE", "bridge")  # 'bridge' or 'api'; sets the default provider order
+        self.router = router or ProviderRouter(build_providers())
+        self.system_prompt = os.getenv("AI_SYSTEM_PROMPT", DEFAULT_SYSTEM_PROMPT)
+        self.budget = token_budget
+        self.quota = quota or TokenQuota()
+        self.scheduler = scheduler or FairScheduler()
+        self.temperature = float(os.getenv("AI_TEMPERATURE", "0.7"))
+        self.cache = response_cache
+        self.single_flight = single_flight
+        self.conversations = conversation_store
+
+    async def ask(self, question: str, context: Optional[str] = None,
+                  conversation_id: Optional[str] = None, user_id: Optional[str] = None,
+                  channel: Optional[str] = None, priority: str = "interactive") -> str:
+        """Get AI response to a question, optionally continuing a conversation.
+
+        channel sizes the reply for where it will be shown (see TokenBudget).
+        Calls are charged to user_id (else conversation_id) and scheduled by
+        priority, "interactive" or "background" (see FairScheduler).
+        """
         try:
-            if self.mode == "bridge":
-                return await self._ask_via_mac_bridge(question, context)
-            else:
-                return await self._ask_via_openai(question, context)
+            return await self.generate(question, context, conversation_id, user_id, channel, priority)
+        except RateLimitExceeded as e:
+            # Quota and load-shedding messages are written for the user
+            return str(e)
         except Exception as e:
+            metrics.error("ai")
             return f"Error getting AI response: {str(e)}"
-    
-    async def _ask_via_mac_bridge(self, question: str, context: Optional[str] = None) -> str:
-        """Use Mac bridge to talk to ChatGPT web"""
-        if not self.mac_bridge_url:
-            return "Mac bridge URL not configured"
-        
-        payload = {
-            "message": question,
-            "context": context or ""
-        }
-        
+
+    async def generate(self, question: str, context: Optional[str] = None,
+                       conversation_id: Optional[str] = None, user_id: Optional[str] = None,
+                       channel: Optional[str] = None, priority: str = "interactive") -> str:
+        """Like ask(), but raises on failure instead of returning the error as text"""
+        messages = await self._build_messages(question, context, conversation_id, channel)
+        cache_args = self._cache_args(messages)
+        with metrics.stage("cache", "ai"):
+            cached = self.cache.get(*cache_args)
+        if cached is not None:
+            self._record_turns(conversation_id, question, cached)
+            return cached
+
+        identity = user_id or conversation_id or "anonymous"
+        await self.quota.check(identity)
+        prompt_tokens = count_message_tokens(messages)
+        max_tokens = self.budget.max_tokens_for(channel, messages, prompt_tokens)
+        # Identical prompts already in flight at the same priority share one upstream call;
+        # every caller is charged for it, so coalescing can't be used to get around a quota
+        response = await self.single_flight.do(
+            f"{self.cache.make_key(*cache_args)}:{priority}",
+            lambda: self._complete(messages, max_tokens, prompt_tokens, identity, priority)
+        )
+        await self.quota.charge(identity, prompt_tokens + count_tokens(response))
+        self.cache.set(*cache_args, response)
+        self._record_turns(conversation_id, question, response)
+        return response
+
+    async def stream(self, question: str, context: Optional[str] = None,
+                     conversation_id: Optional[str] = None, user_id: Optional[str] = None,
+                     channel: Optional[str] = None, priority: str = "interactive") -> AsyncIterator[str]:
+        """Yield the response as it is generated"""
+        messages = await self._build_messages(question, context, conversation_id, channel)
+        cache_args = self._cache_args(messages)
+        with metrics.stage("cache", "ai"):
+            cached = self.cache.get(*cache_args)
+        if cached is not None:
+            self._record_turns(conversation_id, question, cached)
+            yield cached
+            return
+
+        identity = user_id or conversation_id or "anonymous"
+        await self.quota.check(identity)
+        prompt_tokens = count_message_tokens(messages)
+        max_tokens = self.budget.max_tokens_for(channel, messages, prompt_tokens)
+        chunks = []
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.mac_bridge_url}/chat",
-                    json=payload,
-                    timeout=30.0
-                )
-                data = response.json()
-                return data.get("response", "No response received")
-        except Exception as e:
-            return f"Failed to connect to Mac bridge: {str(e)}"
-    
-    async def _ask_via_openai(self, question: str, context: Optional[str] = None) -> str:
-        """Use OpenAI API (requires API key)"""
-        if not self.openai_api_key:
-            return "OpenAI API key not configured"
-        
-        # Placeholder - implement based on your needs
-        return "OpenAI integration not yet implemented"
-    
+            async with self.scheduler.slot(identity, priority, prompt_tokens + max_tokens):
+                async for chunk in self.router.stream(messages, max_tokens, self.temperature, identity):
+                    chunks.append(chunk)
+                    yield chunk
+        finally:
+            # A client that hangs up mid-stream still pays for what was generated
+            if chunks:
+                await self.quota.charge(identity, prompt_tokens + count_tokens("".join(chunks)))
+        response = "".join(chunks)
+        self.cache.set(*cache_args, response)
+        self._record_turns(conversation_id, question, response)
+
+    async def _complete(self, messages: List[dict], max_tokens: int, prompt_tokens: int, identity: str,
+                        priority: str) -> str:
+        async with self.scheduler.slot(identity, priority, prompt_tokens + max_tokens):
+            return await self.router.complete(messages, max_tokens, self.temperature, identity)
+
+    async def _build_messages(self, question: str, context: Optional[str], conversation_id: Optional[str],
+                        channel: Optional[str] = None) -> List[dict]:
+        system_prompt = f"{self.system_prompt}\n\n{context}" if context else self.system_prompt
+        instruction = self.budget.for_channel(channel).instruction
+        if instruction:
+            system_prompt = f"{system_prompt}\n\n{instruction}"
+        if conversation_id:
+            await self.conversations.load(conversation_id)
+            return self.conversations.build_messages(conversation_id, system_prompt, question)
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": question}
+        ]
+
+    def _record_turns(self, conversation_id: Optional[str], question: str, response: str):
+        if conversation_id:
+            self.conversations.add_turn(conversation_id, "user", question)
+            self.conversations.add_turn(conversation_id, "assistant", response)
+
+    def _cache_args(self, messages: List[dict]) -> tuple:
+        # Any provider's answer is acceptable for a prompt, so entries aren't keyed by provider
+        return ("assistant", messages[0]["content"], messages[1:], self.temperature)
+
     def is_available(self) -> bool:
         """Check if AI service is properly configured"""
-        if self.mode == "bridge":
-            return bool(self.mac_bridge_url)
-        return bool(self.openai_api_key)
+        return bool(self.router.providers)
+
+    def stats(self) -> dict:
+        return {**self.router.stats(), "budget": self.budget.stats()}
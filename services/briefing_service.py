@@ -0,0 +1,103 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+from services.llm_scheduler import identity_for
+
+logger = logging.getLogger(__name__)
+
+class BriefingService:
+    """Daily digest built by querying email, calendar, reminders and the LLM concurrently.
+
+    Every source runs under its own timeout; one that is slow or failing is
+    reported as unavailable while the rest of the digest is still returned,
+    so the reply takes as long as the slowest source rather than the sum.
+    The LLM summary needs the other sources' results, so it starts as soon
+    as they have settled and is dropped if it misses its own deadline.
+    """
+
+    def __init__(self, ai_service, email_service, calendar_service, reminder_service):
+        self.ai_service = ai_service
+        self.email_service = email_service
+        self.calendar_service = calendar_service
+        self.reminder_service = reminder_service
+        self.source_timeout = float(os.getenv("BRIEFING_SOURCE_TIMEOUT", "2.0"))
+        self.summary_timeout = float(os.getenv("BRIEFING_SUMMARY_TIMEOUT", "8.0"))
+        self.summarize = os.getenv("BRIEFING_SUMMARY", "true").lower() == "true"
+        self.counters = {"briefings": 0, "timeouts": 0, "errors": 0}
+
+    async def build(self, platform: str, user_id: Optional[str] = None) -> dict:
+        """Gather every source; returns their items and how each one fared"""
+        self.counters["briefings"] += 1
+        end_of_day = datetime.now().replace(hour=23, minute=59, second=59).timestamp()
+        sources: Dict[str, Callable[[], Awaitable[List[str]]]] = {
+            "calendar": lambda: asyncio.to_thread(self.calendar_service.get_upcoming_events, 1, 10),
+            "email": lambda: asyncio.to_thread(self.email_service.get_recent_emails, 5),
+            "reminders": lambda: self._reminders(platform, user_id, end_of_day),
+        }
+        results = await asyncio.gather(*(self._run(name, fetch, self.source_timeout)
+                                         for name, fetch in sources.items()))
+        briefing = {"sections": dict(zip(sources, results)), "summary": None}
+
+        if self.summarize and self.ai_service.is_available():
+            summary = await self._run("summary", lambda: self._summary(briefing["sections"], platform, user_id),
+                                      self.summary_timeout)
+            briefing["summary"] = summary
+        return briefing
+
+    async def digest(self, platform: str, user_id: Optional[str] = None) -> str:
+        """The briefing as a single message for any channel"""
+        briefing = await self.build(platform, user_id)
+        titles = {"calendar": "📅 Next 24 hours", "email": "📧 Email", "reminders": "⏰ Reminders"}
+        lines = []
+        for name, section in briefing["sections"].items():
+            lines.append(titles[name])
+            if section["status"] != "ok":
+                lines.append("- (unavailable right now)")
+            elif not section["items"]:
+                lines.append("- nothing")
+            else:
+                lines.extend(f"- {item}" for item in section["items"])
+        summary = briefing["summary"]
+        if summary and summary["status"] == "ok":
+            lines.extend(["", summary["items"]])
+        return "\n".join(lines)
+
+    async def _run(self, name: str, fetch: Callable[[], Awaitable], timeout: float) -> dict:
+        started = time.perf_counter()
+        try:
+            items = await asyncio.wait_for(fetch(), timeout)
+            status = "ok"
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            logger.warning(f"Briefing source {name} timed out after {timeout}s")
+            items, status = None, "timeout"
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.error(f"Briefing source {name} failed: {e}")
+            items, status = None, "error"
+        return {"status": status, "items": items, "ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    async def _reminders(self, platform: str, user_id: Optional[str], until: float) -> List[str]:
+        return [
+            f"{datetime.fromtimestamp(reminder['due']):%H:%M} {reminder['message']}"
+            for reminder in self.reminder_service.pending_for(platform, user_id, until)
+        ]
+
+    async def _summary(self, sections: Dict[str, dict], platform: str, user_id: Optional[str]) -> str:
+        context = "\n".join(
+            f"{name}: " + ("; ".join(section["items"]) or "none")
+            for name, section in sections.items() if section["status"] == "ok"
+        )
+        return await self.ai_service.generate(
+            "Summarize my day in two short sentences, mentioning anything that needs attention.",
+            context=f"Today's data:\n{context}",
+            user_id=identity_for(platform, user_id) if user_id else None,
+            # Nobody is typing at a digest: the first work shed when the upstream is busy
+            priority="background"
+        )
+
+    def stats(self) -> dict:
+        return dict(self.counters)
@@ -0,0 +1,162 @@
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_WORD = re.compile(r"\w+")
+
+def _normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip().casefold()
+
+def _normalize_messages(messages: List[dict]) -> List[Tuple[str, str]]:
+    return [(m.get("role", "user"), _normalize_text(m.get("content", ""))) for m in messages]
+
+def _hash(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, separators=(",", ":")).encode()).hexdigest()
+
+class HashingEmbedder:
+    """Local bag-of-words embedding (feature hashing of unigrams and bigrams)"""
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def __call__(self, text: str) -> List[float]:
+        words = _WORD.findall(_normalize_text(text))
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        vector = [0.0] * self.dimensions
+        for feature in features:
+            digest = hashlib.md5(feature.encode()).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector))
+        return [v / norm for v in vector] if norm else vector
+
+class VectorIndex:
+    """In-memory cosine-similarity index over unit vectors, grouped by scope"""
+
+    def __init__(self):
+        self._scopes: Dict[str, Dict[str, List[float]]] = {}
+        self._key_scope: Dict[str, str] = {}
+
+    def add(self, scope: str, key: str, vector: List[float]):
+        self._scopes.setdefault(scope, {})[key] = vector
+        self._key_scope[key] = scope
+
+    def remove(self, key: str):
+        scope = self._key_scope.pop(key, None)
+        if scope is not None:
+            vectors = self._scopes[scope]
+            vectors.pop(key, None)
+            if not vectors:
+                del self._scopes[scope]
+
+    def nearest(self, scope: str, vector: List[float]) -> Tuple[Optional[str], float]:
+        best_key, best_score = None, -1.0
+        for key, candidate in self._scopes.get(scope, {}).items():
+            score = sum(a * b for a, b in zip(vector, candidate))
+            if score > best_score:
+                best_key, best_score = key, score
+        return best_key, best_score
+
+    def __len__(self) -> int:
+        return len(self._key_scope)
+
+class ResponseCache:
+    """LLM response cache: exact-hash LRU/TTL tier plus optional similarity tier"""
+
+    def __init__(self, embedder: Optional[Callable[[str], List[float]]] = None):
+        self.max_entries = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+        self.ttl = float(os.getenv("CACHE_TTL_SECONDS", "3600"))
+        self.cache_nondeterministic = os.getenv("CACHE_NONDETERMINISTIC", "false").lower() == "true"
+        self.semantic = os.getenv("CACHE_SEMANTIC", "false").lower() == "true"
+        self.semantic_threshold = float(os.getenv("CACHE_SEMANTIC_THRESHOLD", "0.92"))
+        self.embedder = embedder or HashingEmbedder()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._index = VectorIndex()
+        self.counters = {"hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def is_cacheable(self, temperature: Optional[float]) -> bool:
+        """Deterministic requests are always cacheable; others only when enabled"""
+        return temperature == 0 or self.cache_nondeterministic
+
+    def make_key(self, model: str, system: str, messages: List[dict], temperature: Optional[float]) -> str:
+        return _hash(model, _normalize_text(system), _normalize_messages(messages), temperature)
+
+    def _scope(self, model: str, system: str, messages: List[dict], temperature: Optional[float]) -> str:
+        # Similarity only applies to the final message; everything before it must match exactly
+        return _hash(model, _normalize_text(system), _normalize_messages(messages[:-1]), temperature)
+
+    def get(self, model: str, system: str, messages: List[dict], temperature: Optional[float]) -> Optional[str]:
+        """Look up a cached response, or None on a miss"""
+        if not self.is_cacheable(temperature):
+            return None
+
+        key = self.make_key(model, system, messages, temperature)
+        response = self._lookup(key)
+        if response is not None:
+            self.counters["hits"] += 1
+            return response
+
+        if self.semantic and messages:
+            scope = self._scope(model, system, messages, temperature)
+            match, score = self._index.nearest(scope, self.embedder(messages[-1].get("content", "")))
+            if match is not None and score >= self.semantic_threshold:
+                response = self._lookup(match)
+                if response is not None:
+                    self.counters["semantic_hits"] += 1
+                    return response
+
+        self.counters["misses"] += 1
+        return None
+
+    def set(self, model: str, system: str, messages: List[dict], temperature: Optional[float], response: str):
+        """Store a response if the request is cacheable"""
+        if not self.is_cacheable(temperature) or not response:
+            return
+
+        key = self.make_key(model, system, messages, temperature)
+        self._entries[key] = (time.monotonic() + self.ttl, response)
+        self._entries.move_to_end(key)
+        if self.semantic and messages:
+            scope = self._scope(model, system, messages, temperature)
+            self._index.add(scope, key, self.embedder(messages[-1].get("content", "")))
+
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._index.remove(evicted)
+            self.counters["evictions"] += 1
+
+    def _lookup(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self._index.remove(key)
+            self.counters["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def clear(self):
+        self._entries.clear()
+        self._index = VectorIndex()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "vectors": len(self._index),
+            "max_entries": self.max_entries
+        }
+
+response_cache = ResponseCache()
@@ -0,0 +1,356 @@
+import re
+import bisect
+import logging
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DURATION = re.compile(r"([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?")
+_WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+
+Occurrence = Tuple[datetime, datetime, "Event"]
+
+class Event:
+    """A VEVENT; times are naive local datetimes"""
+    __slots__ = ("uid", "summary", "start", "end", "all_day", "transparent", "rrule", "exdates")
+
+    def __init__(self, uid: str, summary: str, start: datetime, end: datetime, all_day: bool = False,
+                 transparent: bool = False, rrule: Optional[Dict[str, str]] = None,
+                 exdates: Optional[Set[datetime]] = None):
+        self.uid = uid
+        self.summary = summary
+        self.start = start
+        self.end = end
+        self.all_day = all_day
+        self.transparent = transparent
+        self.rrule = rrule
+        self.exdates = exdates or set()
+
+    @property
+    def duration(self) -> timedelta:
+        return self.end - self.start
+
+    def occurrences(self, window_start: datetime, window_end: datetime) -> Iterator[datetime]:
+        """Start times of the occurrences overlapping [window_start, window_end).
+
+        Zero-length occurrences count when they start inside the window, as in CalendarIndex.between.
+        """
+        if not self.rrule:
+            if self.start < window_end and _overlaps(self.start, self.duration, window_start):
+                yield self.start
+            return
+        for start in _expand(self, window_start - self.duration, window_end):
+            if _overlaps(start, self.duration, window_start) and start not in self.exdates:
+                yield start
+
+def _overlaps(start: datetime, duration: timedelta, window_start: datetime) -> bool:
+    return start + duration > window_start or start >= window_start
+
+# Rule parts each frequency honours; a rule using anything else is not expanded
+_COMMON_PARTS = {"FREQ", "INTERVAL", "COUNT", "UNTIL", "WKST"}
+_SUPPORTED_PARTS = {
+    "DAILY": _COMMON_PARTS | {"BYDAY"},
+    "WEEKLY": _COMMON_PARTS | {"BYDAY"},
+    "MONTHLY": _COMMON_PARTS | {"BYDAY", "BYMONTHDAY"},
+    "YEARLY": _COMMON_PARTS | {"BYMONTH", "BYDAY", "BYMONTHDAY"},
+}
+_BYDAY = re.compile(r"([+-]?\d{1,2})?(MO|TU|WE|TH|FR|SA|SU)")
+
+def unsupported_rule(rule: Dict[str, str]) -> Optional[str]:
+    """Why rule can't be expanded here, or None if it can"""
+    freq = rule.get("FREQ")
+    if freq not in _SUPPORTED_PARTS:
+        return f"FREQ={freq}"
+    extra = sorted(set(rule) - _SUPPORTED_PARTS[freq])
+    if extra:
+        return ", ".join(extra)
+    if rule.get("WKST", "MO") != "MO":
+        return f"WKST={rule['WKST']}"
+    days = [_BYDAY.fullmatch(day) for day in rule.get("BYDAY", "").split(",") if day]
+    if any(match is None for match in days):
+        return f"BYDAY={rule['BYDAY']}"
+    # An ordinal (2TU, -1FR) counts within a month; weekly and daily rules can't have one,
+    # and a yearly one would count within the year unless BYMONTH narrows it to a month
+    ordinals = any(match.group(1) for match in days)
+    if ordinals and (freq in ("DAILY", "WEEKLY") or (freq == "YEARLY" and "BYMONTH" not in rule)):
+        return f"BYDAY={rule['BYDAY']}"
+    return None
+
+def _month_days(year: int, month: int, rule: Dict[str, str], default_day: int) -> List[int]:
+    """Days of a month selected by BYMONTHDAY and BYDAY (both must match), else DTSTART's day"""
+    last = (date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+    days = None
+    if "BYMONTHDAY" in rule:
+        days = set()
+        for value in rule["BYMONTHDAY"].split(","):
+            day = int(value)
+            day = day if day > 0 else last + 1 + day
+            if 1 <= day <= last:
+                days.add(day)
+    if "BYDAY" in rule:
+        weekdays = set()
+        first_weekday = date(year, month, 1).weekday()
+        for match in (_BYDAY.fullmatch(item) for item in rule["BYDAY"].split(",")):
+            weekday = _WEEKDAYS[match.group(2)]
+            matching = [day for day in range(1, last + 1) if (first_weekday + day - 1) % 7 == weekday]
+            if match.group(1):
+                ordinal = int(match.group(1))
+                if 0 < abs(ordinal) <= len(matching):
+                    weekdays.add(matching[ordinal - 1 if ordinal > 0 else ordinal])
+            else:
+                weekdays.update(matching)
+        days = weekdays if days is None else days & weekdays
+    if days is None:
+        # e.g. the 31st in a short month: RFC 5545 skips it
+        return [default_day] if default_day <= last else []
+    return sorted(days)
+
+def _expand(event: Event, after: datetime, before: datetime) -> Iterator[datetime]:
+    """Recurrence start times in [after, before), generated only for that window.
+
+    Without COUNT, whole periods before the window are skipped arithmetically;
+    with COUNT they have to be walked so the count stays right.
+    """
+    rule = event.rrule
+    start = event.start
+    if unsupported_rule(rule):
+        if after <= start < before:
+            yield start
+        return
+    freq = rule["FREQ"]
+    interval = int(rule.get("INTERVAL", "1"))
+    count = int(rule["COUNT"]) if "COUNT" in rule else None
+    until = _parse_until(rule["UNTIL"]) if "UNTIL" in rule else None
+    byday = sorted({_WEEKDAYS[day[-2:]] for day in rule["BYDAY"].split(",")}) if "BYDAY" in rule else None
+
+    if freq in ("DAILY", "WEEKLY"):
+        period = timedelta(days=interval * (7 if freq == "WEEKLY" else 1))
+        if freq == "WEEKLY" and byday:
+            anchor = start - timedelta(days=start.weekday())
+            offsets = [timedelta(days=day) for day in byday]
+        else:
+            anchor, offsets = start, [timedelta(0)]
+        months = None
+    else:
+        # Periods are walked a month (or a year) at a time from DTSTART's month
+        period, anchor = None, start.replace(day=1)
+        months = interval * (12 if freq == "YEARLY" else 1)
+        in_year = sorted(int(m) for m in rule["BYMONTH"].split(",")) if "BYMONTH" in rule else [start.month]
+
+    step = 0
+    if count is None and after > anchor:
+        if period is not None:
+            step = max(0, int((after - anchor) / period) - 1)
+        else:
+            step = max(0, ((after.year - anchor.year) * 12 + after.month - anchor.month) // months - 1)
+
+    emitted = 0
+    while True:
+        if period is not None:
+            base = anchor + step * period
+            if base >= before:
+                return
+            candidates = [base + offset for offset in offsets]
+            if freq == "DAILY" and byday:
+                candidates = [c for c in candidates if c.weekday() in byday]
+        else:
+            base = _add_months(anchor, step * months)
+            if base >= before:
+                return
+            month_starts = [base] if freq == "MONTHLY" else [base.replace(month=m) for m in in_year]
+            candidates = [
+                month_start.replace(day=day)
+                for month_start in month_starts
+                for day in _month_days(month_start.year, month_start.month, rule, start.day)
+            ]
+        for occurrence in candidates:
+            if occurrence < start:
+                continue
+            if (until is not None and occurrence > until) or (count is not None and emitted >= count):
+                return
+            emitted += 1
+            if after <= occurrence < before:
+                yield occurrence
+        step += 1
+
+def _add_months(moment: datetime, months: int) -> datetime:
+    """moment, the first of a month, moved by whole months"""
+    year, month = divmod(moment.month - 1 + months, 12)
+    return moment.replace(year=moment.year + year, month=month + 1)
+
+def _parse_until(value: str) -> datetime:
+    return _parse_datetime(value, {})[0]
+
+def _parse_datetime(value: str, params: Dict[str, str]) -> Tuple[datetime, bool]:
+    """iCalendar DATE or DATE-TIME as a naive local datetime, plus whether it was a DATE"""
+    value = value.strip()
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return datetime.combine(date(int(value[:4]), int(value[4:6]), int(value[6:8])), datetime.min.time()), True
+    moment = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        return moment.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None), False
+    if "TZID" in params:
+        try:
+            from zoneinfo import ZoneInfo
+            return moment.replace(tzinfo=ZoneInfo(params["TZID"])).astimezone().replace(tzinfo=None), False
+        except Exception:
+            pass  # unknown zone: treat as floating time
+    return moment, False
+
+def _parse_duration(value: str) -> timedelta:
+    match = _DURATION.fullmatch(value.strip())
+    if not match:
+        return timedelta(0)
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                         minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -duration if sign == "-" else duration
+
+def parse_ics(text: str) -> List[Event]:
+    """VEVENTs of an iCalendar resource; RECURRENCE-ID overrides replace their master's instance"""
+    lines = re.sub(r"\r?\n[ \t]", "", text).splitlines()
+    components: List[Dict[str, List[Tuple[Dict[str, str], str]]]] = []
+    current = None
+    for line in lines:
+        if line == "BEGIN:VEVENT":
+            current = {}
+        elif line == "END:VEVENT" and current is not None:
+            components.append(current)
+            current = None
+        elif current is not None and ":" in line:
+            head, value = line.split(":", 1)
+            name, *raw_params = head.split(";")
+            params = dict(p.split("=", 1) for p in raw_params if "=" in p)
+            current.setdefault(name.upper(), []).append((params, value))
+
+    events, overrides = {}, []
+    for props in components:
+        if "DTSTART" not in props:
+            continue
+        params, value = props["DTSTART"][0]
+        start, all_day = _parse_datetime(value, params)
+        if "DTEND" in props:
+            end = _parse_datetime(props["DTEND"][0][1], props["DTEND"][0][0])[0]
+        elif "DURATION" in props:
+            end = start + _parse_duration(props["DURATION"][0][1])
+        else:
+            end = start + (timedelta(days=1) if all_day else timedelta(0))
+        rrule = None
+        if "RRULE" in props:
+            rrule = dict(part.split("=", 1) for part in props["RRULE"][0][1].split(";") if "=" in part)
+            unsupported = unsupported_rule(rrule)
+            if unsupported:
+                logger.warning(f"Unsupported RRULE part {unsupported} in {props.get('UID', [({}, '?')])[0][1]}; "
+                               f"indexing only its first occurrence")
+        exdates = {
+            _parse_datetime(item, params)[0]
+            for params, value in props.get("EXDATE", []) for item in value.split(",")
+        }
+        event = Event(
+            uid=props.get("UID", [({}, "")])[0][1],
+            summary=props.get("SUMMARY", [({}, "(no title)")])[0][1].replace("\\,", ",").replace("\\n", " "),
+            start=start, end=end, all_day=all_day,
+            transparent=props.get("TRANSP", [({}, "")])[0][1] == "TRANSPARENT",
+            rrule=rrule, exdates=exdates
+        )
+        if "RECURRENCE-ID" in props:
+            recurrence_id = _parse_datetime(props["RECURRENCE-ID"][0][1], props["RECURRENCE-ID"][0][0])[0]
+            overrides.append((recurrence_id, event))
+        else:
+            events[event.uid] = event
+    for recurrence_id, event in overrides:
+        master = events.get(event.uid)
+        if master is not None:
+            master.exdates.add(recurrence_id)
+    return list(events.values()) + [event for _, event in overrides]
+
+class CalendarIndex:
+    """Local event index answering range queries without touching the provider.
+
+    One-off events live in an array sorted by start time, so a window is a
+    bisect plus a scan of the events inside it (widened by the longest event
+    duration to catch ones that started earlier). Recurring events are kept
+    as rules and expanded only across the requested window.
+    """
+
+    def __init__(self):
+        self._starts: List[datetime] = []
+        self._singles: List[Event] = []
+        self._recurring: Dict[str, List[Event]] = {}
+        self._by_key: Dict[str, List[Event]] = {}
+        self._max_duration = timedelta(0)
+        self._lock = threading.Lock()
+
+    def replace(self, key: str, events: List[Event]):
+        """Store the events of one calendar resource, replacing its previous version"""
+        with self._lock:
+            self._remove(key)
+            self._by_key[key] = events
+            for event in events:
+                if event.rrule:
+                    self._recurring.setdefault(key, []).append(event)
+                    continue
+                position = bisect.bisect_right(self._starts, event.start)
+                self._starts.insert(position, event.start)
+                self._singles.insert(position, event)
+                self._max_duration = max(self._max_duration, event.duration)
+
+    def remove(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        self._recurring.pop(key, None)
+        for event in self._by_key.pop(key, []):
+            if event.rrule:
+                continue
+            position = bisect.bisect_left(self._starts, event.start)
+            while self._singles[position] is not event:
+                position += 1
+            del self._starts[position]
+            del self._singles[position]
+
+    def clear(self):
+        with self._lock:
+            self._starts, self._singles = [], []
+            self._recurring, self._by_key = {}, {}
+            self._max_duration = timedelta(0)
+
+    def between(self, window_start: datetime, window_end: datetime) -> List[Occurrence]:
+        """Every occurrence overlapping [window_start, window_end), ordered by start"""
+        with self._lock:
+            first = bisect.bisect_left(self._starts, window_start - self._max_duration)
+            last = bisect.bisect_left(self._starts, window_end)
+            found = [
+                (event.start, event.end, event) for event in self._singles[first:last]
+                if event.end > window_start or event.start >= window_start
+            ]
+            for events in self._recurring.values():
+                for event in events:
+                    found.extend(
+                        (start, start + event.duration, event)
+                        for start in event.occurrences(window_start, window_end)
+                    )
+        found.sort(key=lambda occurrence: occurrence[0])
+        return found
+
+    def busy(self, window_start: datetime, window_end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Merged busy intervals in the window (transparent events don't block time)"""
+        merged: List[List[datetime]] = []
+        for start, end, event in self.between(window_start, window_end):
+            if event.transparent:
+                continue
+            start, end = max(start, window_start), min(end, window_end)
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [(start, end) for start, end in merged]
+
+    def is_free(self, window_start: datetime, window_end: datetime) -> bool:
+        return not self.busy(window_start, window_end)
+
+    def stats(self) -> dict:
+        return {"events": len(self._singles), "recurring": sum(len(e) for e in self._recurring.values())}
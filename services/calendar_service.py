@@ -1,28 +1,57 @@
+import os
 import logging
-from typing import List
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from services.calendar_index import CalendarIndex
+from services.calendar_sync import CalDAVSource, CalendarSync, LocalCalendar
 
 logger = logging.getLogger(__name__)
 
 class CalendarService:
-    """Calendar service for Apple Calendar and Google Calendar"""
-    
+    """Calendar service for Apple Calendar (CalDAV), served from a local event index"""
+
     def __init__(self):
-        self.apple_id = __import__("os").getenv("APPLE_ID")
-        self.apple_password = __import__("os").getenv("APPLE_APP_PASSWORD")
-    
-    def get_upcoming_events(self, days: int = 7) -> List[str]:
+        self.apple_id = os.getenv("APPLE_ID")
+        self.apple_password = os.getenv("APPLE_APP_PASSWORD")
+        self.index = CalendarIndex()
+        self.sync: Optional[CalendarSync] = None
+        source = self._source()
+        if source is not None:
+            self.sync = CalendarSync(source, self.index)
+
+    def _source(self):
+        if os.getenv("CALENDAR_BACKEND", "caldav").lower() == "local":
+            return LocalCalendar()
+        if not self.apple_id:
+            return None
+        url = os.getenv("CALDAV_URL")
+        if not url:
+            logger.warning("APPLE_ID is set but CALDAV_URL is not; calendar disabled")
+            return None
+        return CalDAVSource(url, self.apple_id, self.apple_password)
+
+    def get_upcoming_events(self, days: int = 7, limit: Optional[int] = None) -> List[str]:
         """Get upcoming events for the next N days"""
-        events = []
-        
+        if self.sync is None:
+            return []
         try:
-            if self.apple_id:
-                events.extend(self._get_apple_calendar_events(days))
+            self.sync.refresh()
+            now = datetime.now()
+            occurrences = self.index.between(now, now + timedelta(days=days))
         except Exception as e:
             logger.error(f"Error fetching calendar events: {e}")
-        
-        return events
-    
-    def _get_apple_calendar_events(self, days: int) -> List[str]:
-        """Fetch events from Apple Calendar"""
-        # Placeholder for Apple Calendar API
-        return [f"Event {i} on Apple Calendar" for i in range(3)]
+            return []
+        return [
+            f"{start:%a %d %b}{'' if event.all_day else f' {start:%H:%M}'} {event.summary}"
+            for start, _, event in occurrences[:limit]
+        ]
+
+    def get_busy(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Merged busy intervals between start and end"""
+        if self.sync is None:
+            return []
+        self.sync.refresh()
+        return self.index.busy(start, end)
+
+    def stats(self) -> dict:
+        return self.sync.stats() if self.sync else {"configured": False}
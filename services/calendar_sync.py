@@ -0,0 +1,218 @@
+import os
+import time
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import httpx
+from services.calendar_index import CalendarIndex, parse_ics
+
+logger = logging.getLogger(__name__)
+
+DAV = "DAV:"
+CALDAV = "urn:ietf:params:xml:ns:caldav"
+CALSERVER = "http://calendarserver.org/ns/"
+
+# (new sync token, {href: iCalendar text, or None if deleted}, whether the index must be rebuilt)
+Changes = Tuple[Optional[str], Dict[str, Optional[str]], bool]
+
+_CTAG_QUERY = f"""<?xml version="1.0" encoding="utf-8"?>
+<d:propfind xmlns:d="{DAV}" xmlns:cs="{CALSERVER}">
+  <d:prop><cs:getctag/><d:sync-token/></d:prop>
+</d:propfind>"""
+
+_SYNC_QUERY = """<?xml version="1.0" encoding="utf-8"?>
+<d:sync-collection xmlns:d="DAV:">
+  <d:sync-token>{token}</d:sync-token>
+  <d:sync-level>1</d:sync-level>
+  <d:prop><d:getetag/></d:prop>
+</d:sync-collection>"""
+
+_MULTIGET_QUERY = """<?xml version="1.0" encoding="utf-8"?>
+<c:calendar-multiget xmlns:d="DAV:" xmlns:c="urn:ietf:params:xml:ns:caldav">
+  <d:prop><c:calendar-data/></d:prop>
+  {hrefs}
+</c:calendar-multiget>"""
+
+_FULL_QUERY = """<?xml version="1.0" encoding="utf-8"?>
+<c:calendar-query xmlns:d="DAV:" xmlns:c="urn:ietf:params:xml:ns:caldav">
+  <d:prop><c:calendar-data/></d:prop>
+  <c:filter><c:comp-filter name="VCALENDAR"><c:comp-filter name="VEVENT"/></c:comp-filter></c:filter>
+</c:calendar-query>"""
+
+def _tag(namespace: str, name: str) -> str:
+    return f"{{{namespace}}}{name}"
+
+class CalDAVSource:
+    """Incremental changes from one CalDAV calendar collection.
+
+    A Depth 0 PROPFIND of the collection's ctag short-circuits the common
+    nothing-changed case; otherwise a sync-collection REPORT lists the
+    changed hrefs since the last sync token and a calendar-multiget fetches
+    just those. Servers without sync-collection fall back to a full
+    calendar-query whenever the ctag moves.
+    """
+
+    def __init__(self, url: str, username: str, password: str):
+        self.url = url if url.endswith("/") else url + "/"
+        self._client = httpx.Client(auth=(username, password), timeout=float(os.getenv("HTTP_TIMEOUT", "30")))
+        self._ctag: Optional[str] = None
+        self._sync_supported = True
+
+    def changes(self, token: Optional[str]) -> Changes:
+        ctag, server_token = self._collection_tags()
+        if token is not None and ctag is not None and ctag == self._ctag:
+            return token, {}, False
+        if self._sync_supported:
+            response = self._report(_SYNC_QUERY.format(token=token or ""))
+            if response.status_code in (403, 409) and token:
+                # The server no longer knows our token: start over
+                response = self._report(_SYNC_QUERY.format(token=""))
+                token = None
+            if response.status_code == 207:
+                changed, deleted, new_token = self._parse_sync(response.content)
+                result = {href: None for href in deleted}
+                result.update(self._multiget(changed))
+                self._ctag = ctag
+                return new_token or server_token, result, token is None
+            self._sync_supported = False
+            logger.info(f"{self.url} has no sync-collection support; using full calendar queries")
+        response = self._report(_FULL_QUERY)
+        response.raise_for_status()
+        self._ctag = ctag
+        return ctag or "", self._calendar_data(response.content), True
+
+    def _collection_tags(self) -> Tuple[Optional[str], Optional[str]]:
+        response = self._client.request("PROPFIND", self.url, content=_CTAG_QUERY,
+                                        headers={"Depth": "0", "Content-Type": "application/xml"})
+        response.raise_for_status()
+        root = ET.fromstring(response.content)
+        ctag = root.find(f".//{_tag(CALSERVER, 'getctag')}")
+        sync_token = root.find(f".//{_tag(DAV, 'sync-token')}")
+        return (ctag.text if ctag is not None else None), (sync_token.text if sync_token is not None else None)
+
+    def _report(self, body: str) -> httpx.Response:
+        return self._client.request("REPORT", self.url, content=body,
+                                    headers={"Depth": "1", "Content-Type": "application/xml"})
+
+    def _parse_sync(self, content: bytes) -> Tuple[List[str], List[str], Optional[str]]:
+        root = ET.fromstring(content)
+        changed, deleted = [], []
+        for response in root.findall(_tag(DAV, "response")):
+            href = response.findtext(_tag(DAV, "href"))
+            status = response.findtext(_tag(DAV, "status")) or ""
+            (deleted if "404" in status else changed).append(href)
+        return changed, deleted, root.findtext(_tag(DAV, "sync-token"))
+
+    def _multiget(self, hrefs: List[str]) -> Dict[str, Optional[str]]:
+        found: Dict[str, Optional[str]] = {}
+        for offset in range(0, len(hrefs), 100):
+            batch = "".join(f"<d:href>{href}</d:href>" for href in hrefs[offset:offset + 100])
+            response = self._report(_MULTIGET_QUERY.format(hrefs=batch))
+            response.raise_for_status()
+            found.update(self._calendar_data(response.content))
+        return found
+
+    def _calendar_data(self, content: bytes) -> Dict[str, Optional[str]]:
+        root = ET.fromstring(content)
+        return {
+            response.findtext(_tag(DAV, "href")): response.findtext(f".//{_tag(CALDAV, 'calendar-data')}")
+            for response in root.findall(_tag(DAV, "response"))
+            if response.find(f".//{_tag(CALDAV, 'calendar-data')}") is not None
+        }
+
+    def close(self):
+        self._client.close()
+
+class LocalCalendar:
+    """In-process stand-in for a CalDAV collection, with the CalDAVSource interface"""
+
+    def __init__(self):
+        self._resources: Dict[str, str] = {}
+        self._log: List[str] = []
+        self._lock = threading.Lock()
+
+    def put(self, href: str, ics: Optional[str]):
+        """Create, update or (with None) delete a resource"""
+        with self._lock:
+            if ics is None:
+                self._resources.pop(href, None)
+            else:
+                self._resources[href] = ics
+            self._log.append(href)
+
+    def add_event(self, uid: str, summary: str, start: datetime, end: datetime, rrule: Optional[str] = None):
+        lines = [
+            "BEGIN:VCALENDAR", "BEGIN:VEVENT", f"UID:{uid}", f"SUMMARY:{summary}",
+            f"DTSTART:{start:%Y%m%dT%H%M%S}", f"DTEND:{end:%Y%m%dT%H%M%S}"
+        ]
+        if rrule:
+            lines.append(f"RRULE:{rrule}")
+        self.put(f"/local/{uid}.ics", "\r\n".join(lines + ["END:VEVENT", "END:VCALENDAR"]))
+
+    def changes(self, token: Optional[str]) -> Changes:
+        with self._lock:
+            version = len(self._log)
+            if token is None or not token.isdigit() or int(token) > version:
+                return str(version), dict(self._resources), True
+            hrefs = set(self._log[int(token):])
+            return str(version), {href: self._resources.get(href) for href in hrefs}, False
+
+    def close(self):
+        pass
+
+class CalendarSync:
+    """Keeps a CalendarIndex up to date from a source, refreshing in the background"""
+
+    def __init__(self, source, index: CalendarIndex):
+        self.source = source
+        self.index = index
+        self.max_age = float(os.getenv("CALENDAR_SYNC_INTERVAL", "300"))
+        self.token: Optional[str] = None
+        self.last_sync: Optional[float] = None
+        self._syncing = threading.Lock()
+        self.counters = {"syncs": 0, "changed": 0, "deleted": 0, "rebuilds": 0, "errors": 0}
+
+    def sync(self):
+        """Apply whatever changed on the server since the last sync"""
+        try:
+            token, changes, rebuild = self.source.changes(self.token)
+            if rebuild:
+                self.index.clear()
+                self.counters["rebuilds"] += 1
+            for href, ics in changes.items():
+                if ics is None:
+                    self.index.remove(href)
+                    self.counters["deleted"] += 1
+                else:
+                    self.index.replace(href, parse_ics(ics))
+                    self.counters["changed"] += 1
+            self.token = token
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.error(f"Error syncing calendar: {e}")
+        finally:
+            self.counters["syncs"] += 1
+            self.last_sync = time.monotonic()
+
+    def refresh(self):
+        """Sync now if nothing is indexed yet, in the background if the index is merely stale"""
+        if self.last_sync is None:
+            with self._syncing:
+                if self.last_sync is None:
+                    self.sync()
+        elif time.monotonic() - self.last_sync > self.max_age and self._syncing.acquire(blocking=False):
+            def background():
+                try:
+                    self.sync()
+                finally:
+                    self._syncing.release()
+            threading.Thread(target=background, daemon=True, name="calendar-sync").start()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            **self.index.stats(),
+            "last_sync_age": round(time.monotonic() - self.last_sync, 1) if self.last_sync else None
+        }
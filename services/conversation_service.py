@@ -0,0 +1,250 @@
+import os
+import re
+import asyncio
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional, Tuple
+from services.token_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+def estimate_tokens(text: str) -> int:
+    """Token count of a message (at least one)"""
+    return max(1, count_tokens(text))
+
+def _compact(text: str) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+class Turn:
+    """One message in a conversation, with its token count precomputed"""
+    __slots__ = ("role", "content", "tokens")
+
+    def __init__(self, role: str, content: str, tokens: Optional[int] = None):
+        self.role = role
+        self.content = content
+        self.tokens = tokens if tokens is not None else estimate_tokens(content)
+
+class Conversation:
+    """Recent turns plus a rolling summary of the turns that fell out of the window"""
+    __slots__ = ("turns", "summary", "last_active")
+
+    def __init__(self, max_turns: int, summary: str = ""):
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.summary = summary
+        self.last_active = time.monotonic()
+
+class SQLiteConversationBackend:
+    """Persists turns and summaries so evicted conversations can be reloaded.
+
+    append and save_summary only queue the write; a writer thread commits
+    everything queued within CONVERSATION_COMMIT_INTERVAL_MS in one
+    transaction, so recording a turn never blocks the event loop on disk.
+    Writes still queued when the process dies are lost, which bounds the
+    loss window to one commit interval.
+    """
+
+    def __init__(self, path: str):
+        self.commit_interval = float(os.getenv("CONVERSATION_COMMIT_INTERVAL_MS", "50")) / 1000
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "conversation_id TEXT, seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "role TEXT, content TEXT, tokens INTEGER)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS turns_by_conversation ON turns (conversation_id, seq)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS summaries (conversation_id TEXT PRIMARY KEY, summary TEXT)")
+        self._db.commit()
+        self._queue: List[Tuple[str, tuple]] = []
+        self._queue_lock = threading.Lock()
+        self._pending = threading.Event()
+        self._closing = threading.Event()
+        self.counters = {"commits": 0, "writes": 0}
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name="conversation-writer")
+        self._writer.start()
+
+    def append(self, conversation_id: str, turn: Turn):
+        self._enqueue(
+            "INSERT INTO turns (conversation_id, role, content, tokens) VALUES (?, ?, ?, ?)",
+            (conversation_id, turn.role, turn.content, turn.tokens)
+        )
+
+    def save_summary(self, conversation_id: str, summary: str):
+        self._enqueue(
+            "INSERT OR REPLACE INTO summaries (conversation_id, summary) VALUES (?, ?)",
+            (conversation_id, summary)
+        )
+
+    def _enqueue(self, statement: str, params: tuple):
+        with self._queue_lock:
+            self._queue.append((statement, params))
+        self._pending.set()
+
+    def _write_loop(self):
+        while not self._closing.is_set():
+            self._pending.wait()
+            self._pending.clear()
+            # Let the rest of a burst (both sides of a turn, a summary) join this commit
+            self._closing.wait(self.commit_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Failed to commit conversation turns: {e}")
+
+    def flush(self):
+        """Commit every queued write in a single transaction"""
+        # Held across the swap so concurrent flushes commit batches in queue order
+        with self._lock:
+            with self._queue_lock:
+                batch, self._queue = self._queue, []
+            if not batch:
+                return
+            with self._db:
+                for statement, params in batch:
+                    self._db.execute(statement, params)
+        self.counters["commits"] += 1
+        self.counters["writes"] += len(batch)
+
+    def load(self, conversation_id: str, max_turns: int) -> Optional[Conversation]:
+        # Runs on a worker thread (ConversationStore.load); commit anything still queued for it first
+        self.flush()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT role, content, tokens FROM turns WHERE conversation_id = ? ORDER BY seq DESC LIMIT ?",
+                (conversation_id, max_turns)
+            ).fetchall()
+            summary_row = self._db.execute(
+                "SELECT summary FROM summaries WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        if not rows and not summary_row:
+            return None
+        conversation = Conversation(max_turns, summary_row[0] if summary_row else "")
+        conversation.turns.extend(Turn(*row) for row in reversed(rows))
+        return conversation
+
+    def close(self):
+        self._closing.set()
+        self._pending.set()
+        self._writer.join()
+        self.flush()
+        self._db.close()
+
+    def stats(self) -> dict:
+        return {"queued": len(self._queue), **self.counters}
+
+class ConversationStore:
+    """Per-user/per-channel conversation history with token-budgeted prompt assembly"""
+
+    def __init__(self, backend: Optional[SQLiteConversationBackend] = None):
+        self.max_turns = int(os.getenv("CONVERSATION_MAX_TURNS", "40"))
+        self.token_budget = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1500"))
+        self.max_active = int(os.getenv("CONVERSATION_MAX_ACTIVE", "5000"))
+        self.idle_seconds = float(os.getenv("CONVERSATION_IDLE_SECONDS", "3600"))
+        self.summary_chars = int(os.getenv("CONVERSATION_SUMMARY_CHARS", "600"))
+        db_path = os.getenv("CONVERSATION_DB_PATH")
+        self.backend = backend or (SQLiteConversationBackend(db_path) if db_path else None)
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self.counters = {"evicted_idle": 0, "evicted_lru": 0, "reloaded": 0}
+
+    async def load(self, conversation_id: str):
+        """Bring an evicted conversation back from the backend, reading it off the event loop.
+
+        Everything else here only touches memory, so callers load() before
+        build_messages() and add_turn().
+        """
+        if conversation_id in self._conversations or not self.backend:
+            return
+        conversation = await asyncio.to_thread(self.backend.load, conversation_id, self.max_turns)
+        # Another request may have loaded or started it meanwhile; what is in memory is newer
+        if conversation is not None and conversation_id not in self._conversations:
+            self.counters["reloaded"] += 1
+            self._conversations[conversation_id] = conversation
+            self._get(conversation_id)
+
+    def _get(self, conversation_id: str, create: bool = False) -> Optional[Conversation]:
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            if not create:
+                return None
+            conversation = Conversation(self.max_turns)
+        self._conversations[conversation_id] = conversation
+        self._conversations.move_to_end(conversation_id)
+        conversation.last_active = time.monotonic()
+        self._evict()
+        return conversation
+
+    def _evict(self):
+        """Drop idle conversations, then least recently used ones over the cap"""
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._conversations:
+            oldest_id, oldest = next(iter(self._conversations.items()))
+            if oldest.last_active > cutoff:
+                break
+            del self._conversations[oldest_id]
+            self.counters["evicted_idle"] += 1
+        while len(self._conversations) > self.max_active:
+            self._conversations.popitem(last=False)
+            self.counters["evicted_lru"] += 1
+
+    def add_turn(self, conversation_id: str, role: str, content: str):
+        """Record a message; turns pushed out of the window are folded into the summary"""
+        conversation = self._get(conversation_id, create=True)
+        turn = Turn(role, _compact(content))
+        if len(conversation.turns) == conversation.turns.maxlen:
+            self._summarize(conversation_id, conversation, conversation.turns[0])
+        conversation.turns.append(turn)
+        if self.backend:
+            self.backend.append(conversation_id, turn)
+
+    def _summarize(self, conversation_id: str, conversation: Conversation, turn: Turn):
+        first_sentence = re.split(r"(?<=[.!?])\s", turn.content, maxsplit=1)[0][:120]
+        summary = f"{conversation.summary} {turn.role}: {first_sentence}".strip()
+        # Keep only the most recent part of the summary
+        conversation.summary = summary[-self.summary_chars:]
+        if self.backend:
+            self.backend.save_summary(conversation_id, conversation.summary)
+
+    def build_messages(self, conversation_id: str, system_prompt: str, message: str,
+                       token_budget: Optional[int] = None) -> List[dict]:
+        """Assemble system prompt, history and the new message within a token budget.
+
+        Walks back from the newest turn and stops at the first one that does
+        not fit, so the cost is proportional to the window, not the history.
+        """
+        budget = (token_budget or self.token_budget) - estimate_tokens(system_prompt) - estimate_tokens(message)
+        conversation = self._get(conversation_id)
+        history: List[dict] = []
+        if conversation is not None:
+            for turn in reversed(conversation.turns):
+                if turn.tokens > budget:
+                    break
+                budget -= turn.tokens
+                history.append({"role": turn.role, "content": turn.content})
+            history.reverse()
+            if conversation.summary and estimate_tokens(conversation.summary) <= budget:
+                system_prompt = f"{system_prompt}\n\nEarlier in this conversation: {conversation.summary}"
+
+        return [{"role": "system", "content": system_prompt}] + history + [{"role": "user", "content": message}]
+
+    def flush(self):
+        """Commit turns still queued for the backend, e.g. at shutdown"""
+        if self.backend:
+            self.backend.flush()
+
+    def clear(self, conversation_id: str):
+        self._conversations.pop(conversation_id, None)
+
+    def stats(self) -> dict:
+        stats = {**self.counters, "active": len(self._conversations), "max_active": self.max_active}
+        if self.backend:
+            stats["backend"] = self.backend.stats()
+        return stats
+
+conversation_store = ConversationStore()
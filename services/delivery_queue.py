@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import random
+import time
+import zlib
+from collections import deque
+from typing import Any, Awaitable, Callable, List, Optional
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class RetryableError(Exception):
+    """A send failure worth retrying (e.g. HTTP 429 or 5xx)"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class DeliveryQueue:
+    """Bounded outbound queue drained by a pool of async workers.
+
+    Each recipient is pinned to one worker shard, so messages to the same
+    recipient are sent in order while different recipients go out in
+    parallel. Retries happen in place on the shard for the same reason.
+    """
+
+    def __init__(self, name: str, send: Callable[[str, Any], Awaitable[None]], workers: int = 4,
+                 maxsize: int = 1000, max_retries: int = 5, base_backoff: float = 0.5, max_backoff: float = 30.0):
+        self.name = name
+        self.send = send
+        self.workers = workers
+        self.maxsize = maxsize
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._shards: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._latencies = deque(maxlen=1000)
+        self.counters = {"enqueued": 0, "sent": 0, "failed": 0, "retries": 0, "rejected": 0}
+
+    def _ensure_started(self):
+        if not self._tasks:
+            shard_size = max(1, self.maxsize // self.workers)
+            self._shards = [asyncio.Queue(maxsize=shard_size) for _ in range(self.workers)]
+            self._tasks = [asyncio.create_task(self._worker(shard)) for shard in self._shards]
+
+    def _shard(self, recipient: str) -> asyncio.Queue:
+        return self._shards[zlib.crc32(recipient.encode()) % len(self._shards)]
+
+    def enqueue(self, recipient: str, payload: Any) -> bool:
+        """Queue a message without waiting; returns False if the queue is full"""
+        self._ensure_started()
+        try:
+            self._shard(recipient).put_nowait((recipient, payload, time.monotonic(), None))
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            logger.warning(f"{self.name} queue full, dropping message to {recipient}")
+            return False
+        self.counters["enqueued"] += 1
+        return True
+
+    async def put(self, recipient: str, payload: Any):
+        """Queue a message, waiting for space if the recipient's shard is full"""
+        self._ensure_started()
+        await self._shard(recipient).put((recipient, payload, time.monotonic(), None))
+        self.counters["enqueued"] += 1
+
+    async def deliver(self, recipient: str, payload: Any):
+        """Queue a message and wait until it has been sent; raises the error if it is given up on"""
+        self._ensure_started()
+        sent = asyncio.get_running_loop().create_future()
+        await self._shard(recipient).put((recipient, payload, time.monotonic(), sent))
+        self.counters["enqueued"] += 1
+        await sent
+
+    async def _worker(self, shard: asyncio.Queue):
+        while True:
+            recipient, payload, enqueued_at, sent = await shard.get()
+            try:
+                with metrics.stage("delivery", self.name):
+                    await self._send_with_retry(recipient, payload)
+                self.counters["sent"] += 1
+                self._latencies.append(time.monotonic() - enqueued_at)
+                if sent is not None and not sent.done():
+                    sent.set_result(None)
+            except Exception as e:
+                self.counters["failed"] += 1
+                metrics.error(f"{self.name}_delivery")
+                logger.error(f"{self.name} delivery to {recipient} failed: {e}")
+                if sent is not None and not sent.done():
+                    sent.set_exception(e)
+            except asyncio.CancelledError:
+                if sent is not None and not sent.done():
+                    sent.set_exception(RetryableError(f"{self.name} queue stopped"))
+                raise
+            finally:
+                shard.task_done()
+
+    async def _send_with_retry(self, recipient: str, payload: Any):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.send(recipient, payload)
+            except RetryableError as e:
+                if attempt == self.max_retries:
+                    raise
+                self.counters["retries"] += 1
+                delay = e.retry_after
+                if delay is None:
+                    delay = min(self.max_backoff, self.base_backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                await asyncio.sleep(delay)
+
+    async def drain(self):
+        """Wait until everything queued so far has been sent or given up on"""
+        for shard in self._shards:
+            await shard.join()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        # Whoever is still waiting on a delivery learns it didn't happen
+        for shard in self._shards:
+            while not shard.empty():
+                sent = shard.get_nowait()[3]
+                if sent is not None and not sent.done():
+                    sent.set_exception(RetryableError(f"{self.name} queue stopped"))
+        self._tasks = []
+        self._shards = []
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            **self.counters,
+            "depth": sum(shard.qsize() for shard in self._shards),
+            "workers": self.workers,
+            "latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+        }
@@ -0,0 +1,221 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+from services.http_client import http_clients
+from services.metrics import metrics
+from services.token_budget import token_budget
+
+logger = logging.getLogger(__name__)
+
+DISCORD_API = os.getenv("DISCORD_API_URL", "https://discord.com/api/v10")
+MESSAGE_LIMIT = 2000
+
+# Interaction and response types
+PING = 1
+APPLICATION_COMMAND = 2
+PONG = 1
+CHANNEL_MESSAGE = 4
+DEFERRED_CHANNEL_MESSAGE = 5
+
+FollowUp = Callable[[], Awaitable[None]]
+
+class InteractionVerifier:
+    """Ed25519 check of Discord's X-Signature-* headers.
+
+    The verify key is parsed once, malformed or stale requests are rejected
+    before any crypto runs, and recent results are kept in a small LRU so
+    Discord's retries of the same request aren't verified twice.
+    """
+
+    def __init__(self, public_key: Optional[str] = None):
+        self.public_key = public_key if public_key is not None else os.getenv("DISCORD_PUBLIC_KEY", "")
+        self.max_skew = float(os.getenv("DISCORD_SIGNATURE_MAX_SKEW", "300"))
+        self.cache_size = int(os.getenv("DISCORD_SIGNATURE_CACHE_SIZE", "256"))
+        # Local development only: accept unsigned interactions when there is no key to check them with
+        self.skip_signature = os.getenv("DISCORD_SKIP_SIGNATURE", "false").lower() == "true"
+        self._results: "OrderedDict[Tuple[str, str, bytes], bool]" = OrderedDict()
+        self._verify_key = None
+        self.counters = {"verified": 0, "rejected": 0, "cache_hits": 0}
+        if not self.public_key:
+            if self.skip_signature:
+                logger.warning("DISCORD_PUBLIC_KEY not set; interaction signatures are not checked")
+            else:
+                logger.error("DISCORD_PUBLIC_KEY not set; rejecting all Discord interactions")
+            return
+        try:
+            from nacl.signing import VerifyKey
+            self._verify_key = VerifyKey(bytes.fromhex(self.public_key))
+        except ImportError:
+            logger.error("PyNaCl is not installed; rejecting all Discord interactions")
+        except ValueError as e:
+            logger.error(f"Invalid DISCORD_PUBLIC_KEY: {e}")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.public_key)
+
+    def verify(self, signature: Optional[str], timestamp: Optional[str], body: bytes) -> bool:
+        """True if the request was signed by Discord; without a key only if DISCORD_SKIP_SIGNATURE is set"""
+        if not self.enabled:
+            if not self.skip_signature:
+                self.counters["rejected"] += 1
+            return self.skip_signature
+        key = (signature or "", timestamp or "", body)
+        # Freshness is checked every time; only the Ed25519 result is cached, so a cached
+        # request can't be replayed once its timestamp is outside the skew window
+        if not self._fresh(key[0], key[1]):
+            self.counters["rejected"] += 1
+            return False
+        cached = self._results.get(key)
+        if cached is not None:
+            self._results.move_to_end(key)
+            self.counters["cache_hits"] += 1
+            return cached
+        valid = self._check(key[0], key[1], body)
+        self.counters["verified" if valid else "rejected"] += 1
+        if valid:
+            # Only successes are cached, so junk requests can't flush the cache
+            self._results[key] = True
+            if len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+        return valid
+
+    def _fresh(self, signature: str, timestamp: str) -> bool:
+        if len(signature) != 128 or not timestamp.isdigit():
+            return False
+        return not self.max_skew or abs(time.time() - int(timestamp)) <= self.max_skew
+
+    def _check(self, signature: str, timestamp: str, body: bytes) -> bool:
+        if self._verify_key is None:
+            return False
+        try:
+            from nacl.exceptions import BadSignatureError
+            self._verify_key.verify(timestamp.encode() + body, bytes.fromhex(signature))
+            return True
+        except (BadSignatureError, ValueError):
+            return False
+
+    def stats(self) -> dict:
+        return {**self.counters, "enabled": self.enabled, "cached": len(self._results)}
+
+class InteractionHandler:
+    """Answers Discord HTTP interactions within the 3-second deadline.
+
+    Slash commands are ACKed straight away with a deferred response; the
+    real work runs afterwards in a follow-up that edits the original
+    response as tokens arrive.
+    """
+
+    def __init__(self, ai_service, intent_router):
+        self.ai_service = ai_service
+        self.intent_router = intent_router
+        self.edit_interval = float(os.getenv("DISCORD_EDIT_INTERVAL", "1.0"))
+        self.counters = {"deferred": 0, "followups": 0, "edits": 0, "edit_errors": 0}
+
+    def handle(self, data: dict) -> Tuple[dict, Optional[FollowUp]]:
+        """Immediate response for an interaction, plus the follow-up to run after sending it"""
+        interaction_type = data.get("type")
+        if interaction_type == PING:
+            return {"type": PONG}, None
+        if interaction_type != APPLICATION_COMMAND:
+            return {"type": CHANNEL_MESSAGE, "data": {"content": "Unsupported interaction"}}, None
+
+        command = data.get("data") or {}
+        name = command.get("name")
+        options = {opt.get("name"): opt.get("value") for opt in command.get("options") or []}
+        user = (data.get("member") or {}).get("user") or data.get("user") or {}
+        user_id = user.get("id", "unknown")
+
+        if name == "ask":
+            question = str(options.get("question") or next(iter(options.values()), "")).strip()
+            if not question:
+                return {"type": CHANNEL_MESSAGE, "data": {"content": "Please include a question"}}, None
+            work = self._answer(question, f"discord:{data.get('channel_id')}:{user_id}", user_id)
+        elif name == "emails":
+            work = self._list(self.intent_router.email_service.get_recent_emails,
+                              int(options.get("count") or 5), "No emails found")
+        elif name == "calendar":
+            work = self._list(self.intent_router.calendar_service.get_upcoming_events,
+                              int(options.get("days") or 7), "No events found")
+        elif name == "briefing" and self.intent_router.briefing_service is not None:
+            work = self._briefing(user_id)
+        else:
+            return {"type": CHANNEL_MESSAGE, "data": {"content": f"Unknown command: {name}"}}, None
+
+        self.counters["deferred"] += 1
+        webhook = f"{DISCORD_API}/webhooks/{data.get('application_id')}/{data.get('token')}"
+
+        async def follow_up():
+            self.counters["followups"] += 1
+            with metrics.request("discord_interaction"):
+                try:
+                    await work(lambda content, final=False: self._respond(webhook, content, final))
+                except Exception as e:
+                    metrics.error("discord_interaction")
+                    logger.error(f"Discord interaction follow-up failed: {e}")
+                    await self._respond(webhook, f"Error getting AI response: {str(e)}", True)
+
+        return {"type": DEFERRED_CHANNEL_MESSAGE}, follow_up
+
+    def _answer(self, question: str, conversation_id: str, user_id: str):
+        async def work(edit):
+            routed = await self.intent_router.handle(question, "discord", user_id)
+            if routed is not None:
+                await edit(routed, True)
+                return
+            # Edits are throttled; the final one always carries the full text
+            response, last_edit = "", time.monotonic()
+            async for chunk in self.ai_service.stream(question, conversation_id=conversation_id,
+                                                      user_id=f"discord:{user_id}", channel="discord"):
+                response += chunk
+                if time.monotonic() - last_edit >= self.edit_interval:
+                    last_edit = time.monotonic()
+                    await edit(response)
+            await edit(response or "No response", True)
+        return work
+
+    def _list(self, fetch, count: int, empty: str):
+        async def work(edit):
+            items = await asyncio.to_thread(fetch, count)
+            await edit("\n".join(f"- {item}" for item in items[:5]) or empty, True)
+        return work
+
+    def _briefing(self, user_id: str):
+        async def work(edit):
+            await edit(await self.intent_router.briefing_service.digest("discord", user_id), True)
+        return work
+
+    async def _respond(self, webhook: str, content: str, final: bool = False):
+        """Edit the deferred reply; a final reply over the message limit continues in follow-up messages"""
+        if not final:
+            await self._edit(f"{webhook}/messages/@original", content)
+            return
+        parts = token_budget.split("discord", content) or [content]
+        await self._edit(f"{webhook}/messages/@original", parts[0], True)
+        for part in parts[1:]:
+            with metrics.stage("delivery", "discord_interaction"):
+                response = await http_clients.post(webhook, json={"content": part})
+            if response.status_code >= 300:
+                self.counters["edit_errors"] += 1
+                logger.warning(f"Discord follow-up message failed with {response.status_code}")
+                return
+
+    async def _edit(self, url: str, content: str, final: bool = False):
+        """PATCH the deferred response; intermediate edits are dropped when rate limited"""
+        for _ in range(2 if final else 1):
+            with metrics.stage("delivery", "discord_interaction"):
+                response = await http_clients.request("PATCH", url, json={"content": content[:MESSAGE_LIMIT]})
+            if response.status_code < 300:
+                self.counters["edits"] += 1
+                return
+            if response.status_code != 429 or not final:
+                break
+            await asyncio.sleep(float(response.json().get("retry_after", 1)))
+        self.counters["edit_errors"] += 1
+        logger.warning(f"Discord follow-up edit failed with {response.status_code}")
+
+    def stats(self) -> dict:
+        return dict(self.counters)
@@ -1,23 +1,48 @@
 import os
+import asyncio
 import logging
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 import discord
 from discord.ext import commands
+from services.intent_router import IntentRouter
+from services.briefing_service import BriefingService
+from services.discord_interactions import DISCORD_API, InteractionHandler
+from services.http_client import http_clients
+from services.job_queue import JobQueue, QueueFull
+from services.metrics import metrics
+from services.token_budget import token_budget
 
 logger = logging.getLogger(__name__)
 
 class DiscordService:
     """Discord bot service"""
     
-    def __init__(self, ai_service, email_service, calendar_service, reminder_service):
+    def __init__(self, ai_service, email_service, calendar_service, reminder_service,
+                 intent_router: Optional[IntentRouter] = None):
         self.ai_service = ai_service
         self.email_service = email_service
         self.calendar_service = calendar_service
         self.reminder_service = reminder_service
+        self.intent_router = intent_router or IntentRouter(
+            email_service, calendar_service, reminder_service,
+            BriefingService(ai_service, email_service, calendar_service, reminder_service)
+        )
         self.token = os.getenv("DISCORD_TOKEN")
         self.intents = discord.Intents.default()
         self.intents.message_content = True
         self.bot = commands.Bot(command_prefix="!", intents=self.intents)
+        # Command work runs on a worker pool so gateway handlers return immediately
+        self.jobs = JobQueue(
+            "discord",
+            workers=int(os.getenv("DISCORD_WORKERS", "8")),
+            maxsize=int(os.getenv("DISCORD_QUEUE_SIZE", "200")),
+            per_key_limit=int(os.getenv("DISCORD_GUILD_CONCURRENCY", "2"))
+        )
+        self.interactions = InteractionHandler(ai_service, self.intent_router)
+        # Reminders are DMed with the bot token, so without one they can't be delivered
+        if self.token:
+            self.reminder_service.register_delivery("discord", self._deliver_reminder)
+        self._gateway: Optional[asyncio.Task] = None
         self._setup_handlers()
     
     def _setup_handlers(self):
@@ -25,6 +50,10 @@ class DiscordService:
         @self.bot.event
         async def on_ready():
             logger.info(f"Discord bot logged in as {self.bot.user}")
+            # Inside the app the lifespan starts reminders and leader election decides who
+            # dispatches; only a standalone bot (start()) runs the dispatch loop itself
+            if self._gateway is None:
+                await self.reminder_service.start()
         
         @self.bot.event
         async def on_message(message):
@@ -34,44 +63,115 @@ class DiscordService:
         
         @self.bot.command(name="ask")
         async def ask_command(ctx, *, question):
-            async with ctx.typing():
-                response = await self.ai_service.ask(question)
-                await ctx.send(response[:2000])  # Discord message limit
+            async def job():
+                async with ctx.typing():
+                    response = await self.ai_service.ask(
+                        question,
+                        conversation_id=f"discord:{ctx.channel.id}:{ctx.author.id}",
+                        user_id=f"discord:{ctx.author.id}",
+                        channel="discord"
+                    )
+                    for part in token_budget.split("discord", response):
+                        await ctx.send(part)
+            await self._submit(ctx.channel, self._job_key(ctx.guild, ctx.author), job)
         
         @self.bot.command(name="emails")
         async def emails_command(ctx, count: int = 5):
-            async with ctx.typing():
-                emails = self.email_service.get_recent_emails(count)
-                response = "\n".join([f"- {e}" for e in emails[:5]])
-                await ctx.send(response or "No emails found")
+            async def job():
+                async with ctx.typing():
+                    # Mail fetches block, so keep them off the event loop
+                    emails = await asyncio.to_thread(self.email_service.get_recent_emails, count)
+                    response = "\n".join([f"- {e}" for e in emails[:5]])
+                    await ctx.send(response or "No emails found")
+            await self._submit(ctx.channel, self._job_key(ctx.guild, ctx.author), job)
         
         @self.bot.command(name="calendar")
         async def calendar_command(ctx, days: int = 7):
-            async with ctx.typing():
-                events = self.calendar_service.get_upcoming_events(days)
-                response = "\n".join([f"- {e}" for e in events[:5]])
-                await ctx.send(response or "No events found")
+            async def job():
+                async with ctx.typing():
+                    events = await asyncio.to_thread(self.calendar_service.get_upcoming_events, days, 5)
+                    response = "\n".join([f"- {e}" for e in events[:5]])
+                    await ctx.send(response or "No events found")
+            await self._submit(ctx.channel, self._job_key(ctx.guild, ctx.author), job)
+        
+        @self.bot.command(name="briefing")
+        async def briefing_command(ctx):
+            async def job():
+                async with ctx.typing():
+                    digest = await self.intent_router.briefing_service.digest("discord", ctx.author.id)
+                    for part in token_budget.split("discord", digest):
+                        await ctx.send(part)
+            await self._submit(ctx.channel, self._job_key(ctx.guild, ctx.author), job)
         
         @self.bot.command(name="remind")
         async def remind_command(ctx, time_str: str, *, message: str):
             self.reminder_service.schedule_reminder(time_str, message, "discord", ctx.author.id)
             await ctx.send(f"Reminder set for {time_str}")
     
+    async def _deliver_reminder(self, reminder: dict):
+        """Deliver a due reminder as a DM"""
+        content = f"⏰ Reminder: {reminder['message']}"[:2000]
+        if self.bot.is_ready():
+            user = await self.bot.fetch_user(int(reminder["user_id"]))
+            await user.send(content)
+            return
+        # No gateway here (e.g. users who only use slash commands): DM through the REST API
+        headers = {"Authorization": f"Bot {self.token}"}
+        response = await http_clients.post(f"{DISCORD_API}/users/@me/channels",
+                                           json={"recipient_id": str(reminder["user_id"])}, headers=headers)
+        response.raise_for_status()
+        response = await http_clients.post(f"{DISCORD_API}/channels/{response.json()['id']}/messages",
+                                           json={"content": content}, headers=headers)
+        response.raise_for_status()
+    
+    def _job_key(self, guild, author) -> str:
+        """Concurrency is capped per guild; DMs are capped per user"""
+        return f"guild:{guild.id}" if guild else f"dm:{author.id}"
+    
+    async def _submit(self, channel, key: str, job: Callable[[], Awaitable[None]]):
+        """Queue a job, telling the user when it has to wait or can't be accepted"""
+        async def tracked():
+            with metrics.request("discord"):
+                await job()
+        try:
+            ahead = self.jobs.submit(key, tracked)
+        except QueueFull:
+            await channel.send("I'm busy right now, please try again in a minute.")
+            return
+        if ahead:
+            await channel.send(f"Busy, queued #{ahead}")
+    
     async def _handle_message(self, message):
         """Handle direct messages"""
         if isinstance(message.channel, discord.DMChannel):
-            response = await self.ai_service.ask(message.content)
-            await message.reply(response[:2000])
+            async def job():
+                response = await self.intent_router.handle(message.content, "discord", message.author.id)
+                if response is None:
+                    response = await self.ai_service.ask(
+                        message.content,
+                        conversation_id=f"discord:{message.channel.id}",
+                        user_id=f"discord:{message.author.id}",
+                        channel="discord"
+                    )
+                parts = token_budget.split("discord", response) or ["No response"]
+                await message.reply(parts[0])
+                for part in parts[1:]:
+                    await message.channel.send(part)
+            await self._submit(message.channel, self._job_key(None, message.author), job)
         else:
             await self.bot.process_commands(message)
     
-    async def handle_interaction(self, data: dict):
-        # Handle Discord's PING verification
-                if data.get("type") == 1:
-                                return {"type": 1}  # PONG response
-                            
-                # Handle other interaction types here
-            return {"type": 4, "data": {"content": "Interaction received"}}
+    async def handle_interaction(self, data: dict) -> dict:
+        """Response for an HTTP interaction; deferred work goes through the job queue"""
+        response, follow_up = self.interactions.handle(data)
+        if follow_up is not None:
+            user = (data.get("member") or {}).get("user") or data.get("user") or {}
+            key = f"guild:{data['guild_id']}" if data.get("guild_id") else f"dm:{user.get('id')}"
+            try:
+                self.jobs.submit(key, follow_up)
+            except QueueFull:
+                return {"type": 4, "data": {"content": "I'm busy right now, please try again in a minute."}}
+        return response
     
     def is_running(self) -> bool:
         """Check if bot is running"""
@@ -83,3 +183,18 @@ class DiscordService:
             self.bot.run(self.token)
         else:
             logger.error("Discord token not configured")
+    
+    def start_gateway(self):
+        """Connect the bot inside the running event loop (the elected leader's in multi-worker mode)"""
+        if not self.token:
+            logger.error("Discord token not configured")
+            return
+        if self._gateway is None or self._gateway.done():
+            self._gateway = asyncio.create_task(self.bot.start(self.token))
+    
+    async def stop(self):
+        if self._gateway is not None:
+            await self.bot.close()
+            await asyncio.gather(self._gateway, return_exceptions=True)
+            self._gateway = None
+        await self.jobs.stop()
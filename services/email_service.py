@@ -1,38 +1,58 @@
 import os
 import logging
 from typing import List
+from services.email_sync import HeaderCache, MailAccount, MailSync
 
 logger = logging.getLogger(__name__)
 
 class EmailService:
     """Email service for Gmail and Outlook"""
-    
+
     def __init__(self):
         self.gmail_email = os.getenv("GMAIL_EMAIL")
         self.gmail_password = os.getenv("GMAIL_APP_PASSWORD")
         self.outlook_email = os.getenv("OUTLOOK_EMAIL")
         self.outlook_password = os.getenv("OUTLOOK_APP_PASSWORD")
-    
+        self.idle = os.getenv("EMAIL_IDLE", "false").lower() == "true"
+        self.sync = MailSync(
+            self._accounts(),
+            HeaderCache(os.getenv("EMAIL_CACHE_PATH", ":memory:"), int(os.getenv("EMAIL_CACHE_KEEP", "500")))
+        )
+
+    def _accounts(self) -> List[MailAccount]:
+        """IMAP accounts to sync; EMAIL_BACKEND=local swaps in in-process stand-in servers"""
+        local = os.getenv("EMAIL_BACKEND", "imap").lower() == "local"
+        accounts = []
+        if self.gmail_email:
+            accounts.append(MailAccount(
+                "Gmail", "local" if local else os.getenv("GMAIL_IMAP_HOST", "imap.gmail.com"),
+                self.gmail_email, self.gmail_password
+            ))
+        if self.outlook_email:
+            accounts.append(MailAccount(
+                "Outlook", "local" if local else os.getenv("OUTLOOK_IMAP_HOST", "outlook.office365.com"),
+                self.outlook_email, self.outlook_password
+            ))
+        if local and not accounts:
+            accounts.append(MailAccount("Local", "local", "", ""))
+        return accounts
+
     def get_recent_emails(self, count: int = 5) -> List[str]:
-        """Get recent emails from configured accounts"""
-        emails = []
-        
+        """Get recent emails from configured accounts (served from the local header cache)"""
+        if not self.sync.accounts:
+            return []
         try:
-            if self.gmail_email:
-                emails.extend(self._get_gmail_emails(count))
-            if self.outlook_email:
-                emails.extend(self._get_outlook_emails(count))
+            if self.idle:
+                self.sync.start_idle()
+            self.sync.refresh()
+            return self.sync.recent(count)
         except Exception as e:
             logger.error(f"Error fetching emails: {e}")
-        
-        return emails[:count]
-    
-    def _get_gmail_emails(self, count: int) -> List[str]:
-        """Fetch emails from Gmail"""
-        # Placeholder - implement Gmail API integration
-        return [f"Gmail email {i}" for i in range(count)]
-    
-    def _get_outlook_emails(self, count: int) -> List[str]:
-        """Fetch emails from Outlook"""
-        # Placeholder - implement Outlook integration
-        return [f"Outlook email {i}" for i in range(count)]
+            return []
+
+    def stop(self):
+        """Close IMAP connections, end IDLE threads and release the sync pool"""
+        self.sync.stop()
+
+    def stats(self) -> dict:
+        return self.sync.stats()
@@ -0,0 +1,378 @@
+import re
+import os
+import time
+import email
+import email.policy
+import imaplib
+import logging
+import socket
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_UIDVALIDITY = re.compile(rb"UIDVALIDITY (\d+)")
+_UIDNEXT = re.compile(rb"UIDNEXT (\d+)")
+_FETCH_UID = re.compile(rb"UID (\d+)")
+_HEADER_FIELDS = "(UID BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)])"
+
+class MailAccount:
+    """One IMAP mailbox to keep in sync"""
+    __slots__ = ("name", "host", "port", "username", "password", "mailbox")
+
+    def __init__(self, name: str, host: str, username: str, password: str,
+                 port: int = 993, mailbox: str = "INBOX"):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.mailbox = mailbox
+
+class IMAPConnection:
+    """The few IMAP operations the sync engine needs, over imaplib"""
+
+    def __init__(self, account: MailAccount):
+        self._imap = imaplib.IMAP4_SSL(account.host, account.port)
+        self._imap.login(account.username, account.password)
+
+    def status(self, mailbox: str) -> Tuple[int, int]:
+        """(UIDVALIDITY, UIDNEXT) of a mailbox"""
+        _, data = self._imap.status(mailbox, "(UIDVALIDITY UIDNEXT)")
+        return int(_UIDVALIDITY.search(data[0]).group(1)), int(_UIDNEXT.search(data[0]).group(1))
+
+    def fetch_headers(self, mailbox: str, start_uid: int) -> List[dict]:
+        """Headers of every message with UID >= start_uid, in one round trip"""
+        self._imap.select(mailbox, readonly=True)
+        _, data = self._imap.uid("FETCH", f"{start_uid}:*", _HEADER_FIELDS)
+        headers = []
+        for item in data:
+            if not isinstance(item, tuple):
+                continue
+            uid = int(_FETCH_UID.search(item[0]).group(1))
+            # 'n:*' returns the newest message even when n is past the end
+            if uid >= start_uid:
+                headers.append(_parse_header(uid, item[1]))
+        return headers
+
+    def idle(self, mailbox: str, timeout: float) -> bool:
+        """Block in IMAP IDLE until new mail arrives (True) or timeout passes (False)"""
+        self._imap.select(mailbox, readonly=True)
+        tag = self._imap._new_tag()
+        self._imap.send(tag + b" IDLE\r\n")
+        if not self._imap.readline().startswith(b"+"):
+            raise imaplib.IMAP4.error("server refused IDLE")
+        self._imap.sock.settimeout(timeout)
+        arrived = False
+        try:
+            while not arrived:
+                line = self._imap.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connection closed during IDLE")
+                arrived = line.rstrip().endswith(b"EXISTS")
+        except TimeoutError:
+            # Nothing new: the normal refresh path. A file object that timed out
+            # refuses further reads, so DONE is read from a fresh one.
+            self._imap.file = self._imap.sock.makefile("rb")
+        finally:
+            self._imap.sock.settimeout(None)
+        self._imap.send(b"DONE\r\n")
+        while True:
+            line = self._imap.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed ending IDLE")
+            if line.startswith(tag):
+                return arrived
+
+    def interrupt(self):
+        """Break a blocked idle() from another thread"""
+        try:
+            self._imap.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        try:
+            self._imap.logout()
+        except Exception:
+            pass
+
+class LocalIMAP:
+    """In-process stand-in for an IMAP server, with the IMAPConnection interface.
+
+    Used for tests and offline runs (EMAIL_BACKEND=local); deliver() adds
+    mail and wakes anything idling on the mailbox.
+    """
+
+    def __init__(self, uidvalidity: int = 1):
+        self.uidvalidity = uidvalidity
+        self._mailboxes: Dict[str, List[dict]] = {}
+        self._uidnext: Dict[str, int] = {}
+        self._changed = threading.Condition()
+        self._interrupts = 0
+
+    def deliver(self, sender: str, subject: str, mailbox: str = "INBOX",
+                received: Optional[float] = None) -> int:
+        with self._changed:
+            uid = self._uidnext.get(mailbox, 1)
+            self._uidnext[mailbox] = uid + 1
+            self._mailboxes.setdefault(mailbox, []).append({
+                "uid": uid, "sender": sender, "subject": subject,
+                "received": time.time() if received is None else received
+            })
+            self._changed.notify_all()
+        return uid
+
+    def reset(self, uidvalidity: int):
+        """Renumber the mailboxes, as a server does when UIDs are invalidated"""
+        with self._changed:
+            self.uidvalidity = uidvalidity
+            for mailbox, messages in self._mailboxes.items():
+                for uid, message in enumerate(messages, 1):
+                    message["uid"] = uid
+                self._uidnext[mailbox] = len(messages) + 1
+
+    def status(self, mailbox: str) -> Tuple[int, int]:
+        with self._changed:
+            return self.uidvalidity, self._uidnext.get(mailbox, 1)
+
+    def fetch_headers(self, mailbox: str, start_uid: int) -> List[dict]:
+        with self._changed:
+            return [dict(m) for m in self._mailboxes.get(mailbox, []) if m["uid"] >= start_uid]
+
+    def idle(self, mailbox: str, timeout: float) -> bool:
+        with self._changed:
+            uidnext = self._uidnext.get(mailbox, 1)
+            interrupts = self._interrupts
+            self._changed.wait_for(lambda: self._uidnext.get(mailbox, 1) != uidnext
+                                   or self._interrupts != interrupts, timeout)
+            return self._uidnext.get(mailbox, 1) != uidnext
+
+    def interrupt(self):
+        with self._changed:
+            self._interrupts += 1
+            self._changed.notify_all()
+
+    def close(self):
+        pass
+
+# Servers behind EMAIL_BACKEND=local, one per account name
+local_servers: Dict[str, LocalIMAP] = {}
+
+def connect(account: MailAccount):
+    """Open a connection to an account's server ('local' hosts use a LocalIMAP)"""
+    if account.host == "local":
+        return local_servers.setdefault(account.name, LocalIMAP())
+    return IMAPConnection(account)
+
+def _parse_header(uid: int, raw: bytes) -> dict:
+    message = email.message_from_bytes(raw, policy=email.policy.default)
+    try:
+        received = parsedate_to_datetime(str(message["Date"])).timestamp()
+    except (TypeError, ValueError):
+        received = 0.0
+    return {
+        "uid": uid, "sender": str(message["From"] or ""),
+        "subject": str(message["Subject"] or "(no subject)"), "received": received
+    }
+
+class HeaderCache:
+    """Compact SQLite cache of message headers plus per-mailbox sync state"""
+
+    def __init__(self, path: str = ":memory:", keep: int = 500):
+        self.keep = keep
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS mailboxes ("
+            "account TEXT, mailbox TEXT, uidvalidity INTEGER, uidnext INTEGER, "
+            "PRIMARY KEY (account, mailbox));"
+            "CREATE TABLE IF NOT EXISTS headers ("
+            "account TEXT, mailbox TEXT, uid INTEGER, received REAL, sender TEXT, subject TEXT, "
+            "PRIMARY KEY (account, mailbox, uid));"
+            "CREATE INDEX IF NOT EXISTS headers_received ON headers (received DESC);"
+        )
+        self._lock = threading.Lock()
+
+    def state(self, account: str, mailbox: str) -> Optional[Tuple[int, int]]:
+        """Stored (UIDVALIDITY, UIDNEXT), or None if the mailbox was never synced"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT uidvalidity, uidnext FROM mailboxes WHERE account = ? AND mailbox = ?",
+                (account, mailbox)
+            ).fetchone()
+
+    def store(self, account: str, mailbox: str, uidvalidity: int, uidnext: int, headers: List[dict],
+              reset: bool = False):
+        """Save newly fetched headers and the new sync state in one transaction"""
+        with self._lock, self._db:
+            if reset:
+                self._db.execute("DELETE FROM headers WHERE account = ? AND mailbox = ?", (account, mailbox))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?, ?)",
+                [(account, mailbox, h["uid"], h["received"], h["sender"], h["subject"]) for h in headers]
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO mailboxes VALUES (?, ?, ?, ?)", (account, mailbox, uidvalidity, uidnext)
+            )
+            # Only the newest headers are worth keeping
+            self._db.execute(
+                "DELETE FROM headers WHERE account = ? AND mailbox = ? AND uid NOT IN ("
+                "SELECT uid FROM headers WHERE account = ? AND mailbox = ? ORDER BY uid DESC LIMIT ?)",
+                (account, mailbox, account, mailbox, self.keep)
+            )
+
+    def recent(self, count: int) -> List[Tuple[str, str, str]]:
+        """Newest (account, sender, subject) across every mailbox"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT account, sender, subject FROM headers ORDER BY received DESC LIMIT ?", (count,)
+            ).fetchall()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM headers").fetchone()[0]
+
+class MailSync:
+    """Incremental header sync for a set of IMAP accounts.
+
+    Each sync compares the server's UIDVALIDITY/UIDNEXT with the cached
+    state and fetches only the headers of new messages (everything is
+    refetched if UIDVALIDITY changed). Accounts sync concurrently, reads
+    are served from the local cache and a stale cache is refreshed in the
+    background. With IDLE enabled, new mail is pushed into the cache as it
+    arrives.
+    """
+
+    def __init__(self, accounts: List[MailAccount], cache: HeaderCache,
+                 connector: Callable[[MailAccount], object] = connect):
+        self.accounts = accounts
+        self.cache = cache
+        self.connector = connector
+        self.max_age = float(os.getenv("EMAIL_SYNC_INTERVAL", "60"))
+        self.initial_fetch = int(os.getenv("EMAIL_INITIAL_FETCH", "50"))
+        self.idle_timeout = float(os.getenv("EMAIL_IDLE_TIMEOUT", "1500"))  # servers drop IDLE after ~29 min
+        self._connections: Dict[str, object] = {}
+        self._account_locks = {account.name: threading.Lock() for account in accounts}
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(accounts)), thread_name_prefix="mail-sync")
+        self._refreshing = threading.Lock()
+        self._idle_threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._idling: Dict[str, object] = {}
+        self.last_sync: Optional[float] = None
+        self.counters = {"syncs": 0, "unchanged": 0, "fetched": 0, "resets": 0, "errors": 0, "idle_wakeups": 0}
+
+    def sync_account(self, account: MailAccount, connection=None) -> int:
+        """Bring one mailbox's cache up to date; returns the number of new headers"""
+        with self._account_locks[account.name]:
+            try:
+                connection = connection or self._connection(account)
+                uidvalidity, uidnext = connection.status(account.mailbox)
+                state = self.cache.state(account.name, account.mailbox)
+                reset = state is not None and state[0] != uidvalidity
+                if state is not None and not reset and state[1] >= uidnext:
+                    self.counters["unchanged"] += 1
+                    return 0
+                start = state[1] if state and not reset else max(1, uidnext - self.initial_fetch)
+                headers = connection.fetch_headers(account.mailbox, start)
+                self.cache.store(account.name, account.mailbox, uidvalidity, uidnext, headers, reset)
+                self.counters["resets"] += reset
+                self.counters["fetched"] += len(headers)
+                return len(headers)
+            except Exception as e:
+                self.counters["errors"] += 1
+                self._drop_connection(account)
+                logger.error(f"Error syncing {account.name}: {e}")
+                return 0
+            finally:
+                self.counters["syncs"] += 1
+
+    def sync_all(self):
+        """Sync every account concurrently"""
+        list(self._pool.map(self.sync_account, self.accounts))
+        self.last_sync = time.monotonic()
+
+    def refresh(self):
+        """Sync now if the cache is empty, in the background if it is merely stale"""
+        if self.last_sync is None:
+            with self._refreshing:
+                if self.last_sync is None:
+                    self.sync_all()
+        elif time.monotonic() - self.last_sync > self.max_age and self._refreshing.acquire(blocking=False):
+            def background():
+                try:
+                    self.sync_all()
+                finally:
+                    self._refreshing.release()
+            # Not on self._pool: sync_all fans out to that pool and would wait on its own worker
+            threading.Thread(target=background, daemon=True, name="mail-refresh").start()
+
+    def recent(self, count: int) -> List[str]:
+        return [f"[{account}] {sender}: {subject}" for account, sender, subject in self.cache.recent(count)]
+
+    def start_idle(self):
+        """Hold an IDLE connection per account that syncs whenever new mail arrives"""
+        if self._idle_threads:
+            return
+        self._stopping.clear()
+        for account in self.accounts:
+            thread = threading.Thread(target=self._idle_loop, args=(account,), daemon=True,
+                                      name=f"mail-idle-{account.name}")
+            thread.start()
+            self._idle_threads.append(thread)
+
+    def _idle_loop(self, account: MailAccount):
+        backoff = 1.0
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                # IDLE ties up its connection, so it gets its own
+                connection = self._idling[account.name] = self.connector(account)
+                while not self._stopping.is_set():
+                    if connection.idle(account.mailbox, self.idle_timeout):
+                        self.counters["idle_wakeups"] += 1
+                        self.sync_account(account)
+                    backoff = 1.0
+            except Exception as e:
+                if self._stopping.is_set():
+                    break
+                logger.warning(f"IDLE for {account.name} dropped: {e}; reconnecting in {backoff:.0f}s")
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, 300)
+            finally:
+                self._idling.pop(account.name, None)
+                if connection is not None:
+                    connection.close()
+
+    def _connection(self, account: MailAccount):
+        connection = self._connections.get(account.name)
+        if connection is None:
+            connection = self._connections[account.name] = self.connector(account)
+        return connection
+
+    def _drop_connection(self, account: MailAccount):
+        connection = self._connections.pop(account.name, None)
+        if connection is not None:
+            connection.close()
+
+    def stop(self):
+        self._stopping.set()
+        self._idle_threads = []
+        for connection in list(self._idling.values()):
+            connection.interrupt()
+        for account in self.accounts:
+            self._drop_connection(account)
+        self._pool.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "accounts": len(self.accounts),
+            "cached_headers": self.cache.size(),
+            "idle": len(self._idle_threads),
+            "last_sync_age": round(time.monotonic() - self.last_sync, 1) if self.last_sync else None
+        }
@@ -0,0 +1,127 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class HTTPClientManager:
+    """App-lifetime pooled HTTP client shared by every outbound call"""
+
+    def __init__(self):
+        self.max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.max_keepalive = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+        self.keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+        self.per_host_limit = int(os.getenv("HTTP_PER_HOST_LIMIT", "20"))
+        self.timeout = float(os.getenv("HTTP_TIMEOUT", "30"))
+        self.http2 = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._in_use: Dict[str, int] = {}
+        self._waiting: Dict[str, int] = {}
+
+    async def startup(self):
+        """Create the shared client (FastAPI lifespan startup hook)"""
+        if self._client is None:
+            self._client = self._build_client()
+
+    async def shutdown(self):
+        """Close pooled connections (FastAPI lifespan shutdown hook)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared client; created on first use outside the FastAPI lifespan"""
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 requested but 'h2' is not installed; using HTTP/1.1")
+                http2 = False
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        return httpx.AsyncClient(limits=limits, http2=http2, timeout=self.timeout)
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str):
+        """Hold one of the per-host connection slots for the duration of a request"""
+        host = urlsplit(url).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.per_host_limit)
+        self._waiting[host] = self._waiting.get(host, 0) + 1
+        try:
+            await slot.acquire()
+        finally:
+            self._waiting[host] -= 1
+        self._in_use[host] = self._in_use.get(host, 0) + 1
+        try:
+            yield
+        finally:
+            self._in_use[host] -= 1
+            slot.release()
+
+    def _propagate(self, kwargs: dict):
+        """Add the current trace's traceparent header, if a sampled trace is active"""
+        traceparent = metrics.traceparent()
+        if traceparent:
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), "traceparent": traceparent}
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request through the shared pool"""
+        self._propagate(kwargs)
+        async with self._host_slot(url):
+            return await self.client.request(method, url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """Stream a response through the shared pool"""
+        self._propagate(kwargs)
+        async with self._host_slot(url):
+            async with self.client.stream(method, url, **kwargs) as response:
+                yield response
+
+    def stats(self) -> dict:
+        """Pool usage: requests in use/waiting per host and pooled connections"""
+        connections = []
+        if self._client is not None:
+            pool = getattr(self._client._transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for conn in connections if conn.is_idle())
+        hosts = {
+            host: {"in_use": self._in_use.get(host, 0), "waiting": self._waiting.get(host, 0)}
+            for host in self._host_slots
+        }
+        return {
+            "in_use": sum(self._in_use.values()),
+            "waiting": sum(self._waiting.values()),
+            "idle": idle,
+            "connections": len(connections),
+            "max_connections": self.max_connections,
+            "max_keepalive": self.max_keepalive,
+            "per_host_limit": self.per_host_limit,
+            "hosts": hosts
+        }
+
+http_clients = HTTPClientManager()
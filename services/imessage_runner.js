@@ -0,0 +1,38 @@
+// Long-lived iMessage sender for `osascript -l JavaScript`.
+// Reads one JSON request per line on stdin ({"id", "to", "text"}) and answers
+// each with {"id", "ok"[, "error"]} on stdout. Text never becomes script source.
+ObjC.import("Foundation");
+
+const input = $.NSFileHandle.fileHandleWithStandardInput;
+const output = $.NSFileHandle.fileHandleWithStandardOutput;
+const Messages = Application("Messages");
+
+function reply(obj) {
+    output.writeData($(JSON.stringify(obj) + "\n").dataUsingEncoding($.NSUTF8StringEncoding));
+}
+
+function send(request) {
+    const buddy = Messages.buddies.whose({ handle: request.to })[0];
+    Messages.send(request.text, { to: buddy });
+}
+
+let buffer = "";
+while (true) {
+    const data = input.availableData;
+    if (data.length === 0) break;  // stdin closed
+    buffer += $.NSString.alloc.initWithDataEncoding(data, $.NSUTF8StringEncoding).js;
+    let newline;
+    while ((newline = buffer.indexOf("\n")) >= 0) {
+        const line = buffer.slice(0, newline);
+        buffer = buffer.slice(newline + 1);
+        if (!line) continue;
+        let request = { id: null };
+        try {
+            request = JSON.parse(line);
+            send(request);
+            reply({ id: request.id, ok: true });
+        } catch (e) {
+            reply({ id: request.id, ok: false, error: String(e) });
+        }
+    }
+}
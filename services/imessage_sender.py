@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import shlex
+import asyncio
+import logging
+import itertools
+from collections import deque
+from typing import Deque, Dict, List, Optional, Union
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RUNNER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imessage_runner.js")
+DEFAULT_RUNNER = f"osascript -l JavaScript {shlex.quote(RUNNER_SCRIPT)}"
+
+class RunnerError(Exception):
+    """The runner process died or stopped answering"""
+
+class SendError(Exception):
+    """A message was not sent: the queue stayed full, the script refused it, or retries ran out"""
+
+class ScriptRunner:
+    """Long-lived helper process speaking line-delimited JSON.
+
+    Each request is written as {"id", ...fields} on stdin and answered with a
+    line carrying the same id on stdout. Payloads are data, never script
+    source, so message text can't inject into the script. A runner that dies
+    or stops answering is restarted on the next batch.
+    """
+
+    def __init__(self, command: List[str], timeout: float = 10.0):
+        self.command = command
+        self.timeout = timeout
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._waiting: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self.starts = 0
+
+    async def _ensure_process(self):
+        if self._process is None or self._process.returncode is not None:
+            self._process = await asyncio.create_subprocess_exec(
+                *self.command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE
+            )
+            self._reader = asyncio.create_task(self._read(self._process))
+            self.starts += 1
+
+    async def _read(self, process: asyncio.subprocess.Process):
+        async for line in process.stdout:
+            try:
+                reply = json.loads(line)
+            except ValueError:
+                logger.warning(f"Ignoring runner output: {line[:200]!r}")
+                continue
+            future = self._waiting.pop(reply.get("id"), None)
+            if future is not None and not future.done():
+                future.set_result(reply)
+        # stdout closed: whatever is still waiting will never be answered. Take
+        # them before awaiting, so requests for a restarted runner aren't failed too.
+        orphaned = list(self._waiting.values())
+        self._waiting.clear()
+        error = RunnerError(f"runner exited with {await process.wait()}")
+        for future in orphaned:
+            if not future.done():
+                future.set_exception(error)
+
+    async def run_batch(self, requests: List[dict]) -> List[Union[dict, Exception]]:
+        """Send requests in one write; returns each reply (or the error that prevented one) in order"""
+        await self._ensure_process()
+        loop = asyncio.get_running_loop()
+        futures, lines = [], []
+        for request in requests:
+            request_id = next(self._ids)
+            futures.append(self._waiting.setdefault(request_id, loop.create_future()))
+            lines.append(json.dumps({**request, "id": request_id}))
+        try:
+            self._process.stdin.write(("\n".join(lines) + "\n").encode())
+            await self._process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            await self._kill()
+            return [RunnerError(f"runner unavailable: {e}")] * len(requests)
+
+        _, pending = await asyncio.wait(futures, timeout=self.timeout * len(requests))
+        if pending:
+            logger.error(f"Runner stopped answering; restarting it ({len(pending)} unanswered)")
+            await self._kill()
+        return [
+            RunnerError("runner timed out") if not future.done() or future.cancelled()
+            else future.exception() or future.result()
+            for future in futures
+        ]
+
+    async def _kill(self):
+        for future in self._waiting.values():
+            future.cancel()
+        self._waiting.clear()
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
+        # The old reader must finish before a new process shares _waiting
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    async def close(self):
+        if self._process is not None and self._process.returncode is None:
+            self._process.stdin.close()
+            try:
+                await asyncio.wait_for(self._process.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                await self._kill()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+        self._process = None
+
+class _Outgoing:
+    __slots__ = ("to", "text", "enqueued_at", "attempts", "sent")
+
+    def __init__(self, to: str, text: str, sent: Optional[asyncio.Future] = None):
+        self.to = to
+        self.text = text
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.sent = sent
+
+    def resolve(self, error: Optional[Exception] = None):
+        if self.sent is not None and not self.sent.done():
+            if error is None:
+                self.sent.set_result(None)
+            else:
+                self.sent.set_exception(error)
+
+class iMessageSender:
+    """Bounded outbound iMessage queue sent in batches through one ScriptRunner.
+
+    A single batching loop feeds the runner, which sends a batch's lines in
+    order, so messages to each recipient go out in the order they were
+    queued. If the runner crashes mid-batch, the unanswered messages are
+    resent ahead of anything newer. Errors the script reports (e.g. unknown
+    buddy) are not retried.
+    """
+
+    def __init__(self, runner: ScriptRunner, maxsize: int = 500, batch_size: int = 20,
+                 linger: float = 0.05, max_retries: int = 3, enqueue_timeout: float = 5.0):
+        self.runner = runner
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_retries = max_retries
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._retry: Deque[_Outgoing] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._latencies = deque(maxlen=1000)
+        self.counters = {"enqueued": 0, "sent": 0, "failed": 0, "retries": 0, "rejected": 0, "batches": 0}
+
+    def _ensure_started(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.create_task(self._run())
+
+    async def send(self, to: str, text: str) -> bool:
+        """Queue a message, waiting up to enqueue_timeout for space; False if it couldn't be queued"""
+        return await self._put(_Outgoing(to, text))
+
+    async def deliver(self, to: str, text: str):
+        """Queue a message and wait until it has been sent; raises SendError if it wasn't"""
+        item = _Outgoing(to, text, asyncio.get_running_loop().create_future())
+        if not await self._put(item):
+            raise SendError(f"iMessage queue full; message to {to} not queued")
+        await item.sent
+
+    async def _put(self, item: _Outgoing) -> bool:
+        self._ensure_started()
+        try:
+            await asyncio.wait_for(self._queue.put(item), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.counters["rejected"] += 1
+            logger.warning(f"iMessage queue full, dropping message to {item.to}")
+            return False
+        self.counters["enqueued"] += 1
+        return True
+
+    async def _next_batch(self) -> List[_Outgoing]:
+        batch = [self._retry.popleft() for _ in range(min(len(self._retry), self.batch_size))]
+        if not batch:
+            batch.append(await self._queue.get())
+            if self.linger and self._queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.linger)
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            self.counters["batches"] += 1
+            try:
+                with metrics.stage("delivery", "imessage"):
+                    results = await self.runner.run_batch([{"to": item.to, "text": item.text} for item in batch])
+            except asyncio.CancelledError:
+                for item in batch:
+                    item.resolve(SendError("iMessage sender stopped"))
+                raise
+            except Exception as e:
+                results = [e] * len(batch)
+            retry = []
+            for item, result in zip(batch, results):
+                if isinstance(result, dict):
+                    if result.get("ok"):
+                        self.counters["sent"] += 1
+                        self._latencies.append(time.monotonic() - item.enqueued_at)
+                        item.resolve()
+                    else:
+                        self.counters["failed"] += 1
+                        metrics.error("imessage_delivery")
+                        logger.error(f"iMessage to {item.to} failed: {result.get('error')}")
+                        item.resolve(SendError(f"iMessage to {item.to} failed: {result.get('error')}"))
+                    continue
+                item.attempts += 1
+                if item.attempts > self.max_retries:
+                    self.counters["failed"] += 1
+                    metrics.error("imessage_delivery")
+                    logger.error(f"iMessage to {item.to} failed after {item.attempts} attempts: {result}")
+                    item.resolve(SendError(f"iMessage to {item.to} failed after {item.attempts} attempts: {result}"))
+                else:
+                    retry.append(item)
+            if retry:
+                self.counters["retries"] += len(retry)
+                self._retry.extendleft(reversed(retry))
+                await asyncio.sleep(min(30.0, 0.5 * 2 ** (retry[0].attempts - 1)))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Whoever is still waiting on a delivery learns it didn't happen
+        unsent = list(self._retry) + ([self._queue.get_nowait() for _ in range(self._queue.qsize())] if self._queue else [])
+        self._retry.clear()
+        for item in unsent:
+            item.resolve(SendError("iMessage sender stopped"))
+        await self.runner.close()
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            **self.counters,
+            "depth": (self._queue.qsize() if self._queue else 0) + len(self._retry),
+            "runner_starts": self.runner.starts,
+            "avg_batch": round(self.counters["sent"] / self.counters["batches"], 2) if self.counters["batches"] else 0.0,
+            "latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+        }
+
+def create_sender() -> iMessageSender:
+    """Sender configured from IMESSAGE_* settings"""
+    runner = ScriptRunner(
+        shlex.split(os.getenv("IMESSAGE_RUNNER", DEFAULT_RUNNER)),
+        timeout=float(os.getenv("IMESSAGE_SEND_TIMEOUT", "10"))
+    )
+    return iMessageSender(
+        runner,
+        maxsize=int(os.getenv("IMESSAGE_QUEUE_SIZE", "500")),
+        batch_size=int(os.getenv("IMESSAGE_BATCH_SIZE", "20")),
+        linger=float(os.getenv("IMESSAGE_BATCH_LINGER_MS", "50")) / 1000,
+        max_retries=int(os.getenv("IMESSAGE_SEND_RETRIES", "3")),
+        enqueue_timeout=float(os.getenv("IMESSAGE_ENQUEUE_TIMEOUT", "5"))
+    )
+
+if __name__ == "__main__":
+    # Stand-in runner for non-Mac hosts: IMESSAGE_RUNNER="python -m services.imessage_sender"
+    for line in sys.stdin:
+        if line.strip():
+            request = json.loads(line)
+            print(f"iMessage to {request.get('to')}: {request.get('text')}", file=sys.stderr)
+            print(json.dumps({"id": request.get("id"), "ok": True}), flush=True)
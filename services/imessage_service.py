@@ -1,41 +1,83 @@
+import os
+import hmac
+import hashlib
 import logging
-import subprocess
+from typing import Optional
+from services.intent_router import IntentRouter
+from services.imessage_sender import create_sender
+from services.metrics import metrics
+from services.token_budget import token_budget
+from services.llm_scheduler import identity_for
+from services.briefing_service import BriefingService
 
 logger = logging.getLogger(__name__)
 
 class iMessageService:
     """iMessage service for Mac"""
     
-    def __init__(self, ai_service, email_service, calendar_service, reminder_service):
+    def __init__(self, ai_service, email_service, calendar_service, reminder_service,
+                 intent_router: Optional[IntentRouter] = None):
         self.ai_service = ai_service
         self.email_service = email_service
         self.calendar_service = calendar_service
         self.reminder_service = reminder_service
+        self.intent_router = intent_router or IntentRouter(
+            email_service, calendar_service, reminder_service,
+            BriefingService(ai_service, email_service, calendar_service, reminder_service)
+        )
+        # One long-lived script runner sends batches, instead of an osascript process per message
+        self.sender = create_sender()
+        self.reminder_service.register_delivery("imessage", self._deliver_reminder)
+        # The Mac bridge signs each webhook body with this shared secret
+        self.webhook_secret = os.getenv("IMESSAGE_WEBHOOK_SECRET")
+        # Local development only: accept unsigned webhooks when there is no secret to check them with
+        self.skip_signature = os.getenv("IMESSAGE_SKIP_SIGNATURE", "false").lower() == "true"
+        if not self.webhook_secret and not self.skip_signature:
+            logger.error("IMESSAGE_WEBHOOK_SECRET not set; rejecting all iMessage webhooks")
     
     async def handle_message(self, data: dict):
         """Handle incoming iMessage"""
         try:
+            await self.process_message(data)
+        except Exception as e:
+            logger.error(f"iMessage error: {e}")
+    
+    def verify_signature(self, body: bytes, signature: Optional[str]) -> bool:
+        """Check X-Bridge-Signature: hex HMAC-SHA256 of the raw body, keyed by IMESSAGE_WEBHOOK_SECRET"""
+        if not self.webhook_secret:
+            return self.skip_signature
+        if not signature:
+            return False
+        digest = hmac.new(self.webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(digest, signature.strip().lower())
+    
+    async def process_message(self, data: dict):
+        """Answer one incoming message and wait for the reply to be sent; raises so the inbound queue can retry it"""
+        # An exception escaping the request is counted as its error
+        with metrics.request("imessage"):
             from_contact = data.get('from', '')
             message_body = data.get('body', '')
             
-            response = await self.ai_service.ask(message_body)
-            await self.send_imessage(from_contact, response)
-        except Exception as e:
-            logger.error(f"iMessage error: {e}")
+            response = await self.intent_router.handle(message_body, "imessage", from_contact or None)
+            if response is None:
+                response = await self.ai_service.ask(
+                    message_body, conversation_id=f"imessage:{from_contact}" if from_contact else None,
+                    user_id=identity_for("imessage", from_contact) if from_contact else None, channel="imessage"
+                )
+            # The inbound queue only marks the event done once every part has been sent
+            for part in token_budget.split("imessage", response):
+                await self.sender.deliver(from_contact, part)
+    
+    async def _deliver_reminder(self, reminder: dict):
+        """Deliver a due reminder back to the sender; raises if it wasn't sent, so it is retried"""
+        await self.sender.deliver(reminder["user_id"], f"Reminder: {reminder['message']}")
     
     async def send_imessage(self, to_contact: str, message: str) -> bool:
-        """Send an iMessage on Mac"""
-        try:
-            script = f'''
-            tell application "Messages"
-                send "{message}" to buddy "{to_contact}"
-            end tell
-            '''
-            subprocess.run(
-                ['osascript', '-e', script],
-                check=True
-            )
-            return True
-        except Exception as e:
-            logger.error(f"Failed to send iMessage: {e}")
-            return False
+        """Queue an iMessage; returns False if the outbound queue stayed full"""
+        return await self.sender.send(to_contact, message)
+    
+    async def stop(self):
+        await self.sender.stop()
+    
+    def stats(self) -> dict:
+        return self.sender.stats()
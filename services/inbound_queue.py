@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, List, Optional, Tuple
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str, dict], Awaitable[None]]
+
+class InboundQueue:
+    """Durable queue between webhook ACKs and message processing (SQLite, WAL).
+
+    put() commits the event to INBOUND_DB_PATH and returns, so a webhook
+    answers in the time of one local write however slow the model is. The
+    default is a file in the working directory; an ACKed message survives a
+    restart only if that file does, so ephemeral hosts (serverless) need it
+    on persistent storage. A UNIQUE (channel, dedupe key) constraint turns
+    provider retries (same MessageSid) into no-ops.
+    Workers claim one event at a time under a lease. An event whose worker
+    died mid-way is claimed again once the lease runs out, so delivery is
+    at-least-once. Handlers return only after the reply has been sent, so an
+    event is never marked done while its reply sits in an in-memory outbox. A sender's events are processed one at a time in arrival
+    order, retries included, so replies keep their order. With
+    INBOUND_DB_PATH on a shared file, the workers of every process drain the
+    same queue.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("INBOUND_DB_PATH", "inbound.db")
+        if self.path == ":memory:":
+            logger.warning("INBOUND_DB_PATH=:memory: - webhooks are ACKed before processing, so queued "
+                           "messages are lost on restart and providers will not resend them")
+        self.workers = int(os.getenv("INBOUND_WORKERS", "8"))
+        self.max_attempts = int(os.getenv("INBOUND_MAX_ATTEMPTS", "3"))
+        self.lease = float(os.getenv("INBOUND_LEASE_SECONDS", "300"))
+        self.poll_interval = float(os.getenv("INBOUND_POLL_INTERVAL", "1"))
+        self.retention = float(os.getenv("INBOUND_RETENTION_HOURS", "24")) * 3600
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS inbound ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT, dedupe_key TEXT, sender TEXT, payload TEXT, "
+            "status TEXT, attempts INTEGER DEFAULT 0, available_at REAL, lease_until REAL, "
+            "created_at REAL, finished_at REAL, UNIQUE (channel, dedupe_key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS inbound_ready ON inbound (status, available_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS inbound_by_sender ON inbound (sender, status)")
+        self._handler: Optional[Handler] = None
+        self._signals: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._last_prune = 0.0
+        self.counters = {"accepted": 0, "duplicates": 0, "processed": 0, "retried": 0, "failed": 0, "reclaimed": 0}
+
+    async def start(self, handler: Handler):
+        """Start the workers; handler(channel, payload) should raise to have the event retried"""
+        if self._tasks:
+            return
+        self._handler = handler
+        self._signals = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def put(self, channel: str, dedupe_key: str, sender: str, payload: dict) -> bool:
+        """Persist an inbound event; False if the same (channel, dedupe_key) was seen before"""
+        with metrics.stage("ingest", channel):
+            accepted = await asyncio.to_thread(self._insert, channel, dedupe_key, sender, payload)
+        if not accepted:
+            self.counters["duplicates"] += 1
+            return False
+        self.counters["accepted"] += 1
+        if self._signals is not None:
+            self._signals.put_nowait(None)
+        return True
+
+    def _insert(self, channel: str, dedupe_key: str, sender: str, payload: dict) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO inbound (channel, dedupe_key, sender, payload, status, available_at, created_at) "
+                "VALUES (?, ?, ?, ?, 'pending', ?, ?)",
+                (channel, dedupe_key, f"{channel}:{sender}", json.dumps(payload), now, now)
+            )
+        return cursor.rowcount == 1
+
+    def _claim(self) -> Optional[Tuple[int, str, dict, int, float, bool]]:
+        """Lease the oldest ready event whose sender has nothing earlier still unfinished"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, channel, payload, attempts, created_at, status FROM inbound AS event "
+                    "WHERE ((status = 'pending' AND available_at <= ?) OR (status = 'processing' AND lease_until < ?)) "
+                    "AND NOT EXISTS (SELECT 1 FROM inbound AS earlier WHERE earlier.sender = event.sender "
+                    "AND earlier.id < event.id AND earlier.status IN ('pending', 'processing')) "
+                    "ORDER BY id LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE inbound SET status = 'processing', lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                        (now + self.lease, row[0])
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        event_id, channel, payload, attempts, created_at, status = row
+        return event_id, channel, json.loads(payload), attempts + 1, created_at, status == "processing"
+
+    def _update(self, statement: str, params: tuple):
+        with self._lock:
+            self._db.execute(statement, params)
+
+    def _prune(self):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM inbound WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - self.retention,)
+            )
+
+    async def _worker(self):
+        while True:
+            try:
+                claimed = await asyncio.to_thread(self._claim)
+            except Exception as e:
+                logger.error(f"Inbound queue claim failed: {e}")
+                claimed = None
+            if claimed is None:
+                if time.time() - self._last_prune > 60:
+                    self._last_prune = time.time()
+                    await asyncio.to_thread(self._prune)
+                try:
+                    await asyncio.wait_for(self._signals.get(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(*claimed)
+
+    async def _process(self, event_id: int, channel: str, payload: dict, attempt: int, created_at: float,
+                       reclaimed: bool):
+        if reclaimed:
+            self.counters["reclaimed"] += 1
+            logger.warning(f"Reprocessing {channel} event {event_id} after an expired lease")
+        metrics.observe("inbound_wait", max(0.0, time.time() - created_at), channel)
+        try:
+            await self._handler(channel, payload)
+        except asyncio.CancelledError:
+            # Shutting down: hand the event straight back instead of waiting out the lease
+            self._update("UPDATE inbound SET status = 'pending', attempts = attempts - 1 WHERE id = ?", (event_id,))
+            raise
+        except Exception as e:
+            metrics.error("inbound")
+            if attempt >= self.max_attempts:
+                self.counters["failed"] += 1
+                logger.error(f"Giving up on {channel} event {event_id} after {attempt} attempts: {e}")
+                await asyncio.to_thread(self._update, "UPDATE inbound SET status = 'failed', finished_at = ? WHERE id = ?",
+                                        (time.time(), event_id))
+            else:
+                self.counters["retried"] += 1
+                delay = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning(f"{channel} event {event_id} failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                await asyncio.to_thread(self._update, "UPDATE inbound SET status = 'pending', available_at = ? WHERE id = ?",
+                                        (time.time() + delay, event_id))
+            return
+        self.counters["processed"] += 1
+        await asyncio.to_thread(self._update, "UPDATE inbound SET status = 'done', finished_at = ? WHERE id = ?",
+                                (time.time(), event_id))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        with self._lock:
+            depth = dict(self._db.execute("SELECT status, COUNT(*) FROM inbound GROUP BY status").fetchall())
+        return {**self.counters, "workers": len(self._tasks), "by_status": depth}
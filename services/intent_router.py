@@ -0,0 +1,191 @@
+import os
+import re
+import math
+import asyncio
+import logging
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# e.g. '30m', '2h', '1d', '45 m'
+DURATION_PATTERN = re.compile(r'(\d+)\s*(m|h|d)', re.IGNORECASE)
+REMINDER_TASK_PATTERN = re.compile(r'\bto\s+(.+)$', re.IGNORECASE | re.DOTALL)
+_WORD = re.compile(r"[a-z']+")
+
+_DURATION_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+def parse_duration(text: str) -> Optional[Tuple[str, timedelta]]:
+    """Find the first duration in text; returns its short form ('30m') and value"""
+    match = DURATION_PATTERN.search(text)
+    if not match:
+        return None
+    value, unit = int(match.group(1)), match.group(2).lower()
+    return f"{value}{unit}", timedelta(**{_DURATION_UNITS[unit]: value})
+
+def _command(*patterns: str) -> "re.Pattern":
+    """Match only when the message starts as one of these commands (after an optional 'please')"""
+    return re.compile(r"^\s*(?:please\s+)?(?:" + "|".join(patterns) + ")", re.IGNORECASE | re.DOTALL)
+
+_MAIL = r"(?:e-?mails?|mail|inbox|gmail|outlook)"
+_AGENDA = r"(?:calendar|schedule|agenda)"
+
+# Cheap first stage, checked in priority order. Patterns are anchored to
+# command phrasing: a keyword inside an open-ended request ("help me write an
+# email", "a good schedule for learning Go") is left to the LLM.
+KEYWORD_INTENTS: List[Tuple[str, "re.Pattern"]] = [
+    ("remind", _command(r"remind\s+me\b(?=.*\d+\s*[mhd])")),
+    ("briefing", _command(
+        r"(?:(?:give|send|show)\s+me\s+)?(?:my\s+|the\s+|a\s+)?(?:daily\s+|morning\s+)?(?:briefing|digest)\b",
+        r"(?:how|what)(?:'s|\s+is|\s+does)\s+my\s+day\b",
+    )),
+    ("email", _command(
+        rf"(?:check|show|list|read|get)\s+(?:me\s+)?(?:my\s+)?(?:new\s+|recent\s+|unread\s+|latest\s+)?{_MAIL}\b",
+        rf"(?:what|which|any)\s+(?:new\s+|unread\s+)?{_MAIL}(?:\s+(?:do|did)\s+i\s+(?:have|get)|\s+for\s+me)?\s*\??\s*$",
+        rf"what(?:'s|\s+is)\s+(?:new\s+)?in\s+my\s+{_MAIL}\b",
+        rf"(?:my\s+)?{_MAIL}\s*\??\s*$",
+    )),
+    ("calendar", _command(
+        rf"(?:check|show|list|open)\s+(?:me\s+)?(?:my\s+)?(?:{_AGENDA}|events|meetings)\b",
+        rf"what(?:'s|\s+is)\s+(?:on\s+)?my\s+{_AGENDA}\b",
+        r"(?:what|which)\s+(?:events|meetings)\s+(?:do\s+)?i\s+have\b",
+        rf"(?:my\s+)?{_AGENDA}\s*\??\s*$",
+    )),
+]
+
+# Seed phrases for the optional classifier stage
+TRAINING_PHRASES: Dict[str, List[str]] = {
+    "remind": [
+        "ping me in 10m about the oven", "don't let me forget to call mom in 2h",
+        "alert me in 1d to pay rent", "nudge me in 30m to stretch",
+    ],
+    "email": [
+        "any new mail", "did anyone write to me", "check my messages from work",
+        "what's new in my mail", "show unread mail",
+    ],
+    "calendar": [
+        "what's on tomorrow", "am i free this afternoon", "what meetings do i have today",
+        "when is my next appointment", "what do i have on friday",
+    ],
+    "briefing": [
+        "what's my day look like", "give me a rundown of today", "catch me up on everything",
+        "morning summary please", "what do i need to know today",
+    ],
+    "chat": [
+        "what is the capital of france", "write me a poem about cats", "explain how vaccines work",
+        "help me write a cover letter", "what's the difference between a list and a tuple",
+        "tell me a joke", "how do i cook rice", "summarize the french revolution",
+    ],
+}
+
+class NaiveBayesClassifier:
+    """Tiny multinomial naive Bayes over word unigrams"""
+
+    def __init__(self, examples: Dict[str, List[str]]):
+        self.word_counts: Dict[str, Counter] = {}
+        self.totals: Dict[str, int] = {}
+        self.priors: Dict[str, float] = {}
+        total_examples = sum(len(phrases) for phrases in examples.values())
+        for label, phrases in examples.items():
+            counts = Counter(word for phrase in phrases for word in _WORD.findall(phrase.lower()))
+            self.word_counts[label] = counts
+            self.totals[label] = sum(counts.values())
+            self.priors[label] = math.log(len(phrases) / total_examples)
+        self.vocabulary = len(set().union(*self.word_counts.values()))
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        """Most likely label and its posterior probability"""
+        words = _WORD.findall(text.lower())
+        scores = {}
+        for label, counts in self.word_counts.items():
+            denominator = self.totals[label] + self.vocabulary
+            scores[label] = self.priors[label] + sum(
+                math.log((counts[word] + 1) / denominator) for word in words
+            )
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1 / norm
+
+class IntentRouter:
+    """Routes messages to cheap local handlers, leaving only open-ended ones for the LLM"""
+
+    def __init__(self, email_service, calendar_service, reminder_service, briefing_service=None):
+        self.email_service = email_service
+        self.calendar_service = calendar_service
+        self.reminder_service = reminder_service
+        self.briefing_service = briefing_service
+        self.classifier = None
+        if os.getenv("INTENT_CLASSIFIER", "false").lower() == "true":
+            self.classifier = NaiveBayesClassifier(TRAINING_PHRASES)
+        self.classifier_threshold = float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", "0.8"))
+        self.counters: Counter = Counter()
+
+    def route(self, message: str) -> Tuple[str, str]:
+        """Classify a message; returns (intent, stage) where intent 'chat' means the LLM"""
+        for intent, pattern in KEYWORD_INTENTS:
+            if pattern.search(message):
+                return self._count(intent, "keyword")
+
+        if self.classifier is not None:
+            intent, confidence = self.classifier.classify(message)
+            if intent != "chat" and confidence >= self.classifier_threshold:
+                return self._count(intent, "classifier")
+
+        return self._count("chat", "llm")
+
+    def _count(self, intent: str, stage: str) -> Tuple[str, str]:
+        self.counters[f"{stage}:{intent}"] += 1
+        return intent, stage
+
+    async def handle(self, message: str, platform: str, user_id: Optional[str] = None) -> Optional[str]:
+        """Answer the message locally, or return None if it needs the LLM"""
+        with metrics.stage("route", platform):
+            intent, _ = self.route(message)
+
+        if intent == "remind":
+            reply = self._handle_remind(message, platform, user_id)
+            if reply is None:
+                self._count("chat", "fallthrough")
+            return reply
+
+        if intent == "briefing":
+            if self.briefing_service is None:
+                return None
+            return await self.briefing_service.digest(platform, user_id)
+
+        # Provider fetches block, so run them off the event loop
+        if intent == "email":
+            emails = await asyncio.to_thread(self.email_service.get_recent_emails, 3)
+            return "Your emails:\n" + "\n".join(emails[:3]) if emails else "No emails found"
+
+        if intent == "calendar":
+            events = await asyncio.to_thread(self.calendar_service.get_upcoming_events, 7, 3)
+            return "Your upcoming events:\n" + "\n".join(events[:3]) if events else "No events found"
+
+        return None
+
+    def _handle_remind(self, message: str, platform: str, user_id: Optional[str]) -> Optional[str]:
+        """Parse reminder: "Remind me in 30m to do something"; None if it can't be set here"""
+        duration = parse_duration(message)
+        # Without a time or a way to deliver, it's the LLM's to answer
+        if duration is None or not self.reminder_service.has_delivery(platform):
+            return None
+
+        task = REMINDER_TASK_PATTERN.search(message)
+        self.reminder_service.schedule_reminder(
+            duration[0], task.group(1).strip() if task else message, platform, user_id
+        )
+        return f"Reminder set for {duration[0]}"
+
+    def stats(self) -> dict:
+        # A fallthrough was already counted under the intent it was first routed to
+        routed = sum(count for key, count in self.counters.items() if not key.startswith("fallthrough:"))
+        to_llm = self.counters["llm:chat"] + self.counters["fallthrough:chat"]
+        return {
+            **self.counters,
+            "total": routed,
+            "llm_avoided": routed - to_llm,
+            "llm_avoided_ratio": (routed - to_llm) / routed if routed else 0.0
+        }
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Job = Tuple[str, Callable[[], Awaitable[None]], float]
+
+class QueueFull(Exception):
+    """The job queue is at capacity"""
+
+class JobQueue:
+    """Bounded job queue drained by a worker pool, with a concurrency cap per key (e.g. guild)"""
+
+    def __init__(self, name: str, workers: int = 8, maxsize: int = 200, per_key_limit: int = 2):
+        self.name = name
+        self.workers = workers
+        self.maxsize = maxsize
+        self.per_key_limit = per_key_limit
+        self._queue: Optional[asyncio.Queue] = None
+        self._deferred: Dict[str, Deque[Job]] = defaultdict(deque)
+        self._active: Dict[str, int] = defaultdict(int)
+        self._depth = 0
+        self._tasks: List[asyncio.Task] = []
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    def _ensure_started(self):
+        if not self._tasks:
+            self._queue = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, key: str, job: Callable[[], Awaitable[None]]) -> int:
+        """Queue a job; returns how many jobs are waiting ahead of it (0 = starts right away).
+
+        Raises QueueFull when maxsize jobs are already waiting.
+        """
+        self._ensure_started()
+        if self._depth >= self.maxsize:
+            self.counters["rejected"] += 1
+            raise QueueFull(f"{self.name} queue is full")
+        ahead = max(0, self._depth + self.busy - self.workers + 1)
+        if self._active.get(key, 0) >= self.per_key_limit:
+            ahead = max(ahead, len(self._deferred.get(key, ())) + 1)
+        self._depth += 1
+        self.counters["submitted"] += 1
+        self._queue.put_nowait((key, job, time.monotonic()))
+        return ahead
+
+    @property
+    def busy(self) -> int:
+        return sum(self._active.values())
+
+    async def _worker(self):
+        while True:
+            key, job, enqueued_at = await self._queue.get()
+            if self._active[key] >= self.per_key_limit or key in self._deferred:
+                # Park it behind this key's earlier jobs until one of its running jobs finishes
+                self._deferred[key].append((key, job, enqueued_at))
+                continue
+            self._active[key] += 1
+            try:
+                while True:
+                    await self._run(key, job, enqueued_at)
+                    # The slot passes straight to the key's oldest parked job, so a key's jobs
+                    # start in submission order and don't wait behind the whole queue again
+                    deferred = self._deferred.get(key)
+                    if not deferred:
+                        break
+                    _, job, enqueued_at = deferred.popleft()
+                    if not deferred:
+                        del self._deferred[key]
+            finally:
+                self._active[key] -= 1
+                if not self._active[key]:
+                    del self._active[key]
+
+    async def _run(self, key: str, job: Callable[[], Awaitable[None]], enqueued_at: float):
+        self._depth -= 1
+        metrics.observe("queue_wait", time.monotonic() - enqueued_at, self.name)
+        try:
+            await job()
+            self.counters["completed"] += 1
+        except Exception as e:
+            self.counters["failed"] += 1
+            metrics.error(self.name)
+            logger.error(f"{self.name} job for {key} failed: {e}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "queued": self._depth,
+            "running": self.busy,
+            "workers": self.workers,
+            "keys_at_limit": sum(1 for count in self._active.values() if count >= self.per_key_limit)
+        }
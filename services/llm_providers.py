@@ -0,0 +1,496 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+from services.http_client import http_clients
+from services.rate_limiter import AdaptiveConcurrency, Slot, UpstreamLimiter
+from services.conversation_service import estimate_tokens
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class ProviderError(Exception):
+    """An LLM provider failed to produce a response"""
+
+class LLMProvider:
+    """Interface every LLM backend implements"""
+    reports_usage = False  # True if complete() records real token usage itself
+
+    name = "provider"
+
+    def is_configured(self) -> bool:
+        return True
+
+    async def complete(self, messages: List[dict], max_tokens: int, temperature: float, user_id: str) -> str:
+        raise NotImplementedError
+
+    async def stream(self, messages: List[dict], max_tokens: int, temperature: float,
+                     user_id: str) -> AsyncIterator[str]:
+        """Yield response text as it arrives; defaults to one chunk from complete()"""
+        yield await self.complete(messages, max_tokens, temperature, user_id)
+
+    def stats(self) -> dict:
+        return {}
+
+def limiter_from_env(prefix: str, name: str) -> UpstreamLimiter:
+    """Build an UpstreamLimiter from <PREFIX>_REQUESTS_PER_SECOND etc."""
+    return UpstreamLimiter(
+        name,
+        requests_per_second=float(os.getenv(f"{prefix}_REQUESTS_PER_SECOND", "5")),
+        tokens_per_minute=float(os.getenv(f"{prefix}_TOKENS_PER_MINUTE", "500000")),
+        concurrency=AdaptiveConcurrency(
+            initial=int(os.getenv(f"{prefix}_CONCURRENCY", "8")),
+            maximum=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", "64")),
+            latency_target=float(os.getenv(f"{prefix}_LATENCY_TARGET", "5"))
+        )
+    )
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Any /v1/chat/completions API (OpenAI, Mistral, local servers)"""
+    reports_usage = True
+
+    def __init__(self, name: str, api_url: str, api_key: Optional[str], model: str,
+                 limiter: Optional[UpstreamLimiter] = None, queue_timeout: float = 10.0, max_retries: int = 2):
+        self.name = name
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.limiter = limiter
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+
+    def is_configured(self) -> bool:
+        return bool(self.api_url and self.api_key)
+
+    def _headers(self) -> dict:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+    def _payload(self, messages: List[dict], max_tokens: int, temperature: float, stream: bool = False) -> dict:
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream
+        }
+
+    def _estimated_tokens(self, messages: List[dict], max_tokens: int) -> int:
+        return sum(estimate_tokens(m["content"]) for m in messages) + max_tokens
+
+    @asynccontextmanager
+    async def _slot(self, user_id: str, tokens: int, timeout: float):
+        """The limiter's admission slot, or an unlimited one when no limiter is configured"""
+        if self.limiter is None:
+            yield Slot(tokens)
+            return
+        async with self.limiter.slot(user_id, tokens, timeout) as slot:
+            yield slot
+
+    async def complete(self, messages: List[dict], max_tokens: int, temperature: float, user_id: str) -> str:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        for attempt in range(self.max_retries + 1):
+            async with self._slot(user_id, self._estimated_tokens(messages, max_tokens),
+                                  deadline - loop.time()) as slot:
+                response = await http_clients.post(
+                    self.api_url,
+                    headers=self._headers(),
+                    json=self._payload(messages, max_tokens, temperature),
+                    timeout=30.0
+                )
+                result = response.json() if response.status_code == 200 else {}
+                slot.record(response.status_code, (result.get("usage") or {}).get("total_tokens"))
+
+            if response.status_code == 200:
+                usage = result.get("usage") or {}
+                content = result["choices"][0]["message"]["content"]
+                metrics.count_tokens(
+                    self.name,
+                    usage.get("prompt_tokens", _prompt_tokens(messages)),
+                    usage.get("completion_tokens", estimate_tokens(content))
+                )
+                return content
+
+            # Back off and retry rate-limited requests while the deadline allows
+            delay = _retry_after(response)
+            if response.status_code != 429 or attempt == self.max_retries or loop.time() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
+
+        logger.error(f"{self.name} API error: {response.status_code} - {response.text}")
+        raise ProviderError(f"{self.name} API error: {response.status_code}")
+
+    async def stream(self, messages: List[dict], max_tokens: int, temperature: float,
+                     user_id: str) -> AsyncIterator[str]:
+        async with self._slot(user_id, self._estimated_tokens(messages, max_tokens), self.queue_timeout) as slot, \
+                http_clients.stream(
+                    "POST",
+                    self.api_url,
+                    headers=self._headers(),
+                    json=self._payload(messages, max_tokens, temperature, stream=True),
+                    timeout=30.0
+                ) as response:
+            slot.record(response.status_code)
+            if response.status_code != 200:
+                body = await response.aread()
+                logger.error(f"{self.name} API error: {response.status_code} - {body.decode(errors='replace')}")
+                raise ProviderError(f"{self.name} API error: {response.status_code}")
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                chunk = line[len("data:"):].strip()
+                if chunk == "[DONE]":
+                    break
+                delta = json.loads(chunk)["choices"][0].get("delta", {})
+                if delta.get("content"):
+                    yield delta["content"]
+
+    def stats(self) -> dict:
+        return {"limiter": self.limiter.stats()} if self.limiter else {}
+
+def _prompt_tokens(messages: List[dict]) -> int:
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+def _retry_after(response) -> float:
+    value = response.headers.get("Retry-After", "")
+    return float(value) if value.replace(".", "", 1).isdigit() else 1.0
+
+class MistralProvider(OpenAICompatibleProvider):
+    """Mistral AI chat completions"""
+
+    def __init__(self):
+        super().__init__(
+            "mistral",
+            os.getenv("MISTRAL_API_URL", "https://api.mistral.ai/v1/chat/completions"),
+            os.getenv("MISTRAL_API_KEY"),
+            os.getenv("MISTRAL_MODEL", "mistral-tiny"),
+            limiter=limiter_from_env("MISTRAL", "Mistral"),
+            queue_timeout=float(os.getenv("MISTRAL_QUEUE_TIMEOUT", "10")),
+            max_retries=int(os.getenv("MISTRAL_MAX_RETRIES", "2"))
+        )
+
+class OpenAIProvider(OpenAICompatibleProvider):
+    """OpenAI (or any OpenAI-compatible endpoint via OPENAI_API_URL)"""
+
+    def __init__(self):
+        super().__init__(
+            "openai",
+            os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions"),
+            os.getenv("OPENAI_API_KEY"),
+            os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+            limiter=limiter_from_env("OPENAI", "OpenAI"),
+            queue_timeout=float(os.getenv("OPENAI_QUEUE_TIMEOUT", "10")),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+        )
+
+class MacBridgeProvider(LLMProvider):
+    """ChatGPT web driven by the Mac bridge"""
+
+    name = "bridge"
+
+    def __init__(self):
+        self.mac_bridge_url = os.getenv("MAC_BRIDGE_URL")
+
+    def is_configured(self) -> bool:
+        return bool(self.mac_bridge_url)
+
+    async def complete(self, messages: List[dict], max_tokens: int, temperature: float, user_id: str) -> str:
+        # The bridge takes one message plus free-form context
+        context = [messages[0]["content"]] if messages[0]["role"] == "system" else []
+        context.extend(f"{m['role']}: {m['content']}" for m in messages[1:-1])
+        payload = {
+            "message": messages[-1]["content"],
+            "context": "\n".join(context)
+        }
+
+        try:
+            response = await http_clients.post(
+                f"{self.mac_bridge_url}/chat",
+                json=payload,
+                timeout=30.0
+            )
+            data = response.json()
+        except Exception as e:
+            raise ProviderError(f"Failed to connect to Mac bridge: {str(e)}")
+        if "response" not in data:
+            raise ProviderError("No response received")
+        return data["response"]
+
+class MockProvider(LLMProvider):
+    """Local stand-in with configurable latency and failure rate (for development and load tests)"""
+
+    name = "mock"
+
+    def __init__(self):
+        self.latency = float(os.getenv("MOCK_LLM_LATENCY", "0.2"))
+        self.error_rate = float(os.getenv("MOCK_LLM_ERROR_RATE", "0"))
+        self.tokens_per_second = float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "50"))
+
+    def _reply(self, messages: List[dict]) -> str:
+        return f"Mock reply to: {messages[-1]['content']}"
+
+    async def complete(self, messages: List[dict], max_tokens: int, temperature: float, user_id: str) -> str:
+        await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            raise ProviderError("mock provider injected failure")
+        return self._reply(messages)
+
+    async def stream(self, messages: List[dict], max_tokens: int, temperature: float,
+                     user_id: str) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            raise ProviderError("mock provider injected failure")
+        for word in self._reply(messages).split(" "):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield word + " "
+
+PROVIDERS = {
+    "mistral": MistralProvider,
+    "openai": OpenAIProvider,
+    "bridge": MacBridgeProvider,
+    "mock": MockProvider,
+}
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one trial request through after reset_timeout"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allows(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._trial_in_flight)
+
+    def on_attempt(self):
+        if self.state == "half_open":
+            self._trial_in_flight = True
+
+    def on_abandon(self):
+        self._trial_in_flight = False
+
+    def on_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def on_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+class ProviderHealth:
+    """Rolling latency and error-rate window for one provider"""
+
+    def __init__(self, window: int = 200):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("AI_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("AI_BREAKER_RESET_SECONDS", "30"))
+        )
+
+    def record(self, latency: float, ok: bool):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+            self.breaker.on_success()
+        else:
+            self.breaker.on_failure()
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+class ProviderRouter:
+    """Picks providers by rolling latency and error rate, hedging slow calls and failing over"""
+
+    def __init__(self, providers: List[LLMProvider]):
+        self.providers = providers
+        self.health = {provider.name: ProviderHealth() for provider in providers}
+        self.default_latency = float(os.getenv("AI_DEFAULT_LATENCY", "2.0"))
+        # Seconds before a hedge request goes to the next provider: a number, 'auto' (primary p95) or 0 to disable
+        self.hedge_delay = os.getenv("AI_HEDGE_DELAY", "auto")
+        self.counters = {"hedged": 0, "hedge_wins": 0, "failovers": 0}
+
+    def ranked(self) -> List[LLMProvider]:
+        """Providers whose breaker allows traffic, best score first"""
+        def score(indexed):
+            index, provider = indexed
+            health = self.health[provider.name]
+            p50 = health.percentile(0.5) or self.default_latency
+            p95 = health.percentile(0.95) or self.default_latency
+            # Configured order breaks near-ties in favour of earlier providers
+            return (p50 + p95) / 2 * (1 + 4 * health.error_rate) * (1 + 0.1 * index)
+
+        available = [(i, p) for i, p in enumerate(self.providers) if self.health[p.name].breaker.allows()]
+        return [provider for _, provider in sorted(available, key=score)]
+
+    def _hedge_after(self, provider: LLMProvider) -> Optional[float]:
+        if self.hedge_delay == "auto":
+            return self.health[provider.name].percentile(0.95) or self.default_latency
+        delay = float(self.hedge_delay)
+        return delay if delay > 0 else None
+
+    async def _attempt(self, provider: LLMProvider, messages: List[dict], max_tokens: int,
+                       temperature: float, user_id: str) -> str:
+        health = self.health[provider.name]
+        health.breaker.on_attempt()
+        started = time.monotonic()
+        try:
+            with metrics.stage("upstream_total", provider.name):
+                result = await provider.complete(messages, max_tokens, temperature, user_id)
+        except asyncio.CancelledError:
+            # A hedge loser was cancelled; that says nothing about the provider's health
+            health.breaker.on_abandon()
+            raise
+        except Exception:
+            health.record(time.monotonic() - started, ok=False)
+            metrics.error(f"provider_{provider.name}")
+            raise
+        health.record(time.monotonic() - started, ok=True)
+        if not provider.reports_usage:
+            metrics.count_tokens(provider.name, _prompt_tokens(messages), estimate_tokens(result))
+        return result
+
+    async def complete(self, messages: List[dict], max_tokens: int, temperature: float, user_id: str) -> str:
+        """Complete on the best provider, hedging to the next one if it is slow"""
+        candidates = self.ranked()
+        if not candidates:
+            raise ProviderError("No AI provider available")
+
+        errors = []
+        pending = {}
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            provider = candidates[next_index]
+            next_index += 1
+            task = asyncio.ensure_future(self._attempt(provider, messages, max_tokens, temperature, user_id))
+            pending[task] = provider
+
+        launch()
+        try:
+            while pending:
+                hedge = self._hedge_after(candidates[0]) if next_index < len(candidates) and len(pending) == 1 else None
+                done, _ = await asyncio.wait(pending, timeout=hedge, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary is slow: race it against the next provider
+                    self.counters["hedged"] += 1
+                    launch()
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None:
+                        if provider is not candidates[0]:
+                            self.counters["hedge_wins" if pending else "failovers"] += 1
+                        return task.result()
+                    errors.append(f"{provider.name}: {task.exception()}")
+                    logger.warning(f"Provider {provider.name} failed: {task.exception()}")
+                if not pending and next_index < len(candidates):
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise ProviderError("All AI providers failed (" + "; ".join(errors) + ")")
+
+    async def stream(self, messages: List[dict], max_tokens: int, temperature: float,
+                     user_id: str) -> AsyncIterator[str]:
+        """Stream from the best provider, failing over if one errors before its first token"""
+        errors = []
+        for index, provider in enumerate(self.ranked()):
+            health = self.health[provider.name]
+            health.breaker.on_attempt()
+            started = time.monotonic()
+            streamed = False
+            completion = 0
+            try:
+                async for chunk in provider.stream(messages, max_tokens, temperature, user_id):
+                    if not streamed:
+                        metrics.observe("upstream_ttfb", time.monotonic() - started, provider.name)
+                    streamed = True
+                    completion += estimate_tokens(chunk)
+                    yield chunk
+            except Exception as e:
+                health.record(time.monotonic() - started, ok=False)
+                metrics.error(f"provider_{provider.name}")
+                if streamed:
+                    raise
+                errors.append(f"{provider.name}: {e}")
+                logger.warning(f"Provider {provider.name} failed: {e}")
+                continue
+            except BaseException:
+                # The consumer went away (client disconnect, cancellation): free a half-open trial
+                health.breaker.on_abandon()
+                raise
+            health.record(time.monotonic() - started, ok=True)
+            metrics.observe("upstream_total", time.monotonic() - started, provider.name)
+            metrics.count_tokens(provider.name, _prompt_tokens(messages), completion)
+            if index:
+                self.counters["failovers"] += 1
+            return
+        if not errors:
+            raise ProviderError("No AI provider available")
+        raise ProviderError("All AI providers failed (" + "; ".join(errors) + ")")
+
+    def stats(self) -> dict:
+        providers = {}
+        for provider in self.providers:
+            health = self.health[provider.name]
+            providers[provider.name] = {
+                "p50": health.percentile(0.5),
+                "p95": health.percentile(0.95),
+                "error_rate": round(health.error_rate, 3),
+                "breaker": health.breaker.state,
+                **provider.stats()
+            }
+        return {**self.counters, "providers": providers}
+
+def build_providers() -> List[LLMProvider]:
+    """Configured providers in preference order (AI_PROVIDERS, or derived from AI_MODE)"""
+    names = os.getenv("AI_PROVIDERS")
+    if names:
+        order = [name.strip() for name in names.split(",") if name.strip()]
+    elif os.getenv("AI_MODE", "bridge") == "bridge":
+        order = ["bridge", "mistral", "openai"]
+    else:
+        order = ["mistral", "openai", "bridge"]
+
+    providers = []
+    for name in order:
+        if name not in PROVIDERS:
+            logger.warning(f"Unknown AI provider: {name}")
+            continue
+        provider = PROVIDERS[name]()
+        if provider.is_configured():
+            providers.append(provider)
+    return providers
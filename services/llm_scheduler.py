@@ -0,0 +1,271 @@
+import os
+import time
+import math
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+from services.rate_limiter import RateLimitExceeded
+from services.shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+# Highest priority first: interactive replies someone is waiting on, then
+# background work such as briefing summaries
+PRIORITIES = ("interactive", "background")
+DEFAULT_WEIGHTS = {"interactive": 8, "background": 1}
+DEFAULT_MAX_WAIT = {"interactive": 30, "background": 10}
+
+class QuotaExceeded(RateLimitExceeded):
+    """The identity has used its token quota for a window"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class LoadShed(RateLimitExceeded):
+    """The scheduler turned the request away to protect higher-priority work"""
+
+def identity_for(platform: str, user_id) -> str:
+    """Quota identity for a platform user ("discord:123"); ids that already carry the prefix are kept"""
+    user_id = str(user_id)
+    return user_id if user_id.startswith(f"{platform}:") else f"{platform}:{user_id}"
+
+class TokenQuota:
+    """Per-identity token quotas over sliding windows.
+
+    Usage lives in SharedState, so every worker charges the same counters.
+    Each window is a sliding window counter: the current fixed bucket plus
+    the previous one, weighted by how much of it still overlaps the window.
+    That costs two keys per window instead of a log of every request, and
+    tracks a true sliding window closely. Requests are admitted while usage
+    is under the limit and charged their real prompt and reply tokens after.
+    """
+
+    WINDOWS = (("hour", 3600), ("day", 86400))
+
+    def __init__(self, state: Optional[SharedState] = None):
+        self.state = state or SharedState()
+        self.limits = {
+            name: (seconds, int(os.getenv(f"QUOTA_TOKENS_PER_{name.upper()}", default)))
+            for (name, seconds), default in zip(self.WINDOWS, ("50000", "200000"))
+        }
+        self.exempt = {i.strip() for i in os.getenv("QUOTA_EXEMPT", "").split(",") if i.strip()}
+        self.counters = {"checked": 0, "exceeded": 0, "charged_tokens": 0}
+
+    def _usage(self, identity: str, seconds: int, now: float) -> tuple:
+        bucket = int(now // seconds)
+        current = int(self.state.get(f"quota:{identity}:{seconds}:{bucket}") or 0)
+        previous = int(self.state.get(f"quota:{identity}:{seconds}:{bucket - 1}") or 0)
+        overlap = 1 - (now % seconds) / seconds
+        return current, previous, overlap
+
+    async def _run(self, function, *args):
+        # SQLite-backed state blocks on disk; the in-process dict does not
+        if self.state.shared:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    async def check(self, identity: str):
+        """Raise QuotaExceeded if identity is over any window's limit"""
+        if identity not in self.exempt:
+            self.counters["checked"] += 1
+            await self._run(self._check, identity)
+
+    async def charge(self, identity: str, tokens: int):
+        """Add tokens actually used to every window"""
+        if identity not in self.exempt and tokens > 0:
+            self.counters["charged_tokens"] += tokens
+            await self._run(self._charge, identity, tokens)
+
+    def _check(self, identity: str):
+        now = time.time()
+        for name, (seconds, limit) in self.limits.items():
+            if limit <= 0:
+                continue
+            current, previous, overlap = self._usage(identity, seconds, now)
+            if current + previous * overlap < limit:
+                continue
+            self.counters["exceeded"] += 1
+            bucket_left = seconds - now % seconds
+            if current >= limit or previous == 0:
+                # Frees up only once this bucket becomes the (discounted) previous one
+                retry_after = bucket_left
+            else:
+                # The previous bucket's weight falls until usage drops under the limit
+                retry_after = bucket_left - (limit - current) / previous * seconds
+            retry_after = max(1.0, retry_after)
+            raise QuotaExceeded(
+                f"You've reached your usage limit for this {name}. "
+                f"Try again in about {math.ceil(retry_after / 60)} minutes.", retry_after
+            )
+
+    def _charge(self, identity: str, tokens: int):
+        now = time.time()
+        for seconds, limit in self.limits.values():
+            if limit > 0:
+                # Kept for two windows: the bucket is read as "previous" for one more
+                self.state.incr(f"quota:{identity}:{seconds}:{int(now // seconds)}", tokens, ttl=2 * seconds)
+
+    def stats(self) -> dict:
+        return {**self.counters, "limits": {name: limit for name, (_, limit) in self.limits.items()}}
+
+def _granted(future: asyncio.Future) -> bool:
+    return future.done() and not future.cancelled() and future.exception() is None
+
+class _Request:
+    __slots__ = ("future", "identity", "priority", "cost", "queued_at")
+
+    def __init__(self, future: asyncio.Future, identity: str, priority: str, cost: float):
+        self.future = future
+        self.identity = identity
+        self.priority = priority
+        self.cost = cost
+        self.queued_at = time.monotonic()
+
+class FairScheduler:
+    """Weighted-fair admission of LLM calls across priority classes and identities.
+
+    At most LLM_CONCURRENCY calls run at once; the rest wait here. Classes
+    share capacity by weight using start-time fair queueing over estimated
+    tokens: with weights 8:1, background work gets about a ninth of the
+    tokens while interactive work is waiting, and everything when it is
+    not. A class that was idle starts level with the virtual clock, so it
+    can't bank credit. Within a class identities take turns, so one heavy
+    user waits behind everyone else's next request.
+
+    Under load the lowest class is shed first. It is turned away once
+    LLM_SHED_BACKGROUND_AT requests are queued. When the queue reaches
+    LLM_MAX_QUEUE, a higher-priority arrival evicts the newest
+    lower-priority waiter, or is itself rejected. Requests waiting longer
+    than their class's LLM_MAX_WAIT_* also fail with LoadShed.
+    """
+
+    def __init__(self):
+        self.concurrency = int(os.getenv("LLM_CONCURRENCY", "8"))
+        self.max_queue = int(os.getenv("LLM_MAX_QUEUE", "64"))
+        self.shed_background_at = int(os.getenv("LLM_SHED_BACKGROUND_AT", str(self.max_queue // 4)))
+        self.weights = {p: float(os.getenv(f"LLM_WEIGHT_{p.upper()}", str(DEFAULT_WEIGHTS[p]))) for p in PRIORITIES}
+        self.max_wait = {p: float(os.getenv(f"LLM_MAX_WAIT_{p.upper()}", str(DEFAULT_MAX_WAIT[p]))) for p in PRIORITIES}
+        self.in_flight = 0
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Request]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._waiting = {p: 0 for p in PRIORITIES}
+        # Virtual start tag of each class's next request, and of the last one admitted
+        self._tags = {p: 0.0 for p in PRIORITIES}
+        self._clock = 0.0
+        self.counters = {"admitted": 0, "queued": 0, "shed": 0, "timed_out": 0,
+                         **{f"admitted_{p}": 0 for p in PRIORITIES}, **{f"shed_{p}": 0 for p in PRIORITIES}}
+
+    @asynccontextmanager
+    async def slot(self, identity: str, priority: str = "interactive", cost: float = 1.0):
+        await self.acquire(identity, priority, cost)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, identity: str, priority: str, cost: float):
+        """Wait for a turn; raises LoadShed if shed or not admitted within the class's max wait"""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority {priority!r}; expected one of {PRIORITIES}")
+        if self.in_flight < self.concurrency and not any(self._waiting.values()):
+            self._admitted(priority)
+            return
+        self._make_room(priority)
+
+        request = _Request(asyncio.get_running_loop().create_future(), identity, priority, cost)
+        if not self._waiting[priority]:
+            self._tags[priority] = max(self._tags[priority], self._clock)
+        self._queues[priority].setdefault(identity, deque()).append(request)
+        self._waiting[priority] += 1
+        self.counters["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(request.future), self.max_wait[priority])
+        except asyncio.TimeoutError:
+            if _granted(request.future):
+                return
+            self._remove(request)
+            self.counters["timed_out"] += 1
+            self._shed(priority)
+            raise LoadShed("The assistant is busy right now; please try again in a moment")
+        except asyncio.CancelledError:
+            if _granted(request.future):
+                self.release()
+            else:
+                self._remove(request)
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._pump()
+
+    def _admitted(self, priority: str):
+        self.in_flight += 1
+        self.counters["admitted"] += 1
+        self.counters[f"admitted_{priority}"] += 1
+
+    def _shed(self, priority: str):
+        self.counters["shed"] += 1
+        self.counters[f"shed_{priority}"] += 1
+
+    def _make_room(self, priority: str):
+        """Raise LoadShed for an arrival that can't queue, evicting lower-priority waiters if that helps"""
+        queued = sum(self._waiting.values())
+        lowest = PRIORITIES[-1]
+        if priority == lowest and queued >= self.shed_background_at:
+            self._shed(priority)
+            raise LoadShed("The assistant is busy; background work is paused")
+        if queued < self.max_queue:
+            return
+        for victim in reversed(PRIORITIES):
+            if victim == priority:
+                break
+            if self._waiting[victim]:
+                newest = max((r for q in self._queues[victim].values() for r in q), key=lambda r: r.queued_at)
+                newest.future.set_exception(LoadShed("The assistant is busy; background work was dropped"))
+                self._remove(newest)
+                self._shed(victim)
+                return
+        self._shed(priority)
+        raise LoadShed("The assistant is busy right now; please try again in a moment")
+
+    def _remove(self, request: _Request):
+        queue = self._queues[request.priority].get(request.identity)
+        if queue is None or request not in queue:
+            return
+        queue.remove(request)
+        if not queue:
+            del self._queues[request.priority][request.identity]
+        self._waiting[request.priority] -= 1
+        if not request.future.done():
+            request.future.cancel()
+
+    def _pump(self):
+        """Admit the waiting request with the lowest virtual start tag while capacity allows"""
+        while self.in_flight < self.concurrency:
+            active = [p for p in PRIORITIES if self._waiting[p]]
+            if not active:
+                return
+            # min() keeps PRIORITIES order on ties, so interactive wins those
+            priority = min(active, key=lambda p: self._tags[p])
+            queue = self._queues[priority]
+            identity, requests = next(iter(queue.items()))
+            request = requests.popleft()
+            if requests:
+                queue.move_to_end(identity)
+            else:
+                del queue[identity]
+            self._waiting[priority] -= 1
+            self._clock = self._tags[priority]
+            self._tags[priority] += request.cost / self.weights[priority]
+            self._admitted(priority)
+            request.future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "waiting": dict(self._waiting),
+            "identities_waiting": sum(len(q) for q in self._queues.values())
+        }
@@ -0,0 +1,255 @@
+import os
+import time
+import random
+import bisect
+import logging
+import contextvars
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers cache hits (sub-ms) through slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[str, ...]
+
+def _format_labels(names: Tuple[str, ...], values: LabelKey, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        return super().render() + [
+            f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in self.values.items()
+        ]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # Per label set: [bucket counts..., +Inf count], sum
+        self.values: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total[0]}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+class Span:
+    """One timed step of a sampled trace (W3C trace-context ids)"""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "end", "children", "error")
+
+    def __init__(self, trace_id: str, name: str, parent_id: Optional[str] = None, attributes: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.children: List["Span"] = []
+        self.error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name, "span_id": self.span_id, "parent_id": self.parent_id,
+            "duration_ms": round(((self.end or time.time()) - self.start) * 1000, 3),
+            **({"attributes": self.attributes} if self.attributes else {}),
+            **({"error": self.error} if self.error else {}),
+            **({"children": [child.to_dict() for child in self.children]} if self.children else {})
+        }
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace id, parent span id, sampled) from a W3C traceparent header"""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2], parts[3] == "01"
+
+class _Timed:
+    """Times a block into a histogram and, inside a sampled trace, records it as a span"""
+    __slots__ = ("histogram", "labels", "span_name", "started", "span", "token")
+
+    def __init__(self, histogram: Histogram, span_name: str, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+        self.span_name = span_name
+        self.span: Optional[Span] = None
+        self.token = None
+
+    def __enter__(self):
+        parent = _current_span.get()
+        if parent is not None:
+            self.span = Span(parent.trace_id, self.span_name, parent.span_id, self.labels)
+            parent.children.append(self.span)
+            self.token = _current_span.set(self.span)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        if self.span is not None:
+            self.span.end = time.time()
+            if exc is not None:
+                self.span.error = repr(exc)
+            _current_span.reset(self.token)
+        return False
+
+class _Request:
+    """Counts and times one inbound request, opening a trace if it is sampled"""
+    __slots__ = ("metrics", "channel", "traceparent", "started", "span", "token")
+
+    def __init__(self, metrics: "Metrics", channel: str, traceparent: Optional[str]):
+        self.metrics = metrics
+        self.channel = channel
+        self.traceparent = traceparent
+        self.span: Optional[Span] = None
+        self.token = None
+
+    def __enter__(self):
+        metrics = self.metrics
+        metrics.requests.inc(channel=self.channel)
+        metrics.in_flight.inc(component=self.channel)
+        incoming = parse_traceparent(self.traceparent)
+        if incoming and incoming[2] or (not incoming and metrics.sample_rate and random.random() < metrics.sample_rate):
+            trace_id, parent_id = (incoming[0], incoming[1]) if incoming else (os.urandom(16).hex(), None)
+            self.span = Span(trace_id, f"{self.channel} request", parent_id, {"channel": self.channel})
+            self.token = _current_span.set(self.span)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        metrics = self.metrics
+        metrics.request_seconds.observe(time.perf_counter() - self.started, channel=self.channel)
+        metrics.in_flight.dec(component=self.channel)
+        if exc is not None:
+            metrics.errors.inc(component=self.channel)
+        if self.span is not None:
+            self.span.end = time.time()
+            if exc is not None:
+                self.span.error = repr(exc)
+            _current_span.reset(self.token)
+            metrics.traces.append({"trace_id": self.span.trace_id, **self.span.to_dict()})
+        return False
+
+class Metrics:
+    """Process-wide metrics registry with Prometheus text output and sampled tracing.
+
+    Recording is a dict lookup and a couple of additions, so it stays on in
+    production. Spans are only built for sampled requests (TRACE_SAMPLE_RATE,
+    or an incoming traceparent with the sampled flag); the last TRACE_BUFFER
+    sampled traces are kept for inspection.
+    """
+
+    def __init__(self):
+        self.sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+        self.propagate = os.getenv("TRACE_PROPAGATE", "true").lower() == "true"
+        self.traces = deque(maxlen=int(os.getenv("TRACE_BUFFER", "100")))
+        self.requests = Counter("assistant_requests_total", "Inbound requests", ("channel",))
+        self.request_seconds = Histogram("assistant_request_seconds", "End-to-end request handling time", ("channel",))
+        self.stages = Histogram("assistant_stage_seconds", "Time spent per pipeline stage", ("stage", "component"))
+        self.in_flight = Gauge("assistant_in_flight", "Requests or jobs currently being handled", ("component",))
+        self.errors = Counter("assistant_errors_total", "Errors by component", ("component",))
+        self.tokens = Counter("assistant_upstream_tokens_total", "LLM tokens by provider", ("provider", "kind"))
+        self._metrics: List[_Metric] = [
+            self.requests, self.request_seconds, self.stages, self.in_flight, self.errors, self.tokens
+        ]
+
+    def request(self, channel: str, traceparent: Optional[str] = None) -> _Request:
+        """Context manager around handling one inbound request"""
+        return _Request(self, channel, traceparent)
+
+    def stage(self, stage: str, component: str = "") -> _Timed:
+        """Context manager timing one pipeline stage"""
+        return _Timed(self.stages, stage, {"stage": stage, "component": component})
+
+    def observe(self, stage: str, seconds: float, component: str = ""):
+        """Record a stage duration measured elsewhere (e.g. across an async generator)"""
+        self.stages.observe(seconds, stage=stage, component=component)
+
+    def error(self, component: str):
+        self.errors.inc(component=component)
+
+    def count_tokens(self, provider: str, prompt: float, completion: float):
+        self.tokens.inc(prompt, provider=provider, kind="prompt")
+        self.tokens.inc(completion, provider=provider, kind="completion")
+
+    def traceparent(self) -> Optional[str]:
+        """Header value to propagate the current trace to an outbound call"""
+        span = _current_span.get()
+        return span.traceparent if span is not None and self.propagate else None
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class RateLimitExceeded(Exception):
+    """The request could not be admitted before its deadline"""
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are now)"""
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate) if self.rate > 0 else 0.0
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class AdaptiveConcurrency:
+    """AIMD concurrency limit: +1 per window of fast successes, halved on overload"""
+
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 64, latency_target: float = 5.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+
+    def on_success(self, latency: float):
+        if latency > self.latency_target:
+            self.limit = max(self.minimum, self.limit * 0.9)
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_overload(self):
+        self.limit = max(self.minimum, self.limit * 0.5)
+
+class _Waiter:
+    __slots__ = ("future", "tokens")
+
+    def __init__(self, future: asyncio.Future, tokens: float):
+        self.future = future
+        self.tokens = tokens
+
+class Slot:
+    """An admitted upstream request; report its outcome with record()"""
+
+    def __init__(self, tokens: float):
+        self.tokens = tokens
+        self.started = time.monotonic()
+        self.status: Optional[int] = None
+        self.tokens_used: Optional[float] = None
+
+    def record(self, status: int, tokens_used: Optional[float] = None):
+        self.status = status
+        self.tokens_used = tokens_used
+
+class UpstreamLimiter:
+    """Client-side admission control for one upstream API.
+
+    Combines a requests/sec bucket, a tokens/min bucket and an AIMD
+    concurrency limit. Waiting requests are queued per user and admitted
+    round-robin, so one busy user can't starve the others, and a request
+    that can't be admitted before its deadline fails fast with
+    RateLimitExceeded instead of queueing forever.
+    """
+
+    def __init__(self, name: str, requests_per_second: float, tokens_per_minute: float,
+                 concurrency: Optional[AdaptiveConcurrency] = None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self.concurrency = concurrency or AdaptiveConcurrency()
+        self.in_flight = 0
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._waiting = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.counters = {"admitted": 0, "rejected": 0, "timed_out": 0, "throttled": 0}
+
+    def _estimated_wait(self, tokens: float) -> float:
+        bucket_wait = max(self.requests.time_until(1), self.tokens.time_until(tokens))
+        return max(bucket_wait, self._waiting / self.requests.rate if self.requests.rate else 0.0)
+
+    async def acquire(self, user_id: str, tokens: float, timeout: float) -> Slot:
+        """Wait for admission; raises RateLimitExceeded if it can't happen within timeout"""
+        if self._estimated_wait(tokens) > timeout:
+            self.counters["rejected"] += 1
+            raise RateLimitExceeded(f"{self.name} is rate limited; try again shortly")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tokens)
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        self._waiting += 1
+        self._pump()
+        try:
+            await asyncio.wait({waiter.future}, timeout=timeout)
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(Slot(tokens))
+            waiter.future.cancel()
+            raise
+        if not waiter.future.done():
+            waiter.future.cancel()
+            self.counters["timed_out"] += 1
+            raise RateLimitExceeded(f"{self.name} is busy; request timed out waiting for capacity")
+        self.counters["admitted"] += 1
+        return Slot(tokens)
+
+    def release(self, slot: Slot):
+        """Return a slot and feed its outcome into the concurrency limit"""
+        self.in_flight -= 1
+        if slot.status == 429:
+            self.counters["throttled"] += 1
+            self.concurrency.on_overload()
+        elif slot.status is not None and slot.status < 500:
+            self.concurrency.on_success(time.monotonic() - slot.started)
+        if slot.tokens_used is not None and slot.tokens_used < slot.tokens:
+            self.tokens.refund(slot.tokens - slot.tokens_used)
+        self._pump()
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, tokens: float, timeout: float):
+        acquired = await self.acquire(user_id, tokens, timeout)
+        try:
+            yield acquired
+        finally:
+            self.release(acquired)
+
+    def _pump(self):
+        """Admit waiters round-robin across users while capacity allows"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queues and self.in_flight < int(self.concurrency.limit):
+            user_id, queue = next(iter(self._queues.items()))
+            waiter = queue[0]
+            if waiter.future.done():
+                self._dequeue(user_id, queue)
+                continue
+            wait = max(self.requests.time_until(1), self.tokens.time_until(waiter.tokens))
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._pump)
+                return
+            self._dequeue(user_id, queue)
+            self.requests.consume(1)
+            self.tokens.consume(waiter.tokens)
+            self.in_flight += 1
+            waiter.future.set_result(None)
+
+    def _dequeue(self, user_id: str, queue: Deque[_Waiter]):
+        queue.popleft()
+        self._waiting -= 1
+        if queue:
+            self._queues.move_to_end(user_id)
+        else:
+            del self._queues[user_id]
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "waiting": self._waiting,
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "users_waiting": len(self._queues)
+        }
@@ -1,61 +1,310 @@
+import asyncio
+import heapq
+import inspect
+import itertools
 import logging
 import json
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+from services.reminder_store import ReminderStore, create_reminder_store
+from services.intent_router import parse_duration
+from services.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+DeliveryCallback = Callable[[dict], Union[None, Awaitable[None]]]
+
 class ReminderService:
-    """Reminder service - schedules and sends reminders"""
-    
-    def __init__(self):
-        self.reminders = {}  # In-memory storage; use database in production
-    
-    def schedule_reminder(self, time_str: str, message: str, platform: str, user_id: Optional[str] = None):
-        """Schedule a reminder"""
+    """Reminder service - schedules reminders on a min-heap and dispatches them when due"""
+
+    def __init__(self, store: Optional[ReminderStore] = None):
+        self.reminders: Dict[str, dict] = {}  # Pending reminders by id, mirrored to the store
+        self.store = store or create_reminder_store()
+        # What to do with reminders that came due while the process was down:
+        # 'deliver' them late, 'skip' them, or 'window' (deliver if late by less than the window)
+        self.catchup_policy = os.getenv("REMINDER_CATCHUP", "deliver")
+        self.catchup_window = float(os.getenv("REMINDER_CATCHUP_WINDOW", "3600"))
+        # Failed deliveries are retried with exponential backoff before the reminder is dropped
+        self.max_attempts = int(os.getenv("REMINDER_MAX_ATTEMPTS", "5"))
+        self.retry_delay = float(os.getenv("REMINDER_RETRY_DELAY", "5"))
+        self._heap: List[Tuple[float, int, str]] = []  # (due timestamp, sequence, reminder id)
+        self._seq = itertools.count()
+        self._delivery: Dict[str, DeliveryCallback] = {}
+        # Called with a platform that has no delivery yet, e.g. to build that channel on the leader
+        self.on_missing_delivery: Optional[Callable[[str], None]] = None
+        self.sync_interval = float(os.getenv("REMINDER_SYNC_INTERVAL", "1"))
+        self._sync_task: Optional[asyncio.Task] = None
+        self._synced_version: Optional[int] = None
+        self.sync_counters = {"reloads": 0, "skipped": 0}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._in_flight: Set[asyncio.Task] = set()
+        # Ids taken off the schedule but not yet delivered; they stay in the store until they are
+        self._delivering: Set[str] = set()
+
+    def register_delivery(self, platform: str, callback: DeliveryCallback):
+        """Register the function that delivers due reminders for a platform"""
+        self._delivery[platform] = callback
+
+    def has_delivery(self, platform: str) -> bool:
+        """True if reminders for platform can be delivered, building its channel first if needed"""
+        return self._delivery_for(platform) is not None
+
+    def _delivery_for(self, platform: str) -> Optional[DeliveryCallback]:
+        callback = self._delivery.get(platform)
+        if callback is None and self.on_missing_delivery is not None:
+            self.on_missing_delivery(platform)
+            callback = self._delivery.get(platform)
+        return callback
+
+    def schedule_reminder(self, time_str: str, message: str, platform: str, user_id: Optional[str] = None) -> Optional[str]:
+        """Schedule a reminder; returns its id, or None if the time can't be parsed"""
         try:
             # Parse time string (e.g., '30m', '2h', '1d')
-            import re
-            match = re.search(r'(\d+)\s*(m|h|d)', time_str.lower())
-            if not match:
-                return False
-            
-            value = int(match.group(1))
-            unit = match.group(2)
-            
+            duration = parse_duration(time_str)
+            if duration is None:
+                return None
+
             # Calculate reminder time
-            if unit == 'm':
-                remind_at = datetime.now() + timedelta(minutes=value)
-            elif unit == 'h':
-                remind_at = datetime.now() + timedelta(hours=value)
-            else:  # days
-                remind_at = datetime.now() + timedelta(days=value)
-            
-            reminder_id = f"{platform}_{user_id}_{remind_at.timestamp()}"
-            self.reminders[reminder_id] = {
+            remind_at = datetime.now() + duration[1]
+
+            reminder_id = f"{platform}_{user_id}_{remind_at.timestamp()}_{next(self._seq)}"
+            reminder = {
+                "id": reminder_id,
                 "message": message,
                 "platform": platform,
                 "user_id": user_id,
-                "remind_at": remind_at.isoformat()
+                "remind_at": remind_at.isoformat(),
+                "due": remind_at.timestamp()
             }
-            
+            self._add(reminder)
+            self.store.add(reminder)
+
             logger.info(f"Reminder scheduled: {reminder_id}")
-            return True
+            return reminder_id
         except Exception as e:
             logger.error(f"Failed to schedule reminder: {e}")
+            return None
+
+    def _add(self, reminder: dict):
+        """Push a reminder onto the heap, waking the dispatcher if it is now the earliest"""
+        self.reminders[reminder["id"]] = reminder
+        heapq.heappush(self._heap, (reminder["due"], next(self._seq), reminder["id"]))
+        if self._wakeup and self._heap[0][2] == reminder["id"]:
+            self._wakeup.set()
+
+    def cancel_reminder(self, reminder_id: str) -> bool:
+        """Cancel a pending reminder; its heap entry is discarded lazily"""
+        if self.reminders.pop(reminder_id, None) is None:
             return False
-    
+        self.store.remove(reminder_id)
+        # Rebuild once cancelled entries dominate so the heap stays O(pending)
+        if len(self._heap) > 2 * len(self.reminders) + 64:
+            self._heap = [entry for entry in self._heap if entry[2] in self.reminders]
+            heapq.heapify(self._heap)
+        return True
+
+    def pending_for(self, platform: str, user_id: Optional[str] = None, until: Optional[float] = None) -> List[dict]:
+        """A user's pending reminders, soonest first"""
+        pending = [
+            reminder for reminder in self.reminders.values()
+            if reminder["platform"] == platform and str(reminder["user_id"]) == str(user_id)
+            and (until is None or reminder["due"] <= until)
+        ]
+        return sorted(pending, key=lambda reminder: reminder["due"])
+
+    def _next_due(self) -> Optional[float]:
+        """Due time of the earliest pending reminder, dropping cancelled entries"""
+        while self._heap and self._heap[0][2] not in self.reminders:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: Optional[float] = None) -> List[dict]:
+        """Take every reminder due at or before now off the schedule.
+
+        They stay in the store, so a crash mid-delivery redelivers them on
+        recovery; _deliver removes each one once it has been sent.
+        """
+        now = time.time() if now is None else now
+        due = []
+        while True:
+            next_due = self._next_due()
+            if next_due is None or next_due > now:
+                return due
+            _, _, reminder_id = heapq.heappop(self._heap)
+            due.append(self.reminders.pop(reminder_id))
+            self._delivering.add(reminder_id)
+
     async def check_and_send_reminders(self):
-        """Check if any reminders are due and send them"""
-        now = datetime.now()
-        due_reminders = []
-        
-        for reminder_id, reminder in list(self.reminders.items()):
-            remind_time = datetime.fromisoformat(reminder["remind_at"])
-            if remind_time <= now:
-                due_reminders.append((reminder_id, reminder))
-        
-        for reminder_id, reminder in due_reminders:
-            # Send reminder to appropriate platform
-            logger.info(f"Sending reminder: {reminder_id}")
-            del self.reminders[reminder_id]
+        """Send every reminder that is due now"""
+        for reminder in self.pop_due():
+            await self._deliver(reminder)
+
+    async def _deliver(self, reminder: dict):
+        """Send reminder to appropriate platform"""
+        callback = self._delivery_for(reminder["platform"])
+        if callback is None:
+            logger.warning(f"No delivery registered for {reminder['platform']}: {reminder['id']}")
+            self._delivered(reminder)
+            return
+        try:
+            logger.info(f"Sending reminder: {reminder['id']}")
+            metrics.observe("reminder_lag", max(0.0, time.time() - reminder["due"]), reminder["platform"])
+            with metrics.stage("reminder_delivery", reminder["platform"]):
+                result = callback(reminder)
+                if inspect.isawaitable(result):
+                    await result
+        except Exception as e:
+            metrics.error("reminders")
+            self._retry(reminder, e)
+            return
+        self._delivered(reminder)
+
+    def _delivered(self, reminder: dict):
+        self._delivering.discard(reminder["id"])
+        self.store.remove(reminder["id"])
+
+    def _retry(self, reminder: dict, error: Exception):
+        """Put a failed reminder back on the schedule with backoff, or drop it after max_attempts"""
+        attempts = reminder.get("attempts", 0) + 1
+        if attempts >= self.max_attempts:
+            logger.error(f"Giving up on reminder {reminder['id']} after {attempts} attempts: {error}")
+            self._delivered(reminder)
+            return
+        logger.warning(f"Failed to deliver reminder {reminder['id']} (attempt {attempts}): {error}")
+        self._delivering.discard(reminder["id"])
+        # The stored row keeps its original due time, so a restart retries it straight away
+        self._add({**reminder, "attempts": attempts, "due": time.time() + self.retry_delay * 2 ** (attempts - 1)})
+
+    async def recover(self) -> int:
+        """Load pending reminders from the store, applying the catch-up policy to overdue ones"""
+        pending = await asyncio.to_thread(self.store.load_pending)
+        now = time.time()
+        recovered = 0
+        for reminder in pending:
+            if reminder["id"] in self.reminders or reminder["id"] in self._delivering:
+                continue
+            late_by = now - reminder["due"]
+            if late_by > 0:
+                if self.catchup_policy == "skip" or (
+                    self.catchup_policy == "window" and late_by > self.catchup_window
+                ):
+                    logger.info(f"Skipping missed reminder: {reminder['id']}")
+                    self.store.remove(reminder["id"])
+                    continue
+                reminder["late"] = True
+            self._add(reminder)
+            recovered += 1
+        logger.info(f"Recovered {recovered} pending reminders")
+        return recovered
+
+    async def start(self, dispatch: bool = True, shared: bool = False):
+        """Start the store and, when dispatching, recover pending reminders and run the dispatch loop.
+
+        With shared=True other worker processes schedule into the same store.
+        Every worker follows it every REMINDER_SYNC_INTERVAL so its view stays
+        current, and only the worker started (or later promoted) with
+        dispatch (the elected leader) delivers.
+        """
+        await self.store.start()
+        if shared and not self.store.persistent:
+            logger.warning("Shared state without REMINDER_DB_PATH: reminders stay local to each worker")
+        elif shared and self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+        if dispatch:
+            await self.start_dispatch()
+
+    async def start_dispatch(self):
+        """Recover pending reminders and start the background dispatch loop"""
+        if self._task and not self._task.done():
+            return
+        await self.recover()
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background dispatch and sync loops"""
+        if self._sync_task:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+        if self._task:
+            # wait_for can swallow a cancel that races with the wakeup event, so also flag the loop
+            self._stopping = True
+            self._wakeup.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.store.close()
+
+    def _read_shared(self) -> Optional[List[dict]]:
+        """Pending reminders if another worker changed the store since the last read, else None"""
+        # Commit our own queued writes first so the read reflects them
+        self.store.flush()
+        version = self.store.data_version()
+        if version is not None and version == self._synced_version:
+            return None
+        pending = self.store.load_pending()
+        self._synced_version = version
+        return pending
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            known = set(self.reminders)
+            try:
+                pending = await asyncio.to_thread(self._read_shared)
+            except Exception as e:
+                logger.error(f"Failed to sync reminders: {e}")
+                continue
+            # Idle workers stop here: one PRAGMA read per interval, however many reminders are stored
+            if pending is None:
+                self.sync_counters["skipped"] += 1
+                continue
+            self.sync_counters["reloads"] += 1
+            stored = {reminder["id"]: reminder for reminder in pending}
+            # Only ids pending before the read can have been cancelled elsewhere; anything
+            # scheduled or delivered here while reading is left alone
+            for reminder_id in known - stored.keys():
+                self.reminders.pop(reminder_id, None)
+            for reminder_id, reminder in stored.items():
+                if reminder_id not in known and reminder_id not in self.reminders \
+                        and reminder_id not in self._delivering:
+                    self._add(reminder)
+
+    def is_running(self) -> bool:
+        return bool(self._task and not self._task.done())
+
+    async def _run(self):
+        """Sleep until the next reminder is due (or an earlier one is added), then dispatch"""
+        while not self._stopping:
+            next_due = self._next_due()
+            timeout = None if next_due is None else max(0.0, next_due - time.time())
+            self._wakeup.clear()
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            for reminder in self.pop_due():
+                task = asyncio.create_task(self._deliver(reminder))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.reminders),
+            "heap_size": len(self._heap),
+            "delivering": len(self._delivering),
+            "sync": dict(self.sync_counters),
+            "running": self.is_running(),
+            "store": self.store.stats()
+        }
@@ -0,0 +1,147 @@
+import os
+import asyncio
+import sqlite3
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ReminderStore:
+    """Storage backend interface for reminders (in-memory: nothing survives a restart)"""
+    persistent = False
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def add(self, reminder: dict):
+        pass
+
+    def remove(self, reminder_id: str):
+        pass
+
+    def flush(self):
+        pass
+
+    def load_pending(self) -> List[dict]:
+        return []
+
+    def data_version(self) -> Optional[int]:
+        """A value that changes whenever another process commits to the store (None: not tracked)"""
+        return None
+
+    def stats(self) -> dict:
+        return {"backend": "memory"}
+
+class SQLiteReminderStore(ReminderStore):
+    """SQLite (WAL) reminder store with group commit.
+
+    add/remove only queue the write; a background flusher commits everything
+    queued within REMINDER_COMMIT_INTERVAL_MS in one transaction, so a burst of
+    scheduling costs one fsync per batch rather than one per reminder. Writes
+    still queued when the process dies are lost, which bounds the loss window
+    to one commit interval.
+    """
+    persistent = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.commit_interval = float(os.getenv("REMINDER_COMMIT_INTERVAL_MS", "50")) / 1000
+        self.commit_batch = int(os.getenv("REMINDER_COMMIT_BATCH", "1000"))
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS reminders ("
+            "id TEXT PRIMARY KEY, platform TEXT, user_id TEXT, message TEXT, "
+            "remind_at TEXT, due REAL)"
+        )
+        self._db.commit()
+        self._db_lock = threading.Lock()
+        self._queue: List[Tuple[str, tuple]] = []
+        self._queue_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.counters = {"commits": 0, "writes": 0}
+
+    async def start(self):
+        if self._task is None:
+            self._closing = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        self.flush()
+
+    def add(self, reminder: dict):
+        self._enqueue("INSERT OR REPLACE INTO reminders VALUES (?, ?, ?, ?, ?, ?)", (
+            reminder["id"], reminder["platform"],
+            None if reminder["user_id"] is None else str(reminder["user_id"]),
+            reminder["message"], reminder["remind_at"], reminder["due"]
+        ))
+
+    def remove(self, reminder_id: str):
+        self._enqueue("DELETE FROM reminders WHERE id = ?", (reminder_id,))
+
+    def _enqueue(self, statement: str, params: tuple):
+        with self._queue_lock:
+            self._queue.append((statement, params))
+            size = len(self._queue)
+        if self._wakeup and (size == 1 or size >= self.commit_batch):
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while not self._closing:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Let more writes accumulate unless the batch is already full
+            if len(self._queue) < self.commit_batch and not self._closing:
+                await asyncio.sleep(self.commit_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Failed to commit reminders: {e}")
+
+    def flush(self):
+        """Commit every queued write in a single transaction"""
+        # Held across the swap so concurrent flushes commit batches in queue order
+        with self._db_lock:
+            with self._queue_lock:
+                batch, self._queue = self._queue, []
+            if not batch:
+                return
+            with self._db:
+                for statement, params in batch:
+                    self._db.execute(statement, params)
+        self.counters["commits"] += 1
+        self.counters["writes"] += len(batch)
+
+    def load_pending(self) -> List[dict]:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, platform, user_id, message, remind_at, due FROM reminders"
+            ).fetchall()
+        keys = ("id", "platform", "user_id", "message", "remind_at", "due")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def data_version(self) -> Optional[int]:
+        # SQLite bumps this when another connection commits; our own commits leave it alone
+        with self._db_lock:
+            return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def stats(self) -> dict:
+        return {"backend": "sqlite", "queued": len(self._queue), **self.counters}
+
+def create_reminder_store() -> ReminderStore:
+    """SQLite store when REMINDER_DB_PATH is set, otherwise in-memory"""
+    path = os.getenv("REMINDER_DB_PATH")
+    return SQLiteReminderStore(path) if path else ReminderStore()
@@ -0,0 +1,148 @@
+import os
+import time
+import inspect
+import logging
+import importlib
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class _Entry:
+    __slots__ = ("target", "dependencies", "lazy", "instance", "import_seconds", "build_seconds")
+
+    def __init__(self, target: str, dependencies: Tuple[str, ...], lazy: bool):
+        self.target = target
+        self.dependencies = dependencies
+        self.lazy = lazy
+        self.instance: Any = None
+        self.import_seconds: Optional[float] = None
+        self.build_seconds: Optional[float] = None
+
+class LazyService:
+    """Stand-in handed to dependents; builds the real service on first attribute access"""
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry: "ServiceRegistry", name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._registry.get(self._name), attribute)
+
+    def __setattr__(self, attribute: str, value):
+        setattr(self._registry.get(self._name), attribute, value)
+
+    def __repr__(self) -> str:
+        return f"<LazyService {self._name}>"
+
+class ServiceRegistry:
+    """Builds services on first use so a cold start only pays for what a request touches.
+
+    Services are registered as "module:Class" strings with the names of the
+    services passed to their constructor. Nothing is imported until the
+    service is first requested, and the import and construction time of
+    each one is recorded. Dependencies registered with lazy=True are handed
+    over as LazyService stand-ins, so e.g. the intent router can hold the
+    email service without building it until an email intent fires.
+    """
+
+    def __init__(self):
+        self.budget = float(os.getenv("COLD_START_BUDGET_MS", "500")) / 1000
+        self._entries: Dict[str, _Entry] = {}
+        self._building: List[str] = []
+        self._order: List[str] = []
+        self._phases: Dict[str, float] = {}
+
+    def register(self, name: str, target: str, *dependencies: str, lazy: bool = False):
+        """Declare a service; lazy=True means dependents get a LazyService for it"""
+        self._entries[name] = _Entry(target, dependencies, lazy)
+
+    def get(self, name: str) -> Any:
+        entry = self._entries[name]
+        if entry.instance is None:
+            entry.instance = self._build(name, entry)
+        return entry.instance
+
+    def lazy(self, name: str) -> LazyService:
+        return LazyService(self, name)
+
+    def built(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry.instance is not None
+
+    def instances(self) -> Dict[str, Any]:
+        """Services built so far, in build order"""
+        return {name: self._entries[name].instance for name in self._order}
+
+    def _build(self, name: str, entry: _Entry) -> Any:
+        if name in self._building:
+            raise RuntimeError(f"Circular service dependency: {' -> '.join(self._building + [name])}")
+        self._building.append(name)
+        try:
+            dependencies = [
+                self.lazy(dependency) if self._entries[dependency].lazy else self.get(dependency)
+                for dependency in entry.dependencies
+            ]
+            module_name, _, class_name = entry.target.partition(":")
+            started = time.perf_counter()
+            factory = getattr(importlib.import_module(module_name), class_name)
+            imported = time.perf_counter()
+            instance = factory(*dependencies)
+            entry.import_seconds = imported - started
+            entry.build_seconds = time.perf_counter() - imported
+        finally:
+            self._building.pop()
+        self._order.append(name)
+        logger.info(f"Built {name} in {(entry.import_seconds + entry.build_seconds) * 1000:.1f}ms "
+                    f"(import {entry.import_seconds * 1000:.1f}ms)")
+        return instance
+
+    def record(self, phase: str, seconds: float):
+        """Time a startup phase outside the registry (e.g. importing the app module)"""
+        self._phases[phase] = seconds
+
+    def cold_start_seconds(self) -> float:
+        return sum(self._phases.values()) + sum(
+            self._entries[name].import_seconds + self._entries[name].build_seconds for name in self._order
+        )
+
+    def check_budget(self):
+        """Warn if startup so far blew COLD_START_BUDGET_MS"""
+        elapsed = self.cold_start_seconds()
+        if self.budget and elapsed > self.budget:
+            slowest = sorted(self._timings().items(), key=lambda item: -item[1]["total_ms"])[:3]
+            summary = ", ".join(f"{name} {timing['total_ms']}ms" for name, timing in slowest)
+            logger.warning(f"Cold start took {elapsed * 1000:.0f}ms (budget {self.budget * 1000:.0f}ms); "
+                           f"slowest: {summary}")
+
+    def _timings(self) -> Dict[str, dict]:
+        timings = {phase: {"total_ms": round(seconds * 1000, 2)} for phase, seconds in self._phases.items()}
+        for name in self._order:
+            entry = self._entries[name]
+            timings[name] = {
+                "import_ms": round(entry.import_seconds * 1000, 2),
+                "build_ms": round(entry.build_seconds * 1000, 2),
+                "total_ms": round((entry.import_seconds + entry.build_seconds) * 1000, 2)
+            }
+        return timings
+
+    async def shutdown(self):
+        """Stop built services that have a stop() hook, newest first"""
+        for name in reversed(self._order):
+            stop = getattr(self._entries[name].instance, "stop", None)
+            if stop is None:
+                continue
+            try:
+                result = stop()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Error stopping {name}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "cold_start_ms": round(self.cold_start_seconds() * 1000, 2),
+            "budget_ms": round(self.budget * 1000, 2),
+            "built": self._timings(),
+            "not_built": [name for name, entry in self._entries.items() if entry.instance is None]
+        }
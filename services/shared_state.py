@@ -0,0 +1,217 @@
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class SharedState:
+    """State shared by every worker process, plus leader locks for singleton duties.
+
+    This in-process default is for a single worker: it always wins
+    leadership and keeps keys in a dict. SQLiteSharedState shares both
+    across the workers on one host.
+    """
+    shared = False
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def try_lead(self, role: str) -> bool:
+        """Take the leader lock for role without waiting; True if this worker holds it"""
+        return True
+
+    def resign(self, role: str):
+        pass
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._values.get(key)
+            if item is None or (item[1] is not None and item[1] <= time.time()):
+                self._values.pop(key, None)
+                return None
+            return item[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """Set key only if it is absent (or expired); True if this call set it"""
+        with self._lock:
+            item = self._values.get(key)
+            if item is not None and (item[1] is None or item[1] > time.time()):
+                return False
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+            return True
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add to an integer key, creating it (with ttl) if absent; returns the new value"""
+        with self._lock:
+            item = self._values.get(key)
+            if item is None or (item[1] is not None and item[1] <= time.time()):
+                item = ("0", time.time() + ttl if ttl else None)
+            value = int(item[0]) + amount
+            self._values[key] = (str(value), item[1])
+            return value
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "keys": len(self._values)}
+
+class SQLiteSharedState(SharedState):
+    """Shared state for workers on one host: a WAL SQLite key/value table and flock leader locks.
+
+    Leadership is an exclusive flock on <path>.<role>.lock. The OS drops it
+    when the holding process exits, however it exits, so a follower can
+    take over without lease timeouts or heartbeats.
+    """
+    shared = True
+
+    def __init__(self, path: str):
+        try:
+            import fcntl
+        except ImportError:
+            raise RuntimeError("SQLite shared state needs POSIX file locks (fcntl)")
+        self._fcntl = fcntl
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+        self._db.commit()
+        self._lock_files: Dict[str, int] = {}
+
+    def try_lead(self, role: str) -> bool:
+        if role in self._lock_files:
+            return True
+        fd = os.open(f"{self.path}.{role}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            self._fcntl.flock(fd, self._fcntl.LOCK_EX | self._fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_files[role] = fd
+        return True
+
+    def resign(self, role: str):
+        fd = self._lock_files.pop(role, None)
+        if fd is not None:
+            self._fcntl.flock(fd, self._fcntl.LOCK_UN)
+            os.close(fd)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM state WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO state VALUES (?, ?, ?)",
+                             (key, value, time.time() + ttl if ttl else None))
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM state WHERE key = ? AND expires <= ?", (key, now))
+            cursor = self._db.execute("INSERT OR IGNORE INTO state VALUES (?, ?, ?)",
+                                      (key, value, now + ttl if ttl else None))
+        return cursor.rowcount == 1
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM state WHERE key = ? AND expires <= ?", (key, now))
+            self._db.execute(
+                "INSERT INTO state VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value",
+                (key, amount, now + ttl if ttl else None)
+            )
+            return int(self._db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()[0])
+
+    def delete(self, key: str):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            keys = self._db.execute("SELECT COUNT(*) FROM state").fetchone()[0]
+        return {"backend": "sqlite", "keys": keys, "leading": sorted(self._lock_files)}
+
+def create_shared_state() -> SharedState:
+    """SQLite when STATE_BACKEND=sqlite (needed for more than one worker), otherwise in-process"""
+    if os.getenv("STATE_BACKEND", "memory").lower() == "sqlite":
+        return SQLiteSharedState(os.getenv("STATE_DB_PATH", "assistant_state.db"))
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        logger.warning(f"{workers} workers with in-process state: every worker will act as leader. "
+                       f"Set STATE_BACKEND=sqlite")
+    return SharedState()
+
+class LeaderElection:
+    """Elects one worker for singleton duties (reminder dispatch, the Discord gateway).
+
+    Followers retry every LEADER_POLL_INTERVAL seconds, so when the leader
+    exits another worker takes over within one interval and runs the
+    on_elected callbacks.
+    """
+
+    def __init__(self, state: SharedState, role: str = "leader"):
+        self.state = state
+        self.role = role
+        self.poll_interval = float(os.getenv("LEADER_POLL_INTERVAL", "2"))
+        self.is_leader = False
+        self._callbacks: List[Callable[[], Awaitable[None]]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"elections": 0}
+
+    def on_elected(self, callback: Callable[[], Awaitable[None]]):
+        self._callbacks.append(callback)
+
+    async def start(self):
+        """Try for leadership now; keep trying in the background if another worker holds it"""
+        if not await self._try():
+            self._task = asyncio.create_task(self._poll())
+
+    async def _try(self) -> bool:
+        if not self.state.try_lead(self.role):
+            return False
+        self.is_leader = True
+        self.counters["elections"] += 1
+        self.state.set(f"leader:{self.role}", str(os.getpid()))
+        logger.info(f"Worker {os.getpid()} elected {self.role}")
+        for callback in self._callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"Leader duty failed to start: {e}")
+        return True
+
+    async def _poll(self):
+        while not await self._try():
+            await asyncio.sleep(self.poll_interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            self.state.resign(self.role)
+            self.is_leader = False
+
+    def stats(self) -> dict:
+        return {
+            "role": self.role, "pid": os.getpid(), "is_leader": self.is_leader,
+            "leader_pid": self.state.get(f"leader:{self.role}"), **self.counters
+        }
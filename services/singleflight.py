@@ -0,0 +1,40 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one shared upstream call"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.counters = {"calls": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn once per key at a time; concurrent callers await the same result.
+
+        Each waiter is shielded, so a caller that is cancelled (e.g. a client
+        disconnecting) stops waiting without cancelling the shared call.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.counters["calls"] += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.counters["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Shared call {key[:12]} failed: {task.exception()}")
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": len(self._calls)}
+
+single_flight = SingleFlight()
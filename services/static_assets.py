@@ -0,0 +1,203 @@
+import os
+import re
+import sys
+import gzip
+import json
+import hashlib
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".ico": "image/x-icon",
+}
+COMPRESSIBLE = (".html", ".css", ".js", ".svg")
+IMMUTABLE = "public, max-age=31536000, immutable"
+# The page itself keeps its URL, so browsers revalidate it (a 304) on every load
+REVALIDATE = "no-cache"
+MANIFEST = "manifest.json"
+SUFFIXES = {"gzip": ".gz", "br": ".br"}
+STATIC_PREFIX = "/static/"
+
+def _hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()[:12]
+
+def _compress(content: bytes, name: str) -> Dict[str, bytes]:
+    """Encoded variants worth serving: gzip, and brotli when installed"""
+    variants = {}
+    if name.endswith(COMPRESSIBLE):
+        # mtime=0 keeps builds reproducible, so unchanged files keep their bytes
+        variants["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+        if brotli is not None:
+            variants["br"] = brotli.compress(content, quality=11)
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(content)}
+
+def build(source_dir: str) -> Tuple[dict, Dict[str, bytes]]:
+    """Compile the web UI: (manifest, output files by name).
+
+    Every asset but index.html is renamed to name.<content hash>.ext, and
+    index.html is rewritten to reference the hashed names, so those files
+    can be cached forever. Each file also gets .gz (and .br) variants.
+    """
+    manifest, outputs = {}, {}
+    names = sorted(os.listdir(source_dir))
+    hashed = {}
+    for name in names:
+        if name == "index.html" or not os.path.isfile(os.path.join(source_dir, name)):
+            continue
+        with open(os.path.join(source_dir, name), "rb") as f:
+            content = f.read()
+        stem, ext = os.path.splitext(name)
+        hashed[name] = f"{stem}.{_hash(content)}{ext}"
+        outputs[hashed[name]] = content
+    with open(os.path.join(source_dir, "index.html"), "rb") as f:
+        page = f.read().decode()
+    for name, target in hashed.items():
+        page = re.sub(rf'((?:href|src)=")(?:\./)?{re.escape(name)}"', rf'\g<1>{STATIC_PREFIX}{target}"', page)
+    outputs["index.html"] = page.encode()
+    for name, content in list(outputs.items()):
+        variants = _compress(content, name)
+        for encoding, body in variants.items():
+            outputs[name + SUFFIXES[encoding]] = body
+        manifest[name] = {"etag": _hash(content), "encodings": sorted(variants)}
+    return manifest, outputs
+
+def write(out_dir: str, manifest: dict, outputs: Dict[str, bytes]):
+    os.makedirs(out_dir, exist_ok=True)
+    for name, content in outputs.items():
+        with open(os.path.join(out_dir, name), "wb") as f:
+            f.write(content)
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+class Asset:
+    __slots__ = ("content_type", "cache_control", "etag", "variants")
+
+    def __init__(self, name: str, etag: str, variants: Dict[str, bytes]):
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+        self.cache_control = REVALIDATE if name == "index.html" else IMMUTABLE
+        self.etag = etag
+        self.variants = variants
+
+def _accepted(accept_encoding: str) -> Dict[str, float]:
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        if coding:
+            weights[coding.strip().lower()] = quality
+    return weights
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+class StaticAssets:
+    """The web UI, served from memory as prebuilt, precompressed files.
+
+    `python -m services.static_assets` builds WEB_SOURCE_DIR into
+    WEB_BUILD_DIR at deploy time. Workers load that build once, so a page
+    view is a dict lookup: no templating, no compression, and a 304 for
+    anything the browser already has. The build directory can equally be
+    served by a CDN or nginx (gzip_static) without touching the API. Without
+    a build, or with sources newer than it, the build runs in memory on load.
+    """
+
+    def __init__(self, source_dir: Optional[str] = None, build_dir: Optional[str] = None):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.source_dir = source_dir or os.getenv("WEB_SOURCE_DIR", os.path.join(root, "web"))
+        self.build_dir = build_dir or os.getenv("WEB_BUILD_DIR", os.path.join(self.source_dir, "dist"))
+        self._assets: Dict[str, Asset] = {}
+        self.prebuilt = False
+        self.counters = {"requests": 0, "not_modified": 0, "compressed": 0, "not_found": 0}
+        self.load()
+
+    def _stale(self) -> bool:
+        manifest = os.path.join(self.build_dir, MANIFEST)
+        if not os.path.exists(manifest):
+            return True
+        if not os.path.isdir(self.source_dir):
+            # Deployed without sources: the build is all there is
+            return False
+        built = os.path.getmtime(manifest)
+        return any(
+            os.path.getmtime(path) > built
+            for path in (os.path.join(self.source_dir, name) for name in os.listdir(self.source_dir))
+            if os.path.isfile(path)
+        )
+
+    def load(self):
+        if self._stale():
+            logger.warning(f"No current web build in {self.build_dir}; building in memory. "
+                           f"Run `python -m services.static_assets` at deploy time")
+            manifest, outputs = build(self.source_dir)
+            self.prebuilt = False
+        else:
+            with open(os.path.join(self.build_dir, MANIFEST)) as f:
+                manifest = json.load(f)
+            outputs = {}
+            for name, entry in manifest.items():
+                for file in [name] + [name + SUFFIXES[e] for e in entry["encodings"]]:
+                    with open(os.path.join(self.build_dir, file), "rb") as f:
+                        outputs[file] = f.read()
+            self.prebuilt = True
+        assets = {}
+        for name, entry in manifest.items():
+            variants = {"identity": outputs[name]}
+            variants.update({e: outputs[name + SUFFIXES[e]] for e in entry["encodings"]})
+            path = "/" if name == "index.html" else STATIC_PREFIX + name
+            assets[path] = Asset(name, entry["etag"], variants)
+        self._assets = assets
+
+    def lookup(self, path: str, accept_encoding: str = "", if_none_match: str = "") -> Tuple[int, dict, bytes]:
+        """(status, headers, body) for a GET of path"""
+        self.counters["requests"] += 1
+        asset = self._assets.get(path)
+        if asset is None:
+            self.counters["not_found"] += 1
+            return 404, {}, b""
+        accepted = _accepted(accept_encoding)
+        encoding = next((e for e in ("br", "gzip") if e in asset.variants and accepted.get(e, 0) > 0), "identity")
+        etag = f'"{asset.etag}"' if encoding == "identity" else f'"{asset.etag}-{encoding}"'
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+        if if_none_match and _etag_matches(if_none_match, etag):
+            self.counters["not_modified"] += 1
+            return 304, headers, b""
+        if encoding != "identity":
+            self.counters["compressed"] += 1
+            headers["Content-Encoding"] = encoding
+        headers["Content-Type"] = asset.content_type
+        return 200, headers, asset.variants[encoding]
+
+    def stats(self) -> dict:
+        return {**self.counters, "prebuilt": self.prebuilt, "assets": sorted(self._assets)}
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else os.getenv("WEB_SOURCE_DIR", "web")
+    out = sys.argv[2] if len(sys.argv) > 2 else os.getenv("WEB_BUILD_DIR", os.path.join(source, "dist"))
+    if brotli is None:
+        print("brotli is not installed: building gzip variants only")
+    manifest, outputs = build(source)
+    write(out, manifest, outputs)
+    for name, entry in manifest.items():
+        sizes = ", ".join(f"{e} {len(outputs[name + SUFFIXES[e]])}" for e in entry["encodings"])
+        print(f"{out}/{name}: {len(outputs[name])} bytes ({sizes or 'uncompressed'})")
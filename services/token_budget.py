@@ -0,0 +1,180 @@
+import os
+import re
+import math
+import logging
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Pieces a BPE tokenizer would start a new token at: letter runs, digit runs,
+# single symbols, newline runs. Spaces attach to the following piece.
+_PIECES = re.compile(r"[^\W\d_]+|\d+|\n+|[^\w\s]|_")
+_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*")
+
+def _approximate_tokens(text: str) -> int:
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        if piece.isascii():
+            if piece.isalpha():
+                # Common words are one token; long ones split every ~6 letters
+                tokens += 1 + (len(piece) - 1) // 6
+            elif piece.isdigit():
+                tokens += math.ceil(len(piece) / 3)
+            else:
+                tokens += 1
+        else:
+            # Emoji, CJK and accented text cost roughly a token per character
+            tokens += len(piece)
+    return tokens
+
+def _load_encoder():
+    """tiktoken's encoder when TOKENIZER=tiktoken and it is installed with its vocabulary cached"""
+    if os.getenv("TOKENIZER", "local").lower() != "tiktoken":
+        return None
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(os.getenv("TIKTOKEN_ENCODING", "cl100k_base"))
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable ({e}); using the local token estimate")
+        return None
+
+_encoder = _load_encoder()
+
+def count_tokens(text: str) -> int:
+    """Tokens in text, from tiktoken if enabled, else a local BPE-shaped estimate"""
+    if not text:
+        return 0
+    if _encoder is not None:
+        return len(_encoder.encode(text, disallowed_special=()))
+    return _approximate_tokens(text)
+
+def count_message_tokens(messages: List[dict]) -> int:
+    """Prompt size of a chat request, including the per-message framing (~4 tokens each)"""
+    return sum(count_tokens(message["content"]) + 4 for message in messages) + 2
+
+def _segments(text: str) -> Iterator[str]:
+    """Sentences and lines, each with the whitespace that follows it"""
+    start = 0
+    for match in _BOUNDARY.finditer(text):
+        yield text[start:match.end()]
+        start = match.end()
+    if start < len(text):
+        yield text[start:]
+
+def split_message(text: str, limit: Optional[int]) -> List[str]:
+    """Split text into parts of at most limit characters, breaking between sentences.
+
+    A sentence longer than the limit breaks at the last space that fits, and
+    only a single unbroken word longer than the limit is cut mid-word.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    if limit is None or len(text) <= limit:
+        return [text]
+    parts, current = [], ""
+    for segment in _segments(text):
+        if len(current) + len(segment.rstrip()) <= limit:
+            current += segment
+            continue
+        if current.strip():
+            parts.append(current.rstrip())
+        segment = segment.lstrip()
+        while len(segment.rstrip()) > limit:
+            cut = segment.rfind(" ", 0, limit + 1)
+            cut = cut if cut > 0 else limit
+            parts.append(segment[:cut].rstrip())
+            segment = segment[cut:].lstrip()
+        current = segment
+    if current.strip():
+        parts.append(current.rstrip())
+    return parts
+
+CHANNEL_NAMES = {"discord": "Discord", "whatsapp": "WhatsApp", "imessage": "iMessage"}
+
+class ChannelBudget:
+    """Output limits for one channel: message size, how many messages a reply may span"""
+    __slots__ = ("channel", "message_chars", "max_messages", "max_tokens", "instruction")
+
+    def __init__(self, channel: str, message_chars: Optional[int], max_messages: int, max_tokens: int,
+                 chars_per_token: float):
+        self.channel = channel
+        self.message_chars = message_chars
+        self.max_messages = max_messages
+        if message_chars:
+            # The model is asked for one message and may run a quarter over; the
+            # overrun is split into a second message rather than generated and dropped
+            self.max_tokens = min(max_tokens, int(message_chars * 1.25 / chars_per_token))
+            self.instruction = (f"Your reply is shown in {CHANNEL_NAMES.get(channel, channel)}: keep it under "
+                                f"{message_chars} characters (about {message_chars // 6} words).")
+        else:
+            self.max_tokens = max_tokens
+            self.instruction = ""
+
+class TokenBudget:
+    """Sizes each LLM call for the channel it answers.
+
+    max_tokens comes from the channel's message limit, so the model stops
+    where the channel would have cut it off, and the system prompt tells the
+    model that length up front. Prompts are counted before sending and
+    max_tokens is clamped to what the context window has left. Replies are
+    split into channel-sized messages at sentence boundaries.
+    """
+
+    DEFAULT_MESSAGE_CHARS = {"discord": 2000, "whatsapp": 1600, "imessage": 4000, "web": None}
+
+    def __init__(self):
+        self.max_tokens = int(os.getenv("AI_MAX_TOKENS", "500"))
+        self.context_tokens = int(os.getenv("AI_CONTEXT_TOKENS", "8192"))
+        self.min_tokens = int(os.getenv("AI_MIN_TOKENS", "64"))
+        self.chars_per_token = float(os.getenv("TOKEN_CHARS_PER_TOKEN", "4"))
+        self._channels: Dict[str, ChannelBudget] = {}
+        self.counters = {"requests": 0, "prompt_tokens": 0, "budgeted_tokens": 0, "clamped": 0, "split": 0}
+
+    def for_channel(self, channel: Optional[str]) -> ChannelBudget:
+        channel = channel or "web"
+        budget = self._channels.get(channel)
+        if budget is None:
+            prefix = channel.upper()
+            chars = os.getenv(f"{prefix}_MESSAGE_CHARS")
+            message_chars = int(chars) if chars else self.DEFAULT_MESSAGE_CHARS.get(channel)
+            budget = self._channels[channel] = ChannelBudget(
+                channel, message_chars or None,
+                int(os.getenv(f"{prefix}_MAX_MESSAGES", "3")),
+                int(os.getenv(f"{prefix}_MAX_TOKENS", str(self.max_tokens))),
+                self.chars_per_token
+            )
+        return budget
+
+    def max_tokens_for(self, channel: Optional[str], messages: List[dict], prompt_tokens: Optional[int] = None) -> int:
+        """Completion budget for a request, after counting its prompt (unless prompt_tokens is given)"""
+        if prompt_tokens is None:
+            prompt_tokens = count_message_tokens(messages)
+        max_tokens = self.for_channel(channel).max_tokens
+        available = self.context_tokens - prompt_tokens
+        if available < max_tokens:
+            self.counters["clamped"] += 1
+            max_tokens = max(self.min_tokens, available)
+        self.counters["requests"] += 1
+        self.counters["prompt_tokens"] += prompt_tokens
+        self.counters["budgeted_tokens"] += max_tokens
+        return max_tokens
+
+    def split(self, channel: Optional[str], text: str) -> List[str]:
+        """Reply as channel-sized messages; beyond max_messages the last one ends in an ellipsis"""
+        budget = self.for_channel(channel)
+        parts = split_message(text, budget.message_chars)
+        if len(parts) > 1:
+            self.counters["split"] += 1
+        if len(parts) > budget.max_messages:
+            parts = parts[:budget.max_messages]
+            parts[-1] = parts[-1][:budget.message_chars - 1].rstrip() + "…"
+        return parts
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "channels": {name: budget.max_tokens for name, budget in self._channels.items()}
+        }
+
+token_budget = TokenBudget()
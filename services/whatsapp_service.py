@@ -1,97 +1,136 @@
 import os
-import re
+import hmac
+import asyncio
+import base64
+import hashlib
 import logging
-from twilio.rest import Client
+from typing import Dict, Optional
+from services.http_client import http_clients
+from services.delivery_queue import DeliveryQueue, RetryableError
+from services.intent_router import IntentRouter
+from services.briefing_service import BriefingService
+from services.metrics import metrics
+from services.token_budget import token_budget
+from services.llm_scheduler import identity_for
 
 logger = logging.getLogger(__name__)
 
 class WhatsAppService:
     """WhatsApp service using Twilio"""
     
-    def __init__(self, ai_service, email_service, calendar_service, reminder_service):
+    def __init__(self, ai_service, email_service, calendar_service, reminder_service,
+                 intent_router: Optional[IntentRouter] = None):
         self.ai_service = ai_service
         self.email_service = email_service
         self.calendar_service = calendar_service
         self.reminder_service = reminder_service
+        self.intent_router = intent_router or IntentRouter(
+            email_service, calendar_service, reminder_service,
+            BriefingService(ai_service, email_service, calendar_service, reminder_service)
+        )
         
         self.account_sid = os.getenv("TWILIO_ACCOUNT_SID")
         self.auth_token = os.getenv("TWILIO_AUTH_TOKEN")
         self.whatsapp_number = os.getenv("TWILIO_WHATSAPP_NUMBER")
+        self.api_url = os.getenv("TWILIO_API_URL", "https://api.twilio.com")
+        # Local development only: accept unsigned webhooks when there is no auth token to check them with
+        self.skip_signature = os.getenv("TWILIO_SKIP_SIGNATURE", "false").lower() == "true"
         
-        if self.account_sid and self.auth_token:
-            self.client = Client(self.account_sid, self.auth_token)
-        else:
-            self.client = None
+        self.configured = bool(self.account_sid and self.auth_token)
+        if not self.configured:
             logger.warning("Twilio credentials not configured")
+        
+        # Sends go through a bounded queue so Twilio round trips never block the event loop
+        self.outbox = DeliveryQueue(
+            "whatsapp",
+            self._send_via_twilio,
+            workers=int(os.getenv("WHATSAPP_SEND_WORKERS", "4")),
+            maxsize=int(os.getenv("WHATSAPP_QUEUE_SIZE", "1000")),
+            max_retries=int(os.getenv("WHATSAPP_SEND_RETRIES", "5"))
+        )
+        
+        self.reminder_service.register_delivery("whatsapp", self._deliver_reminder)
     
     async def handle_message(self, data: dict):
         """Handle incoming WhatsApp messages"""
         try:
+            await self.process_message(data)
+        except Exception as e:
+            logger.error(f"WhatsApp error: {e}")
+    
+    async def process_message(self, data: dict):
+        """Answer one Twilio webhook payload and wait for the reply to be sent; raises so the inbound queue can retry it"""
+        # An exception escaping the request is counted as its error
+        with metrics.request("whatsapp"):
+            # Without credentials there is no way to reply; fail before spending an LLM call
+            if not self.configured:
+                raise RetryableError("Twilio credentials not configured")
+            
             # Parse Twilio webhook
-            from_number = data.get('From', '')
-            message_body = data.get('Body', '')
+            with metrics.stage("parse", "whatsapp"):
+                from_number = data.get('From', '')
+                message_body = data.get('Body', '')
             
             # Process message
-            response = await self._process_whatsapp_message(message_body)
+            response = await self._process_whatsapp_message(message_body, from_number)
             
-            # Send response
-            if self.client:
-                self.client.messages.create(
-                    body=response,
-                    from_=self.whatsapp_number,
-                    to=from_number
-                )
-        except Exception as e:
-            logger.error(f"WhatsApp error: {e}")
+            # Send response, split at sentences into WhatsApp-sized messages. The inbound
+            # queue only marks the event done once Twilio has accepted every part
+            await asyncio.gather(*(
+                self.outbox.deliver(from_number, part) for part in token_budget.split("whatsapp", response)
+            ))
     
-    async def _process_whatsapp_message(self, message: str) -> str:
+    def verify_signature(self, url: str, params: Dict[str, str], signature: Optional[str]) -> bool:
+        """Check X-Twilio-Signature: base64 HMAC-SHA1 of the URL plus sorted params, keyed by the auth token"""
+        if not self.auth_token:
+            # Without a token nothing can be verified; refuse unless explicitly opted out
+            return self.skip_signature
+        if not signature:
+            return False
+        signed = url + "".join(key + params[key] for key in sorted(params))
+        digest = hmac.new(self.auth_token.encode(), signed.encode(), hashlib.sha1).digest()
+        return hmac.compare_digest(base64.b64encode(digest).decode(), signature)
+    
+    async def _process_whatsapp_message(self, message: str, from_number: str = "") -> str:
         """Process WhatsApp message and determine response"""
-        message_lower = message.lower()
-        
-        # Check for reminders
-        if "remind" in message_lower:
-            return self._handle_remind(message)
-        
-        # Check for emails
-        elif "email" in message_lower:
-            emails = self.email_service.get_recent_emails(3)
-            return "Your emails:\n" + "\n".join(emails[:3]) if emails else "No emails found"
-        
-        # Check for calendar
-        elif "calendar" in message_lower or "schedule" in message_lower:
-            events = self.calendar_service.get_upcoming_events(7)
-            return "Your upcoming events:\n" + "\n".join(events[:3]) if events else "No events found"
+        # Reminders, emails and calendar are answered locally
+        response = await self.intent_router.handle(message, "whatsapp", from_number or None)
+        if response is not None:
+            return response
         
         # Default: ask AI
-        else:
-            response = await self.ai_service.ask(message)
-            return response[:1000]  # WhatsApp message limit
+        return await self.ai_service.ask(
+            message, conversation_id=f"whatsapp:{from_number}" if from_number else None,
+            user_id=identity_for("whatsapp", from_number) if from_number else None, channel="whatsapp"
+        )
     
-    def _handle_remind(self, message: str) -> str:
-        """Handle reminder requests from WhatsApp"""
-        # Parse reminder: "Remind me in 30m to do something"
-        time_match = re.search(r'(\d+)\s*(m|h|d)', message)
-        if time_match:
-            self.reminder_service.schedule_reminder(
-                f"{time_match.group(1)}{time_match.group(2)}",
-                message,
-                "whatsapp"
-            )
-            return f"Reminder set for {time_match.group(1)}{time_match.group(2)}"
-        return "Couldn't parse reminder time. Use format: 'remind me in 30m to...'"
+    async def _deliver_reminder(self, reminder: dict):
+        """Deliver a due reminder back to the sender; raises if it wasn't sent, so it is retried"""
+        if not self.configured:
+            raise RetryableError("Twilio credentials not configured")
+        await self.outbox.deliver(reminder["user_id"], f"⏰ Reminder: {reminder['message']}")
     
     def send_whatsapp_message(self, to_number: str, message: str) -> bool:
-        """Send a WhatsApp message"""
-        try:
-            if not self.client:
-                return False
-            
-            self.client.messages.create(
-                body=message,
-                from_=self.whatsapp_number,
-                to=to_number
-            )
-            return True
-        except Exception as e:
-            logger.error(f"Failed to send WhatsApp message: {e}")
+        """Queue a WhatsApp message; returns False if it can't be queued"""
+        if not self.configured:
             return False
+        return self.outbox.enqueue(to_number, message)
+    
+    async def _send_via_twilio(self, to_number: str, message: str):
+        """Send one message through the Twilio REST API on the shared HTTP client"""
+        response = await http_clients.post(
+            f"{self.api_url}/2010-04-01/Accounts/{self.account_sid}/Messages.json",
+            auth=(self.account_sid, self.auth_token),
+            data={"From": self.whatsapp_number, "To": to_number, "Body": message}
+        )
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get("Retry-After")
+            raise RetryableError(
+                f"Twilio error: {response.status_code}",
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+        if response.status_code >= 400:
+            raise Exception(f"Twilio error: {response.status_code} - {response.text}")
+    
+    def stats(self) -> dict:
+        return self.outbox.stats()
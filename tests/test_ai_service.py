@@ -0,0 +1,54 @@
+import asyncio
+import time
+import uuid
+from services.ai_service import AIService
+from services.llm_scheduler import FairScheduler, TokenQuota
+from services.singleflight import SingleFlight
+
+class SlowRouter:
+    providers = ["fake"]
+
+    def __init__(self):
+        self.calls = 0
+
+    async def complete(self, messages, max_tokens, temperature, identity):
+        self.calls += 1
+        await asyncio.sleep(0.02)
+        return "forty two"
+
+def _service(monkeypatch):
+    monkeypatch.setenv("QUOTA_TOKENS_PER_HOUR", "100000")
+    monkeypatch.setenv("QUOTA_TOKENS_PER_DAY", "0")
+    service = AIService(quota=TokenQuota(), scheduler=FairScheduler(), router=SlowRouter())
+    service.single_flight = SingleFlight()
+    return service
+
+def _used(service, identity):
+    return service.quota._usage(identity, 3600, time.time())[0]
+
+def test_coalesced_callers_are_each_charged(monkeypatch):
+    service = _service(monkeypatch)
+    # A prompt no other test has cached
+    question = f"what is the answer? {uuid.uuid4()}"
+
+    async def main():
+        return await asyncio.gather(
+            service.generate(question, user_id="web:alice"),
+            service.generate(question, user_id="web:bob"),
+        )
+    assert asyncio.run(main()) == ["forty two", "forty two"]
+    assert service.router.calls == 1 and service.single_flight.counters["coalesced"] == 1
+    assert _used(service, "web:alice") > 0
+    assert _used(service, "web:alice") == _used(service, "web:bob")
+
+def test_callers_at_different_priorities_are_not_coalesced(monkeypatch):
+    service = _service(monkeypatch)
+    question = f"summarize my day {uuid.uuid4()}"
+
+    async def main():
+        await asyncio.gather(
+            service.generate(question, user_id="web:alice"),
+            service.generate(question, user_id="web:alice", priority="background"),
+        )
+    asyncio.run(main())
+    assert service.router.calls == 2
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from bench.mock_servers import MockRecorder, create_mock_app
+from bench.run import drive, parse_args, percentile, summarize, twilio_signature
+from services.whatsapp_service import WhatsAppService
+
+class _Reminders:
+    def register_delivery(self, platform, deliver):
+        pass
+
+def test_percentiles_are_reported_in_milliseconds():
+    values = [i / 1000 for i in range(1, 101)]
+    assert percentile(values, 0.5) == 0.051
+    assert percentile([], 0.5) is None
+    assert summarize(values, "latency") == {
+        "latency_p50_ms": 51.0, "latency_p95_ms": 96.0, "latency_p99_ms": 100.0, "latency_max_ms": 100.0
+    }
+    assert summarize([], "ttft")["ttft_p50_ms"] is None
+
+def test_drive_runs_every_request_under_the_concurrency_cap():
+    running, peak = [0], [0]
+
+    async def request(index):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.001)
+        running[0] -= 1
+        if index == 3:
+            raise RuntimeError("refused")
+        return {"ok": True}
+    results = asyncio.run(drive(4, 20, request))
+    assert len(results) == 20 and peak[0] == 4
+    [failed] = [r for r in results if not r["ok"]]
+    assert failed["error"] == "RuntimeError('refused')" and "latency" in failed and "started" in failed
+
+def test_harness_signs_webhooks_the_way_the_service_verifies_them(monkeypatch):
+    monkeypatch.setenv("TWILIO_AUTH_TOKEN", "bench")
+    monkeypatch.delenv("TWILIO_SKIP_SIGNATURE", raising=False)
+    service = WhatsAppService(None, None, None, _Reminders())
+    url, params = "http://127.0.0.1:8765/whatsapp/webhook", {"From": "whatsapp:+1", "Body": "hi"}
+    assert service.verify_signature(url, params, twilio_signature("bench", url, params))
+
+def test_mock_llm_honours_max_tokens_and_streams():
+    recorder = MockRecorder()
+    client = TestClient(create_mock_app(recorder, latency=0, tokens_per_second=0, reply_tokens=10))
+    reply = client.post("/v1/chat/completions", json={"messages": [{"role": "user", "content": "hi"}],
+                                                      "max_tokens": 3}).json()
+    assert reply["choices"][0]["message"]["content"] == "word0 word1 word2"
+    assert reply["usage"]["completion_tokens"] == 3
+    streamed = client.post("/v1/chat/completions", json={"messages": [], "stream": True, "max_tokens": 2})
+    events = [line[len("data: "):] for line in streamed.text.split("\n") if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    assert [json.loads(e)["choices"][0]["delta"]["content"] for e in events[:-1]] == ["word0 ", "word1 "]
+    assert recorder.llm_requests == 2
+
+def test_mock_injects_errors_and_records_channel_replies():
+    recorder = MockRecorder()
+    client = TestClient(create_mock_app(recorder, latency=0, tokens_per_second=0, error_rate=1.0))
+    assert client.post("/v1/chat/completions", json={"messages": []}).status_code == 500
+    assert recorder.llm_errors == 1
+    client.post("/2010-04-01/Accounts/AC1/Messages.json", content="To=whatsapp%3A%2B1&Body=hi",
+                headers={"Content-Type": "application/x-www-form-urlencoded"})
+    client.post("/api/v10/webhooks/1/tok")
+    client.patch("/api/v10/webhooks/1/tok/messages/@original")
+    assert list(recorder.twilio) == ["whatsapp:+1"]
+    first, last = recorder.discord["tok"]
+    assert first <= last
+
+def test_unknown_scenarios_are_rejected():
+    assert parse_args(["--scenarios", "chat,whatsapp"]).scenarios == ["chat", "whatsapp"]
+    with pytest.raises(SystemExit):
+        parse_args(["--scenarios", "chat,email"])
@@ -0,0 +1,75 @@
+import asyncio
+import time
+from services.briefing_service import BriefingService
+from services.intent_router import IntentRouter
+from services.reminder_service import ReminderService
+from services.reminder_store import ReminderStore
+
+class SlowCalendar:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def get_upcoming_events(self, days, limit):
+        time.sleep(self.delay)
+        return ["09:00 Standup"]
+
+class BrokenEmail:
+    def get_recent_emails(self, count):
+        raise ConnectionError("IMAP down")
+
+class Email:
+    def get_recent_emails(self, count):
+        return ["[Work] boss@example.com: Quarterly plan"]
+
+class FakeAI:
+    def __init__(self, available=True):
+        self.available = available
+        self.calls = []
+
+    def is_available(self):
+        return self.available
+
+    async def generate(self, question, context=None, user_id=None, priority="interactive"):
+        self.calls.append((context, user_id, priority))
+        return "A quiet day."
+
+def _briefing(monkeypatch, calendar=None, email=None, ai=None, **env):
+    for key, value in {"BRIEFING_SOURCE_TIMEOUT": "0.5", **env}.items():
+        monkeypatch.setenv(key, value)
+    reminders = ReminderService(ReminderStore())
+    return BriefingService(ai or FakeAI(available=False), email or Email(), calendar or SlowCalendar(), reminders)
+
+def test_sources_are_gathered_concurrently(monkeypatch):
+    briefing = _briefing(monkeypatch, calendar=SlowCalendar(0.2))
+    started = time.perf_counter()
+    result = asyncio.run(briefing.build("web"))
+    assert time.perf_counter() - started < 0.4
+    assert result["sections"]["calendar"]["items"] == ["09:00 Standup"]
+    assert result["sections"]["email"]["status"] == "ok"
+    assert result["summary"] is None
+
+def test_slow_or_failing_source_is_reported_without_sinking_the_digest(monkeypatch):
+    briefing = _briefing(monkeypatch, calendar=SlowCalendar(0.3), email=BrokenEmail(),
+                         BRIEFING_SOURCE_TIMEOUT="0.1")
+    digest = asyncio.run(briefing.digest("web"))
+    assert digest.splitlines() == [
+        "📅 Next 24 hours", "- (unavailable right now)",
+        "📧 Email", "- (unavailable right now)",
+        "⏰ Reminders", "- nothing",
+    ]
+    assert briefing.stats() == {"briefings": 1, "timeouts": 1, "errors": 1}
+
+def test_summary_uses_the_gathered_sections_at_background_priority(monkeypatch):
+    ai = FakeAI()
+    briefing = _briefing(monkeypatch, ai=ai)
+    digest = asyncio.run(briefing.digest("discord", "42"))
+    assert digest.endswith("\n\nA quiet day.")
+    context, user_id, priority = ai.calls[0]
+    assert "calendar: 09:00 Standup" in context and "reminders: none" in context
+    assert user_id == "discord:42" and priority == "background"
+
+def test_router_answers_briefing_requests(monkeypatch):
+    briefing = _briefing(monkeypatch)
+    router = IntentRouter(None, None, briefing.reminder_service, briefing)
+    reply = asyncio.run(router.handle("give me my daily briefing", "web"))
+    assert reply.startswith("📅 Next 24 hours\n- 09:00 Standup")
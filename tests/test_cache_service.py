@@ -0,0 +1,68 @@
+import time
+from services.cache_service import HashingEmbedder, ResponseCache
+
+def _cache(monkeypatch, **env):
+    for key, value in {"CACHE_NONDETERMINISTIC": "false", "CACHE_SEMANTIC": "false", **env}.items():
+        monkeypatch.setenv(key, value)
+    return ResponseCache()
+
+def _ask(question):
+    return [{"role": "user", "content": question}]
+
+def test_exact_hit_ignores_case_and_whitespace(monkeypatch):
+    cache = _cache(monkeypatch)
+    cache.set("m", "Be brief.", _ask("What is  the capital of France?"), 0, "Paris")
+    assert cache.get("m", "be brief.", _ask("what is the capital of france? "), 0) == "Paris"
+    assert cache.get("m", "Be brief.", _ask("What is the capital of Spain?"), 0) is None
+    assert cache.get("other", "Be brief.", _ask("What is the capital of France?"), 0) is None
+    assert cache.counters["hits"] == 1 and cache.counters["misses"] == 2
+
+def test_nondeterministic_requests_are_cached_only_when_enabled(monkeypatch):
+    cache = _cache(monkeypatch)
+    cache.set("m", "", _ask("tell me a joke"), 0.7, "a joke")
+    assert cache.get("m", "", _ask("tell me a joke"), 0.7) is None
+    assert cache.stats()["entries"] == 0
+    cache = _cache(monkeypatch, CACHE_NONDETERMINISTIC="true")
+    cache.set("m", "", _ask("tell me a joke"), 0.7, "a joke")
+    assert cache.get("m", "", _ask("tell me a joke"), 0.7) == "a joke"
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    cache = _cache(monkeypatch, CACHE_MAX_ENTRIES="2")
+    cache.set("m", "", _ask("a"), 0, "A")
+    cache.set("m", "", _ask("b"), 0, "B")
+    assert cache.get("m", "", _ask("a"), 0) == "A"
+    cache.set("m", "", _ask("c"), 0, "C")
+    assert cache.get("m", "", _ask("b"), 0) is None
+    assert cache.get("m", "", _ask("a"), 0) == "A"
+    assert cache.counters["evictions"] == 1
+
+def test_expired_entry_is_a_miss(monkeypatch):
+    cache = _cache(monkeypatch, CACHE_TTL_SECONDS="60")
+    cache.set("m", "", _ask("a"), 0, "A")
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert cache.get("m", "", _ask("a"), 0) is None
+    assert cache.counters["expirations"] == 1 and cache.stats()["entries"] == 0
+
+def test_similar_question_hits_only_with_the_same_history(monkeypatch):
+    cache = _cache(monkeypatch, CACHE_SEMANTIC="true", CACHE_SEMANTIC_THRESHOLD="0.7")
+    history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    cache.set("m", "", history + _ask("what is the weather in paris today"), 0, "Sunny")
+    assert cache.get("m", "", history + _ask("what is the weather in paris today please"), 0) == "Sunny"
+    assert cache.counters["semantic_hits"] == 1
+    # Everything before the final message must match exactly
+    assert cache.get("m", "", _ask("what is the weather in paris today please"), 0) is None
+    assert cache.get("m", "", history + _ask("book a table for two"), 0) is None
+
+def test_evicted_entries_leave_the_similarity_index(monkeypatch):
+    cache = _cache(monkeypatch, CACHE_SEMANTIC="true", CACHE_MAX_ENTRIES="1")
+    cache.set("m", "", _ask("first question"), 0, "1")
+    cache.set("m", "", _ask("second question"), 0, "2")
+    assert cache.stats()["vectors"] == 1
+
+def test_embedding_is_unit_length_and_deterministic():
+    embed = HashingEmbedder(dimensions=64)
+    vector = embed("the quick brown fox")
+    assert abs(sum(v * v for v in vector) - 1.0) < 1e-9
+    assert vector == embed("The  quick brown FOX")
+    assert embed("") == [0.0] * 64
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+import pytest
+from services.calendar_index import CalendarIndex, Event, parse_ics
+
+START = datetime(2026, 1, 5, 9, 0)  # a Monday
+
+def _event(rrule, start=START, duration=timedelta(hours=1), **kwargs):
+    return Event("uid", "Standup", start, start + duration, rrule=rrule, **kwargs)
+
+def _walk(event, window_start, window_end):
+    """Occurrences found by expanding the rule from its first instance, without skipping ahead"""
+    return [s for s in event.occurrences(event.start - timedelta(days=1), window_end)
+            if s + event.duration > window_start or s >= window_start]
+
+@pytest.mark.parametrize("rrule", [
+    {"FREQ": "DAILY"},
+    {"FREQ": "DAILY", "INTERVAL": "3"},
+    {"FREQ": "WEEKLY", "BYDAY": "MO,WE,FR"},
+    {"FREQ": "WEEKLY", "INTERVAL": "2", "BYDAY": "TU,TH"},
+    {"FREQ": "MONTHLY"},
+    {"FREQ": "MONTHLY", "INTERVAL": "5"},
+    {"FREQ": "YEARLY"},
+    {"FREQ": "WEEKLY", "BYDAY": "MO,FR", "COUNT": "30"},
+    {"FREQ": "DAILY", "UNTIL": "20260601T090000"},
+    {"FREQ": "MONTHLY", "BYDAY": "-1FR"},
+    {"FREQ": "MONTHLY", "INTERVAL": "2", "BYMONTHDAY": "1,-1"},
+    {"FREQ": "YEARLY", "BYMONTH": "1,7", "BYDAY": "1MO"},
+])
+def test_windowed_expansion_matches_a_full_walk(rrule):
+    event = _event(rrule)
+    for days in (0, 1, 17, 100, 400, 1000):
+        window_start = START + timedelta(days=days, hours=3)
+        window_end = window_start + timedelta(days=9)
+        assert list(event.occurrences(window_start, window_end)) == _walk(event, window_start, window_end)
+
+def test_count_and_until_end_the_series():
+    counted = list(_event({"FREQ": "WEEKLY", "BYDAY": "MO,WE,FR", "COUNT": "4"}).occurrences(START, START + timedelta(days=60)))
+    assert [s.day for s in counted] == [5, 7, 9, 12]
+    until = list(_event({"FREQ": "DAILY", "UNTIL": "20260107T090000"}).occurrences(START, START + timedelta(days=60)))
+    assert [s.day for s in until] == [5, 6, 7]
+
+def test_monthly_rule_skips_months_without_the_day():
+    event = _event({"FREQ": "MONTHLY", "COUNT": "4"}, start=datetime(2026, 1, 31, 9, 0))
+    starts = list(event.occurrences(datetime(2026, 1, 1), datetime(2027, 1, 1)))
+    assert [s.month for s in starts] == [1, 3, 5, 7]
+
+def test_occurrence_overlapping_the_window_start_is_included():
+    event = _event({"FREQ": "DAILY"}, duration=timedelta(hours=2))
+    window_start = START + timedelta(days=3, hours=1)
+    assert list(event.occurrences(window_start, window_start + timedelta(hours=1))) == [START + timedelta(days=3)]
+    # Ending exactly as the window opens is not an overlap
+    assert list(event.occurrences(window_start + timedelta(hours=1), window_start + timedelta(hours=2))) == []
+
+def test_zero_length_occurrence_at_the_window_start_is_included_like_a_single_event():
+    index = CalendarIndex()
+    index.replace("a", [
+        Event("single", "Deadline", START, START),
+        Event("daily", "Check-in", START, START, rrule={"FREQ": "DAILY"}),
+    ])
+    found = index.between(START, START + timedelta(hours=1))
+    assert sorted(event.uid for _, _, event in found) == ["daily", "single"]
+
+def test_overrides_replace_their_instance():
+    events = parse_ics("\r\n".join([
+        "BEGIN:VEVENT", "UID:1", "SUMMARY:Standup", "DTSTART:20260105T090000", "DTEND:20260105T091500",
+        "RRULE:FREQ=DAILY;COUNT=5", "EXDATE:20260107T090000", "END:VEVENT",
+        "BEGIN:VEVENT", "UID:1", "SUMMARY:Standup (moved)", "RECURRENCE-ID:20260108T090000",
+        "DTSTART:20260108T110000", "DTEND:20260108T111500", "END:VEVENT",
+    ]))
+    index = CalendarIndex()
+    index.replace("cal", events)
+    found = [(start.day, start.hour, event.summary) for start, _, event in index.between(START, START + timedelta(days=7))]
+    assert found == [(5, 9, "Standup"), (6, 9, "Standup"), (8, 11, "Standup (moved)"), (9, 9, "Standup")]
+
+def _starts(rrule, start, until):
+    return [(s.month, s.day) for s in _event(rrule, start=start).occurrences(start, until)]
+
+def test_monthly_byday_with_ordinals():
+    start = datetime(2026, 1, 1, 9, 0)
+    # Last Friday, and second Tuesday, of each month
+    assert _starts({"FREQ": "MONTHLY", "BYDAY": "-1FR"}, start, datetime(2026, 4, 1)) == [(1, 30), (2, 27), (3, 27)]
+    assert _starts({"FREQ": "MONTHLY", "BYDAY": "2TU"}, start, datetime(2026, 4, 1)) == [(1, 13), (2, 10), (3, 10)]
+    # Without an ordinal, every such weekday
+    assert _starts({"FREQ": "MONTHLY", "BYDAY": "MO", "COUNT": "5"}, start, datetime(2027, 1, 1)) == \
+        [(1, 5), (1, 12), (1, 19), (1, 26), (2, 2)]
+
+def test_monthly_bymonthday():
+    start = datetime(2026, 1, 15, 9, 0)
+    assert _starts({"FREQ": "MONTHLY", "BYMONTHDAY": "-1"}, start, datetime(2026, 4, 1)) == [(1, 31), (2, 28), (3, 31)]
+    assert _starts({"FREQ": "MONTHLY", "BYMONTHDAY": "1,15"}, start, datetime(2026, 3, 1)) == [(1, 15), (2, 1), (2, 15)]
+    # BYDAY narrows BYMONTHDAY: Friday the 13th
+    assert _starts({"FREQ": "MONTHLY", "BYMONTHDAY": "13", "BYDAY": "FR"}, start, datetime(2027, 1, 1)) == [(2, 13), (3, 13), (11, 13)]
+
+def test_yearly_byday_within_bymonth():
+    # US Thanksgiving: fourth Thursday of November
+    start = datetime(2026, 11, 26, 12, 0)
+    event = _event({"FREQ": "YEARLY", "BYMONTH": "11", "BYDAY": "4TH"}, start=start)
+    assert [(s.year, s.day) for s in event.occurrences(start, datetime(2029, 1, 1))] == [(2026, 26), (2027, 25), (2028, 23)]
+
+def test_daily_byday_keeps_only_those_weekdays():
+    starts = _starts({"FREQ": "DAILY", "BYDAY": "MO,TU,WE,TH,FR"}, START, START + timedelta(days=9))
+    assert starts == [(1, 5), (1, 6), (1, 7), (1, 8), (1, 9), (1, 12), (1, 13)]
+
+@pytest.mark.parametrize("rrule", [
+    {"FREQ": "MONTHLY", "BYDAY": "MO,TU,WE,TH,FR", "BYSETPOS": "-1"},
+    {"FREQ": "YEARLY", "BYDAY": "20MO"},
+    {"FREQ": "WEEKLY", "BYDAY": "1MO"},
+    {"FREQ": "HOURLY"},
+])
+def test_unsupported_rules_index_only_the_first_occurrence(rrule, caplog):
+    text = ";".join(f"{key}={value}" for key, value in rrule.items())
+    events = parse_ics("\n".join([
+        "BEGIN:VEVENT", "UID:odd", "DTSTART:20260105T090000", "DTEND:20260105T100000",
+        f"RRULE:{text}", "END:VEVENT",
+    ]))
+    assert "Unsupported RRULE" in caplog.text
+    assert list(events[0].occurrences(START - timedelta(days=1), START + timedelta(days=400))) == [START]
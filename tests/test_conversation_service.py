@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+from services.conversation_service import ConversationStore, SQLiteConversationBackend
+
+def _store(path, monkeypatch, interval_ms="50"):
+    monkeypatch.setenv("CONVERSATION_COMMIT_INTERVAL_MS", interval_ms)
+    return ConversationStore(SQLiteConversationBackend(str(path)))
+
+def test_turns_are_committed_off_the_caller_in_batches(tmp_path, monkeypatch):
+    store = _store(tmp_path / "c.db", monkeypatch)
+    committed_on = []
+    flush = store.backend.flush
+
+    def recording_flush():
+        if store.backend.stats()["queued"]:
+            committed_on.append(threading.current_thread().name)
+        flush()
+    store.backend.flush = recording_flush
+    for i in range(10):
+        store.add_turn("web:a", "user", f"question {i}")
+        store.add_turn("web:a", "assistant", f"answer {i}")
+    for _ in range(100):
+        if store.backend.stats()["writes"] == 20:
+            break
+        time.sleep(0.01)
+    assert store.backend.stats()["commits"] <= 2
+    assert committed_on == ["conversation-writer"]
+    store.backend.close()
+
+def test_reload_sees_turns_still_queued(tmp_path, monkeypatch):
+    # A long interval keeps the writes queued when the conversation is evicted and reloaded
+    store = _store(tmp_path / "c.db", monkeypatch, interval_ms="60000")
+    store.add_turn("web:a", "user", "hello")
+    store.add_turn("web:a", "assistant", "hi there")
+    store.clear("web:a")
+    assert store.build_messages("web:a", "system", "next")[1:] == [{"role": "user", "content": "next"}]
+    asyncio.run(store.load("web:a"))
+    messages = store.build_messages("web:a", "system", "next")
+    assert [m["content"] for m in messages] == ["system", "hello", "hi there", "next"]
+    assert store.stats()["reloaded"] == 1
+
+def test_close_commits_queued_writes(tmp_path, monkeypatch):
+    path = tmp_path / "c.db"
+    store = _store(path, monkeypatch, interval_ms="60000")
+    store.add_turn("web:a", "user", "hello")
+    store.backend.close()
+    reopened = ConversationStore(SQLiteConversationBackend(str(path)))
+    asyncio.run(reopened.load("web:a"))
+    assert [m["content"] for m in reopened.build_messages("web:a", "system", "next")] == ["system", "hello", "next"]
+    reopened.backend.close()
+
+def test_reload_reads_the_database_off_the_event_loop(tmp_path, monkeypatch):
+    store = _store(tmp_path / "c.db", monkeypatch)
+    store.add_turn("web:a", "user", "hello")
+    store.clear("web:a")
+    loaded_on = []
+    load = store.backend.load
+
+    def recording_load(*args):
+        loaded_on.append(threading.current_thread() is threading.main_thread())
+        return load(*args)
+    store.backend.load = recording_load
+
+    async def main():
+        await store.load("web:a")
+        # Already in memory: no second read
+        await store.load("web:a")
+    asyncio.run(main())
+    assert loaded_on == [False]
+    store.backend.close()
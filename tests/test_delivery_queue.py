@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+from services.delivery_queue import DeliveryQueue, RetryableError
+
+def test_deliver_waits_for_the_send_and_raises_when_it_fails():
+    async def main():
+        sent = []
+
+        async def send(recipient, payload):
+            if payload == "bad":
+                raise RuntimeError("rejected")
+            await asyncio.sleep(0.01)
+            sent.append(payload)
+        queue = DeliveryQueue("test", send, workers=2, maxsize=10)
+        await queue.deliver("+1", "hello")
+        assert sent == ["hello"]
+        with pytest.raises(RuntimeError):
+            await queue.deliver("+1", "bad")
+        # enqueue stays fire-and-forget
+        assert queue.enqueue("+1", "later")
+        await queue.drain()
+        assert sent == ["hello", "later"]
+        await queue.stop()
+    asyncio.run(main())
+
+def test_retryable_errors_are_retried_before_deliver_gives_up():
+    async def main():
+        attempts = []
+
+        async def send(recipient, payload):
+            attempts.append(payload)
+            raise RetryableError("busy", retry_after=0)
+        queue = DeliveryQueue("test", send, workers=1, maxsize=10, max_retries=2)
+        with pytest.raises(RetryableError):
+            await queue.deliver("+1", "hello")
+        assert len(attempts) == 3
+        await queue.stop()
+    asyncio.run(main())
+
+def test_stop_fails_deliveries_still_waiting():
+    async def main():
+        started = asyncio.Event()
+
+        async def send(recipient, payload):
+            started.set()
+            await asyncio.sleep(10)
+        queue = DeliveryQueue("test", send, workers=1, maxsize=10)
+        first = asyncio.create_task(queue.deliver("+1", "a"))
+        second = asyncio.create_task(queue.deliver("+1", "b"))
+        await started.wait()
+        await queue.stop()
+        for waiter in (first, second):
+            with pytest.raises(RetryableError):
+                await waiter
+    asyncio.run(main())
+
+def test_same_recipient_stays_in_order_while_others_go_in_parallel():
+    async def main():
+        sent, running, peak = [], [0], [0]
+
+        async def send(recipient, payload):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.005 if payload % 2 else 0.001)
+            running[0] -= 1
+            sent.append((recipient, payload))
+        queue = DeliveryQueue("test", send, workers=8, maxsize=100)
+        recipients = [f"+{n}" for n in range(8)]
+        for payload in range(6):
+            for recipient in recipients:
+                queue.enqueue(recipient, payload)
+        await queue.drain()
+        for recipient in recipients:
+            assert [p for r, p in sent if r == recipient] == list(range(6))
+        assert peak[0] > 1
+        assert queue.stats()["sent"] == 48 and queue.stats()["depth"] == 0
+        await queue.stop()
+    asyncio.run(main())
+
+def test_full_shard_rejects_instead_of_growing():
+    async def main():
+        release = asyncio.Event()
+
+        async def send(recipient, payload):
+            await release.wait()
+        queue = DeliveryQueue("test", send, workers=1, maxsize=2)
+        assert queue.enqueue("+1", "a")
+        await asyncio.sleep(0)  # the worker takes "a" off the shard
+        assert queue.enqueue("+1", "b") and queue.enqueue("+1", "c")
+        assert not queue.enqueue("+1", "d")
+        assert queue.counters["rejected"] == 1
+        release.set()
+        await queue.drain()
+        assert queue.counters["sent"] == 3
+        await queue.stop()
+    asyncio.run(main())
@@ -0,0 +1,131 @@
+import asyncio
+import sys
+import time
+import types
+from services.discord_interactions import InteractionVerifier
+from services.discord_service import DiscordService
+from services.http_client import http_clients
+from services.intent_router import IntentRouter
+from services.reminder_service import ReminderService
+from services.reminder_store import ReminderStore
+
+class _Response:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+def _verifier(monkeypatch, **env):
+    for key in ("DISCORD_PUBLIC_KEY", "DISCORD_SKIP_SIGNATURE"):
+        monkeypatch.delenv(key, raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    return InteractionVerifier()
+
+def test_missing_public_key_rejects_unless_opted_out(monkeypatch):
+    verifier = _verifier(monkeypatch)
+    assert not verifier.verify(None, None, b"{}")
+    assert verifier.stats()["rejected"] == 1
+    assert _verifier(monkeypatch, DISCORD_SKIP_SIGNATURE="true").verify(None, None, b"{}")
+
+def test_bad_signature_is_rejected(monkeypatch):
+    verifier = _verifier(monkeypatch, DISCORD_PUBLIC_KEY="00" * 32)
+    assert not verifier.verify("ab" * 64, "1700000000", b"{}")
+
+class _AcceptingKey:
+    def __init__(self):
+        self.checks = 0
+
+    def verify(self, message, signature):
+        self.checks += 1
+
+def test_cached_signature_is_not_accepted_once_stale(monkeypatch):
+    exceptions = types.ModuleType("nacl.exceptions")
+    exceptions.BadSignatureError = type("BadSignatureError", (Exception,), {})
+    monkeypatch.setitem(sys.modules, "nacl", types.ModuleType("nacl"))
+    monkeypatch.setitem(sys.modules, "nacl.exceptions", exceptions)
+    verifier = _verifier(monkeypatch, DISCORD_PUBLIC_KEY="00" * 32, DISCORD_SIGNATURE_MAX_SKEW="300")
+    verifier._verify_key = _AcceptingKey()
+    now = time.time()
+    signature, timestamp = "ab" * 64, str(int(now))
+    assert verifier.verify(signature, timestamp, b"{}")
+    assert verifier.verify(signature, timestamp, b"{}")
+    assert verifier._verify_key.checks == 1 and verifier.stats()["cache_hits"] == 1
+    # The same signed request replayed after the skew window is rejected despite the cache
+    monkeypatch.setattr(time, "time", lambda: now + 301)
+    assert not verifier.verify(signature, timestamp, b"{}")
+
+def _services(monkeypatch, token="bot-token"):
+    if token:
+        monkeypatch.setenv("DISCORD_TOKEN", token)
+    else:
+        monkeypatch.delenv("DISCORD_TOKEN", raising=False)
+    reminders = ReminderService(ReminderStore())
+    built = []
+
+    def load_channel(platform):
+        if platform == "discord":
+            built.append(DiscordService(None, None, None, reminders, IntentRouter(None, None, reminders)))
+    reminders.on_missing_delivery = load_channel
+    return reminders, built
+
+def test_interaction_reminder_builds_the_discord_channel(monkeypatch):
+    reminders, built = _services(monkeypatch)
+    router = IntentRouter(None, None, reminders)
+    reply = asyncio.run(router.handle("remind me in 30m to stretch", "discord", "42"))
+    assert reply == "Reminder set for 30m"
+    assert len(built) == 1
+    assert [r["user_id"] for r in reminders.pending_for("discord", "42")] == ["42"]
+
+def test_no_bot_token_means_no_discord_reminders(monkeypatch):
+    reminders, built = _services(monkeypatch, token=None)
+    router = IntentRouter(None, None, reminders)
+    assert asyncio.run(router.handle("remind me in 30m to stretch", "discord", "42")) is None
+    assert not reminders.pending_for("discord", "42")
+
+def test_reminder_is_dmed_over_rest_without_a_gateway(monkeypatch):
+    reminders, built = _services(monkeypatch)
+    assert reminders.has_delivery("discord")
+    sent = []
+
+    async def post(url, **kwargs):
+        sent.append((url, kwargs["json"], kwargs["headers"]["Authorization"]))
+        return _Response({"id": "dm-1"})
+    monkeypatch.setattr(http_clients, "post", post)
+
+    asyncio.run(reminders._deliver({"id": "r1", "platform": "discord", "user_id": "42",
+                                    "message": "stretch", "due": 0}))
+    assert [url.rsplit("/api/v10", 1)[-1] for url, _, _ in sent] == ["/users/@me/channels", "/channels/dm-1/messages"]
+    assert sent[0][1] == {"recipient_id": "42"}
+    assert sent[1][1] == {"content": "⏰ Reminder: stretch"}
+    assert sent[1][2] == "Bot bot-token"
+
+class _StartRecorder:
+    def __init__(self):
+        self.starts = []
+
+    def register_delivery(self, platform, deliver):
+        pass
+
+    async def start(self, dispatch=True, shared=False):
+        self.starts.append(dispatch)
+
+def test_gateway_under_the_app_leaves_reminder_dispatch_to_leader_election(monkeypatch):
+    monkeypatch.setenv("DISCORD_TOKEN", "bot-token")
+    reminders = _StartRecorder()
+    service = DiscordService(None, None, None, reminders, IntentRouter(None, None, reminders))
+
+    async def main():
+        # start_gateway() runs the bot as a task on the elected leader
+        service._gateway = asyncio.get_running_loop().create_future()
+        await service.bot.on_ready()
+        assert reminders.starts == []
+        # A standalone bot (start()) has nothing else to dispatch its reminders
+        service._gateway = None
+        await service.bot.on_ready()
+        assert reminders.starts == [True]
+    asyncio.run(main())
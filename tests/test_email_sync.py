@@ -0,0 +1,128 @@
+import imaplib
+import socket
+import threading
+import time
+import pytest
+from services.email_sync import HeaderCache, IMAPConnection, LocalIMAP, MailAccount, MailSync
+
+def _sync(accounts):
+    servers = {account.name: LocalIMAP() for account in accounts}
+    sync = MailSync(accounts, HeaderCache(), connector=lambda account: servers[account.name])
+    sync.max_age = 0
+    return sync, servers
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_stale_refresh_with_one_account_completes():
+    sync, servers = _sync([MailAccount("Only", "local", "", "")])
+    servers["Only"].deliver("a@example.com", "first")
+    sync.refresh()
+    assert sync.recent(5) == ["[Only] a@example.com: first"]
+
+    servers["Only"].deliver("b@example.com", "second")
+    time.sleep(0.01)
+    sync.refresh()
+    _wait_for(lambda: len(sync.recent(5)) == 2)
+    # The background refresh released its lock, so the next stale read refreshes again
+    _wait_for(lambda: sync._refreshing.acquire(blocking=False))
+    sync._refreshing.release()
+    servers["Only"].deliver("c@example.com", "third")
+    sync.refresh()
+    _wait_for(lambda: len(sync.recent(5)) == 3)
+    sync.stop()
+
+def test_refresh_syncs_every_account():
+    sync, servers = _sync([MailAccount("A", "local", "", ""), MailAccount("B", "local", "", "")])
+    servers["A"].deliver("a@example.com", "from A")
+    servers["B"].deliver("b@example.com", "from B")
+    sync.refresh()
+    assert sorted(sync.recent(5)) == ["[A] a@example.com: from A", "[B] b@example.com: from B"]
+    sync.stop()
+
+def test_only_new_headers_are_fetched():
+    sync, servers = _sync([MailAccount("Only", "local", "", "")])
+    servers["Only"].deliver("a@example.com", "first")
+    sync.sync_all()
+    servers["Only"].deliver("b@example.com", "second")
+    sync.sync_all()
+    sync.sync_all()
+    assert sync.counters["fetched"] == 2
+    assert sync.counters["unchanged"] == 1
+    sync.stop()
+
+def test_email_service_stop_stops_sync(monkeypatch):
+    from services.email_service import EmailService
+    monkeypatch.setenv("EMAIL_BACKEND", "local")
+    service = EmailService()
+    service.sync.start_idle()
+    service.stop()
+    assert service.sync._stopping.is_set()
+    assert service.sync.stats()["idle"] == 0
+
+class _FakeIMAP:
+    """Just enough of imaplib.IMAP4 for IMAPConnection.idle, over a socketpair"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile("rb")
+
+    def select(self, mailbox, readonly=False):
+        pass
+
+    def _new_tag(self):
+        return b"A1"
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        return self.file.readline()
+
+def _idle_server(server, quiet_rounds):
+    lines = server.makefile("rb")
+    for _ in range(quiet_rounds):
+        assert lines.readline() == b"A1 IDLE\r\n"
+        server.sendall(b"+ idling\r\n")
+        assert lines.readline() == b"DONE\r\n"
+        server.sendall(b"A1 OK IDLE terminated\r\n")
+
+def _connection(client):
+    connection = IMAPConnection.__new__(IMAPConnection)
+    connection._imap = _FakeIMAP(client)
+    return connection
+
+def test_quiet_idle_times_out_cleanly_and_can_idle_again():
+    client, server = socket.socketpair()
+    threading.Thread(target=_idle_server, args=(server, 2), daemon=True).start()
+    connection = _connection(client)
+    assert connection.idle("INBOX", 0.05) is False
+    assert connection.idle("INBOX", 0.05) is False
+    client.close()
+    server.close()
+
+def test_interrupt_breaks_a_blocked_idle():
+    client, server = socket.socketpair()
+    server.sendall(b"+ idling\r\n")
+    connection = _connection(client)
+    threading.Timer(0.05, connection.interrupt).start()
+    started = time.monotonic()
+    with pytest.raises(imaplib.IMAP4.abort):
+        connection.idle("INBOX", 30)
+    assert time.monotonic() - started < 5
+    client.close()
+    server.close()
+
+def test_stop_wakes_idle_threads():
+    sync, servers = _sync([MailAccount("Only", "local", "", "")])
+    sync.idle_timeout = 30
+    sync.start_idle()
+    threads = list(sync._idle_threads)
+    _wait_for(lambda: "Only" in sync._idling)
+    sync.stop()
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive()
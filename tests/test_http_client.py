@@ -0,0 +1,67 @@
+import asyncio
+import httpx
+from services.http_client import HTTPClientManager
+from services.metrics import metrics
+
+def _manager(monkeypatch, handler, **env):
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    manager = HTTPClientManager()
+    manager._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return manager
+
+def test_client_is_created_once_and_closed_on_shutdown(monkeypatch):
+    monkeypatch.setenv("HTTP2_ENABLED", "false")
+    manager = HTTPClientManager()
+
+    async def main():
+        client = manager.client
+        assert manager.client is client
+        await manager.shutdown()
+        assert client.is_closed and manager._client is None
+        await manager.startup()
+        assert manager.client is not client
+        await manager.shutdown()
+    asyncio.run(main())
+
+def test_per_host_limit_queues_excess_requests(monkeypatch):
+    running, peak = [0], [0]
+
+    async def handler(request):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return httpx.Response(200, json={"host": request.url.host})
+    manager = _manager(monkeypatch, handler, HTTP_PER_HOST_LIMIT="2")
+
+    async def main():
+        other = asyncio.create_task(manager.get("https://b.example/x"))
+        replies = await asyncio.gather(*(manager.post("https://a.example/x") for _ in range(6)))
+        await other
+        return replies
+    replies = asyncio.run(main())
+    assert [reply.json()["host"] for reply in replies] == ["a.example"] * 6
+    # Two slots for a.example, plus the one request to b.example that isn't queued behind them
+    assert peak[0] == 3
+    stats = manager.stats()
+    assert stats["in_use"] == 0 and stats["waiting"] == 0
+    assert set(stats["hosts"]) == {"a.example", "b.example"}
+
+def test_sampled_trace_is_propagated_in_traceparent(monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("traceparent"))
+        return httpx.Response(204)
+    manager = _manager(monkeypatch, handler)
+    monkeypatch.setattr(metrics, "propagate", True)
+    parent = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+
+    async def main():
+        await manager.get("https://a.example/untraced")
+        with metrics.request("test", parent):
+            await manager.get("https://a.example/traced", headers={"X-Other": "1"})
+    asyncio.run(main())
+    assert seen[0] is None
+    assert seen[1].startswith("00-" + "a" * 32 + "-") and seen[1].endswith("-01")
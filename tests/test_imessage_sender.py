@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from services.imessage_sender import RunnerError, ScriptRunner, SendError, iMessageSender
+
+class FakeRunner:
+    """Answers each request with a scripted reply: "ok", "refuse" or "crash" by recipient"""
+    starts = 1
+
+    def __init__(self):
+        self.batches = []
+
+    async def run_batch(self, requests):
+        self.batches.append([r["text"] for r in requests])
+        replies = []
+        for request in requests:
+            if request["to"] == "crash":
+                replies.append(RunnerError("runner exited"))
+            else:
+                replies.append({"ok": request["to"] != "refuse", "error": "unknown buddy"})
+        return replies
+
+    async def close(self):
+        pass
+
+def _sender(runner, **kwargs):
+    return iMessageSender(runner, linger=0, **{"max_retries": 1, **kwargs})
+
+def test_deliver_returns_once_sent_and_raises_when_refused():
+    async def main():
+        runner = FakeRunner()
+        sender = _sender(runner)
+        await sender.deliver("+1", "hello")
+        assert runner.batches == [["hello"]]
+        with pytest.raises(SendError):
+            await sender.deliver("refuse", "hello")
+        await sender.stop()
+    asyncio.run(main())
+
+def test_deliver_raises_after_retries_run_out(monkeypatch):
+    async def main():
+        async def no_sleep(delay):
+            pass
+        sender = _sender(FakeRunner())
+        sender._ensure_started()
+        monkeypatch.setattr(asyncio, "sleep", no_sleep)
+        with pytest.raises(SendError):
+            await sender.deliver("crash", "hello")
+        assert sender.stats()["retries"] == 1
+        await sender.stop()
+    asyncio.run(main())
+
+def test_deliver_raises_when_the_queue_stays_full():
+    async def main():
+        sender = _sender(FakeRunner(), maxsize=1, enqueue_timeout=0.01)
+        sender._ensure_started()
+        sender._task.cancel()
+        await asyncio.gather(sender._task, return_exceptions=True)
+        assert await sender.send("+1", "fills the queue")
+        with pytest.raises(SendError):
+            await sender.deliver("+1", "no room")
+        sender._task = None
+        await sender.stop()
+    asyncio.run(main())
+
+class _ExitedProcess:
+    """A runner process whose stdout has closed; a new batch registers while it is reaped"""
+
+    def __init__(self, runner):
+        self.runner = runner
+        self.stdout = self._lines()
+
+    async def _lines(self):
+        return
+        yield
+
+    async def wait(self):
+        self.runner._waiting[99] = asyncio.get_running_loop().create_future()
+        return 1
+
+def test_runner_exit_fails_only_the_requests_it_orphaned():
+    async def main():
+        runner = ScriptRunner(["unused"])
+        loop = asyncio.get_running_loop()
+        orphaned = [runner._waiting.setdefault(i, loop.create_future()) for i in range(3)]
+        await runner._read(_ExitedProcess(runner))
+        assert all(str(future.exception()) == "runner exited with 1" for future in orphaned)
+        assert not runner._waiting[99].done()
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+import hmac
+import pytest
+from services.imessage_sender import SendError
+from services.imessage_service import iMessageService
+from services.metrics import metrics
+
+BODY = b'{"id": "1", "from": "+15550000000", "body": "hi"}'
+
+class _Reminders:
+    def register_delivery(self, platform, deliver):
+        pass
+
+def _service(monkeypatch, **env):
+    for key in ("IMESSAGE_WEBHOOK_SECRET", "IMESSAGE_SKIP_SIGNATURE"):
+        monkeypatch.delenv(key, raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    return iMessageService(None, None, None, _Reminders())
+
+def test_valid_signature_is_accepted(monkeypatch):
+    service = _service(monkeypatch, IMESSAGE_WEBHOOK_SECRET="secret")
+    signature = hmac.new(b"secret", BODY, hashlib.sha256).hexdigest()
+    assert service.verify_signature(BODY, signature)
+    assert not service.verify_signature(BODY + b" ", signature)
+    assert not service.verify_signature(BODY, hmac.new(b"other", BODY, hashlib.sha256).hexdigest())
+    assert not service.verify_signature(BODY, None)
+
+def test_missing_secret_rejects_unless_opted_out(monkeypatch):
+    assert not _service(monkeypatch).verify_signature(BODY, None)
+    assert _service(monkeypatch, IMESSAGE_SKIP_SIGNATURE="true").verify_signature(BODY, None)
+
+class _Router:
+    async def handle(self, message, platform, user_id=None):
+        return f"echo: {message}"
+
+class _Sender:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    async def deliver(self, to, text):
+        if self.error:
+            raise self.error
+        self.sent.append((to, text))
+
+def test_reply_is_sent_before_the_message_counts_as_processed(monkeypatch):
+    service = _service(monkeypatch)
+    service.intent_router = _Router()
+    service.sender = _Sender()
+    asyncio.run(service.process_message({"from": "+1", "body": "hi"}))
+    assert service.sender.sent == [("+1", "echo: hi")]
+
+def test_unsent_reply_fails_the_message(monkeypatch):
+    service = _service(monkeypatch)
+    service.intent_router = _Router()
+    service.sender = _Sender(SendError("queue full"))
+    errors = metrics.errors.values.get(("imessage",), 0)
+    with pytest.raises(SendError):
+        asyncio.run(service.process_message({"from": "+1", "body": "hi"}))
+    assert metrics.errors.values.get(("imessage",), 0) == errors + 1
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from services.inbound_queue import InboundQueue
+
+def _queue(tmp_path, monkeypatch, **env):
+    for key, value in env.items():
+        monkeypatch.setenv(key, str(value))
+    return InboundQueue(str(tmp_path / "inbound.db"))
+
+def test_duplicate_deliveries_are_accepted_once(tmp_path, monkeypatch):
+    async def run():
+        queue = _queue(tmp_path, monkeypatch)
+        assert await queue.put("whatsapp", "SM1", "+1", {"Body": "hi"})
+        assert not await queue.put("whatsapp", "SM1", "+1", {"Body": "hi"})
+        assert await queue.put("imessage", "SM1", "+1", {"body": "hi"})
+        assert queue.counters["accepted"] == 2 and queue.counters["duplicates"] == 1
+    asyncio.run(run())
+
+def test_expired_lease_is_reclaimed(tmp_path, monkeypatch):
+    async def run():
+        queue = _queue(tmp_path, monkeypatch, INBOUND_LEASE_SECONDS=0.05)
+        await queue.put("whatsapp", "SM1", "+1", {"Body": "hi"})
+        # A worker claims the event and dies without finishing it
+        assert queue._claim() is not None
+        assert queue._claim() is None
+        time.sleep(0.1)
+        claimed = queue._claim()
+        assert claimed is not None
+        event_id, channel, payload, attempt, _, reclaimed = claimed
+        assert (channel, payload, attempt, reclaimed) == ("whatsapp", {"Body": "hi"}, 2, True)
+    asyncio.run(run())
+
+def test_events_survive_a_restart(tmp_path, monkeypatch):
+    async def run():
+        await _queue(tmp_path, monkeypatch).put("whatsapp", "SM1", "+1", {"Body": "hi"})
+        handled = []
+
+        async def handler(channel, payload):
+            handled.append(payload["Body"])
+
+        queue = _queue(tmp_path, monkeypatch, INBOUND_POLL_INTERVAL=0.01)
+        await queue.start(handler)
+        for _ in range(100):
+            if handled:
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        assert handled == ["hi"]
+    asyncio.run(run())
+
+def test_failed_event_is_retried_in_sender_order(tmp_path, monkeypatch):
+    async def run():
+        queue = _queue(tmp_path, monkeypatch, INBOUND_POLL_INTERVAL=0.01, INBOUND_WORKERS=4)
+        handled, failures = [], {"first": 1}
+
+        async def handler(channel, payload):
+            body = payload["Body"]
+            if failures.get(body):
+                failures[body] -= 1
+                raise RuntimeError("upstream down")
+            handled.append(body)
+
+        monkeypatch.setattr("services.inbound_queue.random.uniform", lambda a, b: 0.01)
+        await queue.put("whatsapp", "SM1", "+1", {"Body": "first"})
+        await queue.put("whatsapp", "SM2", "+1", {"Body": "second"})
+        await queue.start(handler)
+        for _ in range(300):
+            if len(handled) == 2:
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        assert handled == ["first", "second"]
+        assert queue.counters["retried"] == 1
+    asyncio.run(run())
+
+def test_in_memory_path_warns(caplog):
+    InboundQueue(":memory:")
+    assert "lost on restart" in caplog.text
@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from services.intent_router import IntentRouter
+
+class FakeEmail:
+    def get_recent_emails(self, count):
+        return ["[Gmail] boss@example.com: Q3 numbers"]
+
+class FakeCalendar:
+    def get_upcoming_events(self, days, count):
+        return ["Mon 10:00 Standup"]
+
+class FakeReminders:
+    def __init__(self, platforms=("whatsapp", "discord")):
+        self.platforms = platforms
+        self.scheduled = []
+
+    def has_delivery(self, platform):
+        return platform in self.platforms
+
+    def schedule_reminder(self, time_str, message, platform, user_id=None):
+        self.scheduled.append((time_str, message, platform, user_id))
+        return "r1"
+
+def _router(reminders=None):
+    return IntentRouter(FakeEmail(), FakeCalendar(), reminders or FakeReminders())
+
+@pytest.mark.parametrize("message", [
+    "help me write an email to my boss",
+    "remind me what a monad is",
+    "what's a good schedule for learning Go",
+    "can you explain what an inbox zero workflow is",
+    "draft a calendar invite for the team offsite",
+    "tell me about my day at the beach, a short story",
+])
+def test_open_ended_messages_with_keywords_go_to_the_llm(message):
+    router = _router()
+    assert router.route(message) == ("chat", "llm")
+    assert asyncio.run(router.handle(message, "whatsapp", "+1")) is None
+
+@pytest.mark.parametrize("message, intent", [
+    ("Remind me in 30m to call mom", "remind"),
+    ("please remind me to stretch in 2h", "remind"),
+    ("What emails do I have?", "email"),
+    ("check my inbox", "email"),
+    ("show me unread emails", "email"),
+    ("What's on my calendar tomorrow?", "calendar"),
+    ("what meetings do I have", "calendar"),
+    ("give me my daily briefing", "briefing"),
+    ("what's my day look like", "briefing"),
+])
+def test_commands_are_routed_locally(message, intent):
+    assert _router().route(message) == (intent, "keyword")
+
+def test_reminder_is_scheduled_with_its_task():
+    reminders = FakeReminders()
+    reply = asyncio.run(_router(reminders).handle("Remind me in 30m to call mom", "whatsapp", "+1"))
+    assert reply == "Reminder set for 30m"
+    assert reminders.scheduled == [("30m", "call mom", "whatsapp", "+1")]
+
+def test_reminder_that_cannot_be_delivered_falls_through_to_the_llm():
+    router = _router(FakeReminders(platforms=()))
+    assert asyncio.run(router.handle("remind me in 30m to call mom", "web")) is None
+    stats = router.stats()
+    assert stats["total"] == 1 and stats["llm_avoided"] == 0
+
+def test_local_handlers_answer_from_services():
+    router = _router()
+    assert "Q3 numbers" in asyncio.run(router.handle("check my email", "web"))
+    assert "Standup" in asyncio.run(router.handle("show my calendar", "web"))
@@ -0,0 +1,55 @@
+import asyncio
+from services.job_queue import JobQueue
+
+def _gated(started, gates, name):
+    gates[name] = asyncio.Event()
+
+    async def run():
+        started.append(name)
+        await gates[name].wait()
+    return run
+
+def test_parked_job_runs_before_later_jobs_for_its_key():
+    async def main():
+        queue = JobQueue("test", workers=3, maxsize=100, per_key_limit=1)
+        started, gates = [], {}
+        job = lambda name: _gated(started, gates, name)
+        queue.submit("guild", job("g1"))
+        queue.submit("guild", job("g2"))
+        await asyncio.sleep(0.01)
+        # g2 is parked; other guilds now hold every free worker, so g3 waits in the queue
+        queue.submit("other", job("o1"))
+        queue.submit("another", job("o2"))
+        queue.submit("guild", job("g3"))
+        await asyncio.sleep(0.01)
+        assert started == ["g1", "o1", "o2"]
+        gates["g1"].set()
+        await asyncio.sleep(0.01)
+        assert started[3:] == ["g2"]
+        for _ in range(3):
+            for gate in list(gates.values()):
+                gate.set()
+            await asyncio.sleep(0.01)
+        assert started[3:] == ["g2", "g3"]
+        stats = queue.stats()
+        assert stats["queued"] == 0 and stats["running"] == 0 and stats["completed"] == 5
+        await queue.stop()
+    asyncio.run(main())
+
+def test_failed_job_still_hands_its_slot_on():
+    async def main():
+        queue = JobQueue("test", workers=2, maxsize=10, per_key_limit=1)
+        done = []
+
+        async def boom():
+            raise RuntimeError("boom")
+
+        async def ok():
+            done.append("ok")
+        queue.submit("guild", boom)
+        queue.submit("guild", ok)
+        await asyncio.sleep(0.01)
+        assert done == ["ok"]
+        assert queue.stats()["failed"] == 1 and queue.stats()["running"] == 0
+        await queue.stop()
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+import asyncio
+import time
+import pytest
+from services.llm_providers import LLMProvider, OpenAICompatibleProvider, ProviderError, ProviderRouter
+from services.rate_limiter import Slot
+
+class SlowStream(LLMProvider):
+    name = "slow"
+
+    async def complete(self, messages, max_tokens, temperature, user_id):
+        return "done"
+
+    async def stream(self, messages, max_tokens, temperature, user_id):
+        for word in ("one ", "two ", "three "):
+            yield word
+            await asyncio.sleep(0.05)
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+def _half_open(router):
+    breaker = router.health["slow"].breaker
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout - 1
+    assert breaker.state == "half_open" and breaker.allows()
+    return breaker
+
+def test_closing_a_half_open_trial_stream_frees_the_trial():
+    async def run():
+        router = ProviderRouter([SlowStream()])
+        breaker = _half_open(router)
+        stream = router.stream(MESSAGES, 10, 0.7, "user")
+        assert await stream.__anext__() == "one "
+        assert not breaker.allows()
+        await stream.aclose()
+        assert breaker.allows()
+        assert router.ranked()
+    asyncio.run(run())
+
+def test_cancelling_a_half_open_trial_stream_frees_the_trial():
+    async def consume(router):
+        async for _ in router.stream(MESSAGES, 10, 0.7, "user"):
+            pass
+
+    async def run():
+        router = ProviderRouter([SlowStream()])
+        breaker = _half_open(router)
+        task = asyncio.create_task(consume(router))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert breaker.allows()
+        assert await router.complete(MESSAGES, 10, 0.7, "user") == "done"
+    asyncio.run(run())
+
+def test_completed_trial_closes_the_breaker():
+    async def run():
+        router = ProviderRouter([SlowStream()])
+        breaker = _half_open(router)
+        assert "".join([chunk async for chunk in router.stream(MESSAGES, 10, 0.7, "user")]) == "one two three "
+        assert breaker.state == "closed"
+    asyncio.run(run())
+
+def test_provider_without_limiter_gets_an_unlimited_slot():
+    async def run():
+        provider = OpenAICompatibleProvider("test", "http://localhost", "key", "model")
+        async with provider._slot("user", 10, 1.0) as slot:
+            assert isinstance(slot, Slot)
+    asyncio.run(run())
+
+class Scripted(LLMProvider):
+    """Answers after a delay, or fails, and records whether it was cancelled"""
+
+    def __init__(self, name, delay=0.0, fail=False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = False
+
+    async def complete(self, messages, max_tokens, temperature, user_id):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise ProviderError(f"{self.name} down")
+        return f"from {self.name}"
+
+def _router(monkeypatch, *providers, hedge="0"):
+    monkeypatch.setenv("AI_HEDGE_DELAY", hedge)
+    monkeypatch.setenv("AI_BREAKER_FAILURES", "2")
+    return ProviderRouter(list(providers))
+
+def test_failed_provider_fails_over_to_the_next(monkeypatch):
+    router = _router(monkeypatch, Scripted("a", fail=True), Scripted("b"))
+    assert asyncio.run(router.complete(MESSAGES, 10, 0.7, "user")) == "from b"
+    assert router.counters["failovers"] == 1
+    assert router.stats()["providers"]["a"]["error_rate"] == 1.0
+
+def test_slow_primary_is_hedged_and_the_loser_cancelled(monkeypatch):
+    slow, fast = Scripted("slow", delay=1.0), Scripted("fast", delay=0.01)
+    router = _router(monkeypatch, slow, fast, hedge="0.02")
+    started = time.monotonic()
+    assert asyncio.run(router.complete(MESSAGES, 10, 0.7, "user")) == "from fast"
+    assert time.monotonic() - started < 0.5
+    assert router.counters["hedged"] == 1 and router.counters["hedge_wins"] == 1
+    assert slow.cancelled
+    # A cancelled hedge loser doesn't count against its provider
+    assert router.health["slow"].breaker.state == "closed" and router.health["slow"].error_rate == 0
+
+def test_open_breaker_takes_the_provider_out_of_rotation(monkeypatch):
+    broken, backup = Scripted("broken", fail=True), Scripted("backup")
+    router = _router(monkeypatch, broken, backup)
+    breaker = router.health["broken"].breaker
+    for _ in range(2):
+        router.health["broken"].record(0.1, ok=False)
+    assert breaker.state == "open"
+    assert [p.name for p in router.ranked()] == ["backup"]
+    assert asyncio.run(router.complete(MESSAGES, 10, 0.7, "user")) == "from backup"
+    assert broken.calls == 0
+    # After the reset timeout one trial goes through, and failing it reopens the breaker
+    breaker.opened_at -= breaker.reset_timeout
+    router.health["backup"].record(10.0, ok=True)
+    assert [p.name for p in router.ranked()] == ["broken", "backup"]
+    assert asyncio.run(router.complete(MESSAGES, 10, 0.7, "user")) == "from backup"
+    assert broken.calls == 1 and breaker.state == "open"
+
+def test_faster_provider_is_ranked_first(monkeypatch):
+    router = _router(monkeypatch, Scripted("a"), Scripted("b"))
+    for _ in range(5):
+        router.health["a"].record(3.0, ok=True)
+        router.health["b"].record(0.5, ok=True)
+    assert [p.name for p in router.ranked()] == ["b", "a"]
+
+def test_every_provider_failing_reports_each_error(monkeypatch):
+    router = _router(monkeypatch, Scripted("a", fail=True), Scripted("b", fail=True))
+    with pytest.raises(ProviderError, match="a: a down; b: b down"):
+        asyncio.run(router.complete(MESSAGES, 10, 0.7, "user"))
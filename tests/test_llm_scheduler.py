@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+from services.llm_scheduler import FairScheduler, LoadShed, TokenQuota, QuotaExceeded
+
+def _scheduler(monkeypatch, **env):
+    defaults = {"LLM_CONCURRENCY": "1", "LLM_MAX_QUEUE": "64", "LLM_SHED_BACKGROUND_AT": "16"}
+    for key, value in {**defaults, **env}.items():
+        monkeypatch.setenv(key, value)
+    return FairScheduler()
+
+async def _admit_in_order(scheduler, requests):
+    """Queue (identity, priority) requests behind a held slot; returns the order they were admitted in"""
+    order = []
+    await scheduler.acquire("holder", "interactive", 1)
+
+    async def run(identity, priority):
+        async with scheduler.slot(identity, priority):
+            order.append((identity, priority))
+            await asyncio.sleep(0)
+    tasks = [asyncio.create_task(run(*request)) for request in requests]
+    await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    return order
+
+def test_identities_take_turns_within_a_class(monkeypatch):
+    scheduler = _scheduler(monkeypatch)
+    requests = [("heavy", "interactive")] * 3 + [("light", "interactive"), ("other", "interactive")]
+    order = asyncio.run(_admit_in_order(scheduler, requests))
+    assert [identity for identity, _ in order] == ["heavy", "light", "other", "heavy", "heavy"]
+
+def test_classes_share_by_weight(monkeypatch):
+    scheduler = _scheduler(monkeypatch, LLM_WEIGHT_INTERACTIVE="3", LLM_WEIGHT_BACKGROUND="1")
+    requests = [("bg", "background")] * 4 + [("user", "interactive")] * 8
+    order = asyncio.run(_admit_in_order(scheduler, requests))
+    priorities = [priority[0] for _, priority in order]
+    # Both classes start level, then get three interactive turns per background turn while both wait
+    assert "".join(priorities[:8]) == "ibiiibii"
+    assert scheduler.stats()["in_flight"] == 0 and scheduler.stats()["waiting"] == {"interactive": 0, "background": 0}
+
+def test_background_is_shed_first_under_load(monkeypatch):
+    scheduler = _scheduler(monkeypatch, LLM_MAX_QUEUE="3", LLM_SHED_BACKGROUND_AT="2")
+
+    async def main():
+        await scheduler.acquire("holder", "interactive", 1)
+        background = asyncio.create_task(scheduler.acquire("bg", "background", 1))
+        waiting = [asyncio.create_task(scheduler.acquire(f"u{i}", "interactive", 1)) for i in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(LoadShed):
+            await scheduler.acquire("bg2", "background", 1)
+        # A full queue evicts the queued background request for an interactive one
+        late = asyncio.create_task(scheduler.acquire("u2", "interactive", 1))
+        await asyncio.sleep(0)
+        with pytest.raises(LoadShed):
+            await background
+        with pytest.raises(LoadShed):
+            await scheduler.acquire("u3", "interactive", 1)
+        for _ in range(4):
+            scheduler.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*waiting, late)
+        assert scheduler.stats()["shed_background"] == 2 and scheduler.stats()["shed_interactive"] == 1
+    asyncio.run(main())
+
+def test_cancelled_and_timed_out_waiters_leave_no_trace(monkeypatch):
+    scheduler = _scheduler(monkeypatch, LLM_MAX_WAIT_INTERACTIVE="0.01")
+
+    async def main():
+        await scheduler.acquire("holder", "interactive", 1)
+        cancelled = asyncio.create_task(scheduler.acquire("a", "interactive", 1))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        with pytest.raises(LoadShed):
+            await scheduler.acquire("b", "interactive", 1)
+        scheduler.release()
+        assert scheduler.stats()["in_flight"] == 0 and scheduler.stats()["identities_waiting"] == 0
+        assert scheduler.stats()["timed_out"] == 1
+    asyncio.run(main())
+
+def test_quota_blocks_once_a_window_is_used_up(monkeypatch):
+    monkeypatch.setenv("QUOTA_TOKENS_PER_HOUR", "100")
+    monkeypatch.setenv("QUOTA_TOKENS_PER_DAY", "0")
+    quota = TokenQuota()
+
+    async def main():
+        await quota.check("web:a")
+        await quota.charge("web:a", 100)
+        with pytest.raises(QuotaExceeded) as exceeded:
+            await quota.check("web:a")
+        assert exceeded.value.retry_after >= 1
+        await quota.check("web:b")
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+import json
+from fastapi.testclient import TestClient
+import main
+
+class FakeAI:
+    def __init__(self, chunks, fail=None):
+        self.chunks = chunks
+        self.fail = fail
+        self.calls = []
+
+    def is_available(self):
+        return True
+
+    async def stream(self, message, conversation_id=None, user_id=None, channel=None):
+        self.calls.append((message, conversation_id, user_id, channel))
+        for chunk in self.chunks:
+            yield chunk
+        if self.fail:
+            raise self.fail
+
+class FakeRouter:
+    def __init__(self, reply=None):
+        self.reply = reply
+
+    async def handle(self, message, platform):
+        return self.reply
+
+def _client(monkeypatch, ai, router=None):
+    services = {"ai": ai, "router": router or FakeRouter()}
+    monkeypatch.setattr(main.registry, "get", services.__getitem__)
+    return TestClient(main.app)
+
+def _events(response):
+    """(event, data) for each Server-Sent Event in a response"""
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+def test_stream_relays_tokens_then_done(monkeypatch):
+    ai = FakeAI(["Hel", "lo"])
+    response = _client(monkeypatch, ai).post("/chat/stream", json={"message": "hi", "session_id": "s1"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    assert _events(response) == [("message", {"token": "Hel"}), ("message", {"token": "lo"}),
+                                 ("done", {"done": True})]
+    assert ai.calls == [("hi", "web:s1", "web:s1", "web")]
+
+def test_routed_message_streams_as_one_token(monkeypatch):
+    ai = FakeAI(["unused"])
+    response = _client(monkeypatch, ai, FakeRouter("Reminder set for 5m")).post(
+        "/chat/stream", json={"message": "remind me in 5m to stretch"})
+    assert _events(response) == [("message", {"token": "Reminder set for 5m"}), ("done", {"done": True})]
+    assert ai.calls == []
+
+def test_upstream_failure_mid_stream_ends_with_an_error_event(monkeypatch):
+    response = _client(monkeypatch, FakeAI(["partial"], fail=RuntimeError("upstream hung up"))).post(
+        "/chat/stream", json={"message": "hi"})
+    assert _events(response) == [("message", {"token": "partial"}), ("error", {"error": "upstream hung up"})]
+
+def test_empty_message_is_not_streamed(monkeypatch):
+    response = _client(monkeypatch, FakeAI([])).post("/chat/stream", json={"message": ""})
+    assert response.json() == {"error": "No message provided"}
@@ -0,0 +1,76 @@
+import pytest
+from services.metrics import Counter, Histogram, Metrics, parse_traceparent
+
+def _metrics(monkeypatch, **env):
+    for key, value in {"TRACE_SAMPLE_RATE": "0", "TRACE_PROPAGATE": "true", **env}.items():
+        monkeypatch.setenv(key, value)
+    return Metrics()
+
+def test_counter_and_histogram_render_in_prometheus_format():
+    counter = Counter("jobs_total", "Jobs", ("kind",))
+    counter.inc(kind="a")
+    counter.inc(2, kind='say "hi"')
+    assert counter.render() == [
+        "# HELP jobs_total Jobs", "# TYPE jobs_total counter",
+        'jobs_total{kind="a"} 1.0', 'jobs_total{kind="say \\"hi\\""} 2.0',
+    ]
+    histogram = Histogram("wait_seconds", "Wait", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.render()[2:] == [
+        'wait_seconds_bucket{le="0.1"} 2', 'wait_seconds_bucket{le="1.0"} 3', 'wait_seconds_bucket{le="+Inf"} 4',
+        "wait_seconds_sum 3.65", "wait_seconds_count 4",
+    ]
+
+def test_request_counts_errors_and_in_flight(monkeypatch):
+    metrics = _metrics(monkeypatch)
+    with metrics.request("web"):
+        assert metrics.in_flight.values[("web",)] == 1
+    with pytest.raises(ValueError):
+        with metrics.request("web"):
+            raise ValueError("boom")
+    assert metrics.requests.values[("web",)] == 2
+    assert metrics.errors.values[("web",)] == 1
+    assert metrics.in_flight.values[("web",)] == 0
+    assert "assistant_request_seconds_count{channel=\"web\"} 2" in metrics.render()
+
+def test_unsampled_requests_build_no_trace(monkeypatch):
+    metrics = _metrics(monkeypatch)
+    with metrics.request("web"):
+        with metrics.stage("llm", "ai"):
+            assert metrics.traceparent() is None
+    assert not metrics.traces
+    assert sum(metrics.stages.values[("llm", "ai")][0]) == 1
+
+def test_sampled_incoming_traceparent_continues_the_trace(monkeypatch):
+    metrics = _metrics(monkeypatch)
+    incoming = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+    with metrics.request("whatsapp", incoming):
+        with metrics.stage("llm", "ai"):
+            outgoing = parse_traceparent(metrics.traceparent())
+    trace = metrics.traces[-1]
+    assert trace["trace_id"] == "a" * 32 and trace["parent_id"] == "b" * 16
+    [child] = trace["children"]
+    assert child["name"] == "llm" and child["parent_id"] == trace["span_id"]
+    # Outbound calls made inside the stage carry the stage as their parent
+    assert outgoing == ("a" * 32, child["span_id"], True)
+
+def test_unsampled_incoming_traceparent_is_not_traced(monkeypatch):
+    metrics = _metrics(monkeypatch, TRACE_SAMPLE_RATE="1")
+    with metrics.request("web", "00-" + "a" * 32 + "-" + "b" * 16 + "-00"):
+        pass
+    assert not metrics.traces
+    with metrics.request("web"):
+        pass
+    assert len(metrics.traces) == 1
+
+def test_propagation_can_be_turned_off(monkeypatch):
+    metrics = _metrics(monkeypatch, TRACE_SAMPLE_RATE="1", TRACE_PROPAGATE="false")
+    with metrics.request("web"):
+        assert metrics.traceparent() is None
+    assert len(metrics.traces) == 1
+
+def test_malformed_traceparent_is_ignored():
+    assert parse_traceparent(None) is None
+    assert parse_traceparent("00-short-span-01") is None
+    assert parse_traceparent("00-" + "a" * 32 + "-" + "b" * 16) is None
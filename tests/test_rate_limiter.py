@@ -0,0 +1,102 @@
+import asyncio
+import time
+import pytest
+from services.rate_limiter import AdaptiveConcurrency, RateLimitExceeded, TokenBucket, UpstreamLimiter
+
+def test_bucket_refills_at_its_rate_up_to_capacity(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=2, capacity=4)
+    bucket.consume(4)
+    assert bucket.time_until(1) == pytest.approx(0.5)
+    now[0] += 1
+    assert bucket.time_until(2) == 0
+    now[0] += 60
+    bucket._refill()
+    assert bucket.tokens == 4
+    bucket.consume(3)
+    bucket.refund(10)
+    assert bucket.tokens == 4
+
+def test_concurrency_grows_additively_and_backs_off_multiplicatively():
+    concurrency = AdaptiveConcurrency(initial=4, minimum=1, maximum=5, latency_target=1.0)
+    for _ in range(4):
+        concurrency.on_success(0.1)
+    assert concurrency.limit == pytest.approx(5.0, abs=0.1)
+    for _ in range(20):
+        concurrency.on_success(0.1)
+    assert concurrency.limit == 5
+    concurrency.on_overload()
+    assert concurrency.limit == 2.5
+    concurrency.on_success(2.0)
+    assert concurrency.limit == pytest.approx(2.25)
+    for _ in range(10):
+        concurrency.on_overload()
+    assert concurrency.limit == 1
+
+def _limiter(concurrency=2, requests_per_second=1000, tokens_per_minute=10 ** 9):
+    return UpstreamLimiter("test", requests_per_second, tokens_per_minute,
+                           AdaptiveConcurrency(initial=concurrency, maximum=concurrency))
+
+def test_in_flight_requests_stay_under_the_concurrency_limit():
+    limiter = _limiter(concurrency=2)
+    running, peak = [0], [0]
+
+    async def call(user):
+        async with limiter.slot(user, 10, timeout=5) as slot:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+            slot.record(200)
+
+    async def main():
+        await asyncio.gather(*(call(f"u{n % 3}") for n in range(8)))
+    asyncio.run(main())
+    assert peak[0] == 2
+    assert limiter.stats()["admitted"] == 8 and limiter.in_flight == 0
+
+def test_waiting_users_are_admitted_round_robin():
+    limiter = _limiter(concurrency=1)
+    order = []
+
+    async def call(user):
+        async with limiter.slot(user, 1, timeout=5):
+            order.append(user)
+            await asyncio.sleep(0)
+
+    async def main():
+        async with limiter.slot("busy", 1, timeout=5):
+            tasks = [asyncio.create_task(call("busy")) for _ in range(3)]
+            tasks.append(asyncio.create_task(call("quiet")))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+    asyncio.run(main())
+    assert order == ["busy", "quiet", "busy", "busy"]
+
+def test_request_that_cannot_be_admitted_in_time_fails_fast():
+    limiter = _limiter(requests_per_second=1)
+
+    async def main():
+        await limiter.acquire("u", 1, timeout=1)
+        started = time.monotonic()
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire("u", 1, timeout=0.1)
+        assert time.monotonic() - started < 0.05
+    asyncio.run(main())
+    assert limiter.counters["rejected"] == 1
+
+def test_throttled_response_halves_concurrency_and_unused_tokens_are_refunded():
+    limiter = _limiter(concurrency=8, tokens_per_minute=6000)
+
+    async def main():
+        slot = await limiter.acquire("u", 1000, timeout=1)
+        slot.record(429)
+        limiter.release(slot)
+        slot = await limiter.acquire("u", 1000, timeout=1)
+        slot.record(200, tokens_used=100)
+        limiter.release(slot)
+    asyncio.run(main())
+    assert limiter.concurrency.limit == pytest.approx(4 + 1 / 4)
+    assert limiter.counters["throttled"] == 1
+    assert limiter.tokens.tokens == pytest.approx(6000 - 1000 - 100, abs=1)
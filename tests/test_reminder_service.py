@@ -0,0 +1,106 @@
+import asyncio
+import time
+from services.reminder_service import ReminderService
+from services.reminder_store import SQLiteReminderStore
+
+def _service(path, **attrs):
+    service = ReminderService(SQLiteReminderStore(str(path)))
+    for name, value in attrs.items():
+        setattr(service, name, value)
+    return service
+
+def _stored(service):
+    service.store.flush()
+    return [reminder["id"] for reminder in service.store.load_pending()]
+
+def test_reminder_stays_stored_until_delivered(tmp_path):
+    async def main():
+        service = _service(tmp_path / "r.db")
+        delivered = []
+        reminder_id = service.schedule_reminder("1m", "stretch", "discord", "42")
+        (due,) = service.pop_due(now=time.time() + 120)
+        # Popped for delivery: off the schedule, still in the store
+        assert not service.reminders and _stored(service) == [reminder_id]
+        service.register_delivery("discord", delivered.append)
+        await service._deliver(due)
+        assert [r["id"] for r in delivered] == [reminder_id]
+        assert _stored(service) == []
+    asyncio.run(main())
+
+def test_crash_mid_delivery_redelivers_on_recovery(tmp_path):
+    async def main():
+        first = _service(tmp_path / "r.db")
+        reminder_id = first.schedule_reminder("1m", "stretch", "discord", "42")
+        first.store.flush()
+        assert [r["id"] for r in first.pop_due(now=time.time() + 120)] == [reminder_id]
+        # The process dies before delivering; the next leader picks it up
+        second = _service(tmp_path / "r.db")
+        assert await second.recover() == 1
+        assert list(second.reminders) == [reminder_id]
+    asyncio.run(main())
+
+def test_failed_delivery_is_retried_with_backoff_then_dropped(tmp_path):
+    async def main():
+        service = _service(tmp_path / "r.db", max_attempts=2, retry_delay=60)
+        calls = []
+
+        def deliver(reminder):
+            calls.append(reminder["id"])
+            raise RuntimeError("discord is down")
+        service.register_delivery("discord", deliver)
+        reminder_id = service.schedule_reminder("1m", "stretch", "discord", "42")
+
+        await service._deliver(service.pop_due(now=time.time() + 120)[0])
+        retry = service.reminders[reminder_id]
+        assert retry["attempts"] == 1 and retry["due"] > time.time() + 50
+        assert _stored(service) == [reminder_id]
+
+        await service._deliver(service.pop_due(now=retry["due"])[0])
+        assert calls == [reminder_id, reminder_id]
+        assert not service.reminders and _stored(service) == []
+    asyncio.run(main())
+
+def test_sync_does_not_resurrect_a_reminder_being_delivered(tmp_path):
+    async def main():
+        service = _service(tmp_path / "r.db", sync_interval=0.01)
+        reminder_id = service.schedule_reminder("1m", "stretch", "discord", "42")
+        await service.start(dispatch=False, shared=True)
+        service.pop_due(now=time.time() + 120)
+        await asyncio.sleep(0.05)
+        assert reminder_id not in service.reminders
+        await service.stop()
+    asyncio.run(main())
+
+def test_channel_that_cant_send_keeps_the_reminder_for_a_retry(tmp_path, monkeypatch):
+    from services.whatsapp_service import WhatsAppService
+    for key in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+        monkeypatch.delenv(key, raising=False)
+
+    async def main():
+        service = _service(tmp_path / "r.db", retry_delay=60)
+        WhatsAppService(None, None, None, service, intent_router=object())
+        reminder_id = service.schedule_reminder("1m", "stretch", "whatsapp", "whatsapp:+1")
+        await service._deliver(service.pop_due(now=time.time() + 120)[0])
+        assert service.reminders[reminder_id]["attempts"] == 1
+        assert _stored(service) == [reminder_id]
+    asyncio.run(main())
+
+def test_idle_sync_skips_the_reload_until_another_worker_writes(tmp_path):
+    async def main():
+        path = tmp_path / "r.db"
+        writer = _service(path)
+        follower = _service(path, sync_interval=0.01)
+        await follower.start(dispatch=False, shared=True)
+        await asyncio.sleep(0.1)
+        assert follower.sync_counters["reloads"] == 1 and follower.sync_counters["skipped"] > 3
+        reminder_id = writer.schedule_reminder("1m", "stretch", "discord", "42")
+        writer.store.flush()
+        await asyncio.sleep(0.05)
+        assert list(follower.reminders) == [reminder_id]
+        assert follower.sync_counters["reloads"] == 2
+        writer.cancel_reminder(reminder_id)
+        writer.store.flush()
+        await asyncio.sleep(0.05)
+        assert not follower.reminders
+        await follower.stop()
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import pytest
+from services.service_registry import LazyService, ServiceRegistry
+
+built = []
+
+class Store:
+    def __init__(self):
+        built.append("store")
+        self.stopped = False
+        self.greeting = "hello"
+
+    def stop(self):
+        self.stopped = True
+
+class Mailer:
+    def __init__(self):
+        built.append("mailer")
+        self.sent = []
+
+    async def stop(self):
+        raise RuntimeError("already closed")
+
+class Router:
+    def __init__(self, store, mailer):
+        built.append("router")
+        self.store = store
+        self.mailer = mailer
+
+def _registry(monkeypatch, **env):
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    built.clear()
+    registry = ServiceRegistry()
+    registry.register("store", f"{__name__}:Store")
+    registry.register("mailer", f"{__name__}:Mailer", lazy=True)
+    registry.register("router", f"{__name__}:Router", "store", "mailer")
+    return registry
+
+def test_services_are_built_once_on_first_use(monkeypatch):
+    registry = _registry(monkeypatch)
+    assert built == [] and registry.stats()["not_built"] == ["store", "mailer", "router"]
+    router = registry.get("router")
+    assert registry.get("router") is router and router.store is registry.get("store")
+    assert built == ["store", "router"]
+    assert list(registry.instances()) == ["store", "router"]
+
+def test_lazy_dependency_is_built_on_first_attribute_access(monkeypatch):
+    registry = _registry(monkeypatch)
+    router = registry.get("router")
+    assert isinstance(router.mailer, LazyService) and not registry.built("mailer")
+    assert router.mailer.sent == []
+    assert registry.built("mailer") and built == ["store", "router", "mailer"]
+    router.mailer.sent = ["x"]
+    assert registry.get("mailer").sent == ["x"]
+
+def test_circular_dependencies_are_reported(monkeypatch):
+    registry = _registry(monkeypatch)
+    registry.register("a", f"{__name__}:Router", "b", "store")
+    registry.register("b", f"{__name__}:Router", "a", "store")
+    with pytest.raises(RuntimeError, match="a -> b -> a"):
+        registry.get("a")
+    # A failed build leaves the registry usable
+    assert registry.get("store").greeting == "hello"
+
+def test_shutdown_stops_built_services_and_survives_failures(monkeypatch, caplog):
+    registry = _registry(monkeypatch)
+    store = registry.get("store")
+    registry.get("mailer")
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(registry.shutdown())
+    assert store.stopped
+    assert "Error stopping mailer: already closed" in caplog.text
+
+def test_cold_start_over_budget_names_the_slowest_services(monkeypatch, caplog):
+    registry = _registry(monkeypatch, COLD_START_BUDGET_MS="100")
+    registry.get("store")
+    registry.record("import main", 0.2)
+    with caplog.at_level(logging.WARNING):
+        registry.check_budget()
+    assert "budget 100ms" in caplog.text and "slowest: import main 200.0ms" in caplog.text
+    stats = registry.stats()
+    assert stats["cold_start_ms"] >= 200 and set(stats["built"]) == {"import main", "store"}
+    assert set(stats["built"]["store"]) == {"import_ms", "build_ms", "total_ms"}
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from services.singleflight import SingleFlight
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+    assert asyncio.run(main()) == ["answer"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"calls": 1, "coalesced": 4, "in_flight": 0}
+
+def test_later_call_after_completion_runs_again():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        return await flight.do("k", fetch), await flight.do("k", fetch)
+    assert asyncio.run(main()) == (1, 2)
+
+def test_failure_reaches_every_waiter_and_is_not_kept():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+        assert [str(r) for r in results] == ["upstream down"] * 2
+        assert flight.stats()["in_flight"] == 0
+        with pytest.raises(RuntimeError):
+            await flight.do("k", fail)
+    asyncio.run(main())
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def main():
+        first = asyncio.create_task(flight.do("k", fetch))
+        second = asyncio.create_task(flight.do("k", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "answer"
+        assert first.cancelled()
+    asyncio.run(main())
@@ -0,0 +1,24 @@
+import json
+import os
+from services.static_assets import MANIFEST, StaticAssets, build
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(ROOT, "web")
+DIST = os.path.join(SOURCE, "dist")
+
+def test_committed_build_matches_sources():
+    # Deploys serve web/dist as committed; rebuild it with `python -m services.static_assets`
+    manifest, _ = build(SOURCE)
+    with open(os.path.join(DIST, MANIFEST)) as f:
+        committed = json.load(f)
+    assert {name: entry["etag"] for name, entry in committed.items()} == \
+        {name: entry["etag"] for name, entry in manifest.items()}
+
+def test_build_without_sources_is_served_as_is(tmp_path):
+    # How it is deployed: only web/dist is bundled
+    assets = StaticAssets(source_dir=str(tmp_path / "missing"), build_dir=DIST)
+    assert assets.prebuilt
+    status, headers, body = assets.lookup("/", "gzip")
+    assert status == 200 and headers["Content-Encoding"] == "gzip"
+    status, _, _ = assets.lookup("/", "gzip", headers["ETag"])
+    assert status == 304
@@ -0,0 +1,58 @@
+from services.token_budget import TokenBudget, count_message_tokens, count_tokens, split_message
+
+def _budget(monkeypatch, **env):
+    for key in ("DISCORD_MESSAGE_CHARS", "DISCORD_MAX_MESSAGES", "DISCORD_MAX_TOKENS", "WEB_MAX_TOKENS"):
+        monkeypatch.delenv(key, raising=False)
+    for key, value in {"AI_MAX_TOKENS": "500", "AI_CONTEXT_TOKENS": "8192", "AI_MIN_TOKENS": "64",
+                       "TOKEN_CHARS_PER_TOKEN": "4", **env}.items():
+        monkeypatch.setenv(key, value)
+    return TokenBudget()
+
+def test_token_estimate_tracks_word_and_symbol_pieces():
+    assert count_tokens("") == 0
+    assert count_tokens("the cat sat") == 3
+    assert count_tokens("internationalization") == 4
+    assert count_tokens("call 5551234567!") == 1 + 4 + 1
+    assert count_tokens("héllo") > count_tokens("hello")
+    assert count_message_tokens([{"role": "user", "content": "the cat sat"}]) == 3 + 4 + 2
+
+def test_short_text_is_one_message():
+    assert split_message("  Hello there.  ", 100) == ["Hello there."]
+    assert split_message("anything at all", None) == ["anything at all"]
+    assert split_message("   ", 10) == []
+
+def test_long_text_splits_between_sentences():
+    text = "First sentence here. Second one is here. Third!\nA new line."
+    parts = split_message(text, 45)
+    assert parts == ["First sentence here. Second one is here.", "Third!\nA new line."]
+    assert all(len(part) <= 45 for part in parts)
+
+def test_overlong_sentence_breaks_at_spaces_and_only_cuts_unbroken_words():
+    parts = split_message("one two three four five six", 10)
+    assert parts == ["one two", "three four", "five six"]
+    assert split_message("abcdefghijklmnop", 5) == ["abcde", "fghij", "klmno", "p"]
+
+def test_channel_limit_sets_max_tokens_and_instruction(monkeypatch):
+    budget = _budget(monkeypatch)
+    discord = budget.for_channel("discord")
+    assert discord.message_chars == 2000 and discord.max_tokens == 500
+    assert "Discord" in discord.instruction and "2000 characters" in discord.instruction
+    budget = _budget(monkeypatch, DISCORD_MESSAGE_CHARS="400")
+    assert budget.for_channel("discord").max_tokens == 125
+    web = budget.for_channel(None)
+    assert web.message_chars is None and web.max_tokens == 500 and web.instruction == ""
+
+def test_max_tokens_is_clamped_to_the_context_window(monkeypatch):
+    budget = _budget(monkeypatch, AI_CONTEXT_TOKENS="1000")
+    assert budget.max_tokens_for("web", [], prompt_tokens=100) == 500
+    assert budget.max_tokens_for("web", [], prompt_tokens=700) == 300
+    assert budget.max_tokens_for("web", [], prompt_tokens=990) == 64
+    assert budget.counters["clamped"] == 2 and budget.counters["prompt_tokens"] == 1790
+
+def test_reply_beyond_max_messages_ends_in_an_ellipsis(monkeypatch):
+    budget = _budget(monkeypatch, DISCORD_MESSAGE_CHARS="20", DISCORD_MAX_MESSAGES="2")
+    parts = budget.split("discord", "One sentence. Two sentence. Three sentence. Four sentence.")
+    assert len(parts) == 2 and parts[-1].endswith("…")
+    assert all(len(part) <= 20 for part in parts)
+    assert budget.split("web", "x. " * 500) == [("x. " * 500).strip()]
+    assert budget.counters["split"] == 1
@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+from services.delivery_queue import RetryableError
+from services.metrics import metrics
+from services.whatsapp_service import WhatsAppService
+
+class _Reminders:
+    def register_delivery(self, platform, deliver):
+        pass
+
+class _Router:
+    async def handle(self, message, platform, user_id=None):
+        return f"echo: {message}"
+
+def _service(monkeypatch, configured=True):
+    for key in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+        monkeypatch.delenv(key, raising=False)
+    if configured:
+        monkeypatch.setenv("TWILIO_ACCOUNT_SID", "AC1")
+        monkeypatch.setenv("TWILIO_AUTH_TOKEN", "secret")
+    return WhatsAppService(None, None, None, _Reminders(), _Router())
+
+def test_message_is_processed_only_once_the_reply_is_sent(monkeypatch):
+    service = _service(monkeypatch)
+    sent = []
+
+    async def send(to, body):
+        await asyncio.sleep(0.01)
+        sent.append((to, body))
+    service.outbox.send = send
+
+    async def main():
+        await service.process_message({"From": "whatsapp:+1", "Body": "hi"})
+        assert sent == [("whatsapp:+1", "echo: hi")]
+        await service.outbox.stop()
+    asyncio.run(main())
+
+def test_failed_reply_fails_the_event_so_it_is_retried(monkeypatch):
+    service = _service(monkeypatch)
+
+    async def send(to, body):
+        raise RuntimeError("Twilio error: 400")
+    service.outbox.send = send
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await service.process_message({"From": "whatsapp:+1", "Body": "hi"})
+        await service.outbox.stop()
+    asyncio.run(main())
+
+def test_unconfigured_twilio_fails_before_answering(monkeypatch):
+    service = _service(monkeypatch, configured=False)
+    errors = metrics.errors.values.get(("whatsapp",), 0)
+    with pytest.raises(RetryableError):
+        asyncio.run(service.process_message({"From": "whatsapp:+1", "Body": "hi"}))
+    # Counted once, by the request context
+    assert metrics.errors.values.get(("whatsapp",), 0) == errors + 1
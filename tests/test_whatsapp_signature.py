@@ -0,0 +1,32 @@
+import base64
+import hashlib
+import hmac
+from services.whatsapp_service import WhatsAppService
+
+URL = "https://example.com/whatsapp/webhook"
+PARAMS = {"From": "whatsapp:+15550000000", "Body": "hi", "MessageSid": "SM1"}
+
+def _sign(token, url, params):
+    signed = url + "".join(key + params[key] for key in sorted(params))
+    return base64.b64encode(hmac.new(token.encode(), signed.encode(), hashlib.sha1).digest()).decode()
+
+class _Reminders:
+    def register_delivery(self, platform, deliver):
+        pass
+
+def _service(monkeypatch, **env):
+    for key in ("TWILIO_AUTH_TOKEN", "TWILIO_SKIP_SIGNATURE"):
+        monkeypatch.delenv(key, raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    return WhatsAppService(None, None, None, _Reminders())
+
+def test_valid_signature_is_accepted(monkeypatch):
+    service = _service(monkeypatch, TWILIO_AUTH_TOKEN="secret")
+    assert service.verify_signature(URL, PARAMS, _sign("secret", URL, PARAMS))
+    assert not service.verify_signature(URL, PARAMS, _sign("other", URL, PARAMS))
+    assert not service.verify_signature(URL, PARAMS, None)
+
+def test_missing_token_rejects_unless_opted_out(monkeypatch):
+    assert not _service(monkeypatch).verify_signature(URL, PARAMS, None)
+    assert _service(monkeypatch, TWILIO_SKIP_SIGNATURE="true").verify_signature(URL, PARAMS, None)
@@ -0,0 +1,133 @@
+const chatContainer = document.getElementById('chatContainer');
+const messageInput = document.getElementById('messageInput');
+const sendButton = document.getElementById('sendButton');
+const sessionId = localStorage.getItem('sessionId') ||
+    (Date.now().toString(36) + Math.random().toString(36).slice(2));
+localStorage.setItem('sessionId', sessionId);
+
+function addMessage(content, isUser) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${isUser ? 'user' : 'assistant'}`;
+    messageDiv.innerHTML = `<div class="message-content">${content}</div>`;
+    chatContainer.appendChild(messageDiv);
+    chatContainer.scrollTop = chatContainer.scrollHeight;
+}
+
+function showTyping() {
+    const typingDiv = document.createElement('div');
+    typingDiv.className = 'message assistant';
+    typingDiv.innerHTML = '<div class="typing-indicator active"><span></span><span></span><span></span></div>';
+    typingDiv.id = 'typingIndicator';
+    chatContainer.appendChild(typingDiv);
+    chatContainer.scrollTop = chatContainer.scrollHeight;
+}
+
+function hideTyping() {
+    const typingDiv = document.getElementById('typingIndicator');
+    if (typingDiv) typingDiv.remove();
+}
+
+function addStreamingMessage() {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message assistant';
+    const contentDiv = document.createElement('div');
+    contentDiv.className = 'message-content';
+    messageDiv.appendChild(contentDiv);
+    chatContainer.appendChild(messageDiv);
+    return contentDiv;
+}
+
+async function sendBuffered(message) {
+    const response = await fetch('/chat', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ message: message, session_id: sessionId })
+    });
+
+    const data = await response.json();
+    hideTyping();
+
+    if (data.response) {
+        addMessage(data.response, false);
+    } else if (data.error) {
+        addMessage('Sorry, I encountered an error: ' + data.error, false);
+    }
+}
+
+async function sendStreaming(message) {
+    const response = await fetch('/chat/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ message: message, session_id: sessionId })
+    });
+
+    // Validation errors come back as plain JSON
+    if (!(response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+        const data = await response.json();
+        hideTyping();
+        addMessage('Sorry, I encountered an error: ' + data.error, false);
+        return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let contentDiv = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const event of events) {
+            const dataLine = event.split('\n').find(line => line.startsWith('data:'));
+            if (!dataLine) continue;
+            const data = JSON.parse(dataLine.slice(5));
+
+            if (data.token) {
+                if (!contentDiv) {
+                    hideTyping();
+                    contentDiv = addStreamingMessage();
+                }
+                contentDiv.textContent += data.token;
+                chatContainer.scrollTop = chatContainer.scrollHeight;
+            } else if (data.error) {
+                hideTyping();
+                addMessage('Sorry, I encountered an error: ' + data.error, false);
+            }
+        }
+    }
+    hideTyping();
+}
+
+async function sendMessage() {
+    const message = messageInput.value.trim();
+    if (!message) return;
+
+    addMessage(message, true);
+    messageInput.value = '';
+    sendButton.disabled = true;
+    showTyping();
+
+    try {
+        if (window.ReadableStream && window.TextDecoder) {
+            await sendStreaming(message);
+        } else {
+            await sendBuffered(message);
+        }
+    } catch (error) {
+        hideTyping();
+        addMessage('Sorry, I could not connect to the server.', false);
+    } finally {
+        sendButton.disabled = false;
+        messageInput.focus();
+    }
+}
+
+sendButton.addEventListener('click', sendMessage);
+messageInput.addEventListener('keypress', (e) => {
+    if (e.key === 'Enter') sendMessage();
+});
+messageInput.focus();